@@ -9,16 +9,22 @@ Authors:
 """
 
 import sys
+from typing import Dict, Optional
+from db_backends import create_backend
 from db_operations import DatabaseOperations
+from fare_estimator import estimate
 from helper import Helper
 
 
 class RideshareApp:
     """Main application class for the rideshare management system."""
     
-    def __init__(self):
-        """Initialize the application with database connection."""
-        self.db_ops = DatabaseOperations()
+    def __init__(self, backend: str = None):
+        """Initialize the application with database connection.
+        
+        backend is "mysql" or "sqlite"; defaults to RIDESHARE_DB_BACKEND (or MySQL).
+        """
+        self.db_ops = DatabaseOperations(backend=create_backend(backend))
         self.helper = Helper()
         
         if not self.db_ops.connect():
@@ -86,47 +92,58 @@ class RideshareApp:
             print("Invalid phone number format.")
             return
         
-        # Create user account
-        user_id = self.db_ops.create_user(username, password, email, phone_number, full_name)
+        # Collect the profile before writing anything, so the account and
+        # profile are created in one transaction without waiting on input
+        if choice == "1":
+            kind = "rider"
+            profile = self.prompt_rider_profile()
+        else:
+            kind = "driver"
+            profile = self.prompt_driver_profile()
+        if profile is None:
+            return
+        
+        with self.db_ops.transaction() as unit:
+            user_id = self.db_ops.create_user(username, password, email, phone_number, full_name)
+            profile_id = None
+            if user_id:
+                create_profile = self.db_ops.create_rider if kind == "rider" else self.db_ops.create_driver
+                profile_id = create_profile(user_id, **profile)
+            if not profile_id:
+                unit.failed = True
         
         if not user_id:
             print("Failed to create user account.")
             return
+        if not profile_id:
+            print(f"Failed to create {kind} profile.")
+            return
         
-        print("\nUser account created successfully!")
-        
-        # Create rider or driver profile
-        if choice == "1":
-            self.create_rider_profile(user_id)
-        else:
-            self.create_driver_profile(user_id)
+        print(f"\nUser account and {kind} profile created successfully!")
+        print(f"\nYou can now log in as a {kind}.")
     
-    def create_rider_profile(self, user_id: int):
-        """Create a rider profile for a new user."""
-        print("\nCreating rider profile...")
-        
-        payment_info = input("Enter payment information (optional): ").strip() or None
-        preferred_payment = input("Enter preferred payment method (optional): ").strip() or None
-        credit_card_last4 = input("Enter last 4 digits of credit card (optional): ").strip() or None
-        default_location = input("Enter default location (optional): ").strip() or None
-        
-        rider_id = self.db_ops.create_rider(user_id, payment_info, preferred_payment,
-                                           credit_card_last4, default_location)
-        
-        if rider_id:
-            print("Rider profile created successfully!")
-            print("\nYou can now log in as a rider.")
-        else:
-            print("Failed to create rider profile.")
+    def prompt_rider_profile(self) -> Optional[Dict]:
+        """Ask for a new rider's profile details (create_rider() arguments)."""
+        print("\nRider profile details...")
+        
+        return {
+            'payment_info': input("Enter payment information (optional): ").strip() or None,
+            'preferred_payment': input("Enter preferred payment method (optional): ").strip() or None,
+            'credit_card_last4': input("Enter last 4 digits of credit card (optional): ").strip() or None,
+            'default_location': input("Enter default location (optional): ").strip() or None,
+        }
     
-    def create_driver_profile(self, user_id: int):
-        """Create a driver profile for a new user."""
-        print("\nCreating driver profile...")
+    def prompt_driver_profile(self) -> Optional[Dict]:
+        """Ask for a new driver's profile details (create_driver() arguments).
+        
+        Returns None when a required field is missing or invalid.
+        """
+        print("\nDriver profile details...")
         
         license_number = input("Enter license number: ").strip()
         if not license_number:
             print("License number is required.")
-            return
+            return None
         
         license_expiry = input("Enter license expiry date (YYYY-MM-DD, optional): ").strip() or None
         vehicle_make = input("Enter vehicle make (optional): ").strip() or None
@@ -139,21 +156,18 @@ class RideshareApp:
                 vehicle_year = int(vehicle_year_input)
             except ValueError:
                 print("Invalid year format.")
-                return
-        
-        vehicle_color = input("Enter vehicle color (optional): ").strip() or None
-        license_plate = input("Enter license plate (optional): ").strip() or None
-        insurance_number = input("Enter insurance number (optional): ").strip() or None
-        
-        driver_id = self.db_ops.create_driver(user_id, license_number, license_expiry,
-                                             vehicle_make, vehicle_model, vehicle_year,
-                                             vehicle_color, license_plate, insurance_number)
-        
-        if driver_id:
-            print("Driver profile created successfully!")
-            print("\nYou can now log in as a driver.")
-        else:
-            print("Failed to create driver profile.")
+                return None
+        
+        return {
+            'license_number': license_number,
+            'license_expiry': license_expiry,
+            'vehicle_make': vehicle_make,
+            'vehicle_model': vehicle_model,
+            'vehicle_year': vehicle_year,
+            'vehicle_color': input("Enter vehicle color (optional): ").strip() or None,
+            'license_plate': input("Enter license plate (optional): ").strip() or None,
+            'insurance_number': input("Enter insurance number (optional): ").strip() or None,
+        }
     
     def handle_rider_login(self):
         """Handle rider login."""
@@ -263,11 +277,32 @@ class RideshareApp:
                     if ride:
                         self.helper.display_section("Ride Details")
                         self.helper.display_ride_details(ride)
+                        self.driver_update_ride_status(ride)
                     else:
                         print("Ride not found.")
                 except ValueError:
                     print("Invalid ride ID.")
     
+    def driver_update_ride_status(self, ride: dict):
+        """Offer the status changes allowed for an open ride."""
+        transitions = {
+            'pending': ('in_progress', 'cancelled'),
+            'in_progress': ('completed', 'cancelled'),
+        }
+        allowed = transitions.get(ride['ride_status'])
+        if not allowed:
+            return
+        
+        new_status = input(f"\nUpdate status ({'/'.join(allowed)}, or press Enter to skip): ").strip().lower()
+        if not new_status:
+            return
+        if new_status not in allowed:
+            print("Invalid status.")
+        elif self.db_ops.update_ride_status(ride['ride_id'], new_status):
+            print(f"Ride marked {new_status.replace('_', ' ')}.")
+        else:
+            print("Failed to update ride status.")
+    
     def driver_toggle_mode(self):
         """Toggle driver mode between active and inactive."""
         self.helper.display_section("Driver Mode")
@@ -280,6 +315,10 @@ class RideshareApp:
         if self.helper.get_user_confirmation(f"Switch to {new_mode.upper()} mode?"):
             if self.db_ops.toggle_driver_mode(self.current_profile['driver_id']):
                 print(f"\nDriver mode changed to {new_mode.upper()}.")
+                if new_mode == 'active':
+                    coords = self.prompt_coordinates("Enter your current location as lat,lon (optional): ")
+                    if coords:
+                        self.db_ops.update_driver_location(self.current_profile['driver_id'], *coords)
                 # Refresh driver profile
                 self.current_profile = self.db_ops.get_driver_by_id(self.current_profile['driver_id'])
             else:
@@ -344,8 +383,13 @@ class RideshareApp:
         """Find an available driver and create a ride."""
         self.helper.display_section("Find a Driver")
         
-        # Find an active driver
-        driver = self.db_ops.get_active_driver()
+        pickup_coords = self.prompt_coordinates("Enter pickup coordinates as lat,lon (optional): ")
+        
+        # Find the closest active driver (any active driver without coordinates)
+        if pickup_coords:
+            driver = self.db_ops.get_nearest_active_driver(*pickup_coords)
+        else:
+            driver = self.db_ops.get_active_driver()
         
         if not driver:
             print("No active drivers available at the moment.")
@@ -353,6 +397,8 @@ class RideshareApp:
             return
         
         print(f"\nFound driver: {driver.get('vehicle_make', 'N/A')} {driver.get('vehicle_model', 'N/A')}")
+        if driver.get('distance_km') is not None:
+            print(f"Distance to pickup: {driver['distance_km']:.2f} km")
         
         # Get pickup and dropoff locations
         pickup_location = input("\nEnter pickup location: ").strip()
@@ -368,33 +414,56 @@ class RideshareApp:
             return
         
         dropoff_address = input("Enter dropoff address (optional): ").strip() or None
+        dropoff_coords = self.prompt_coordinates("Enter dropoff coordinates as lat,lon (optional): ")
         
-        fare_input = input("Enter fare amount (optional): ").strip()
         fare_amount = None
-        if fare_input:
-            try:
-                fare_amount = float(fare_input)
-            except ValueError:
-                print("Invalid fare amount. Proceeding without fare.")
+        trip = estimate(*(pickup_coords or (None, None)), *(dropoff_coords or (None, None)),
+                        self.db_ops.rate_card)
+        if trip:
+            print(f"Estimated trip: {trip['distance_miles']:.2f} miles, "
+                  f"{trip['duration_minutes']} min, fare ${trip['fare_amount']:.2f}")
+        else:
+            fare_input = input("Enter fare amount (optional): ").strip()
+            if fare_input:
+                try:
+                    fare_amount = float(fare_input)
+                except ValueError:
+                    print("Invalid fare amount. Proceeding without fare.")
         
-        # Create ride
-        ride_id = self.db_ops.create_ride(
-            driver['driver_id'],
+        # Claim the driver and create the ride atomically; if the driver shown
+        # above was taken in the meantime, the next closest one is assigned
+        dispatched = self.db_ops.dispatch_ride(
             self.current_profile['rider_id'],
             pickup_location,
             dropoff_location,
             pickup_address,
             dropoff_address,
-            fare_amount
+            fare_amount,
+            *(pickup_coords or (None, None)),
+            *(dropoff_coords or (None, None)),
+            preferred_driver_id=driver['driver_id']
         )
         
-        if ride_id:
+        if dispatched:
+            ride_id, _ = dispatched
             print("\nRide created successfully!")
             ride = self.db_ops.get_ride_by_id(ride_id)
             if ride:
                 self.helper.display_ride_details(ride)
         else:
-            print("Failed to create ride.")
+            print("No active drivers available at the moment. Failed to create ride.")
+    
+    def prompt_coordinates(self, message: str):
+        """Prompt for an optional "lat,lon" pair; returns (lat, lon) or None."""
+        while True:
+            value = input(message).strip()
+            if not value:
+                return None
+            parts = value.split(',')
+            coords = self.helper.validate_coordinates(*parts) if len(parts) == 2 else None
+            if coords:
+                return coords
+            print("Invalid coordinates. Use the form 34.0522,-118.2437 or press Enter to skip.")
     
     def rider_rate_driver(self):
         """Allow rider to rate their driver for a ride."""
@@ -503,7 +572,8 @@ class RideshareApp:
 def main():
     """Main entry point of the application."""
     try:
-        app = RideshareApp()
+        # Optional first argument selects the backend: python app.py sqlite
+        app = RideshareApp(sys.argv[1] if len(sys.argv) > 1 else None)
         app.run()
     except KeyboardInterrupt:
         print("\n\nApplication interrupted by user.")
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - ASGI Entry Point
+Serves the rideshare app from an ASGI server such as uvicorn:
+
+    uvicorn asgi_app:app --port 8080
+
+The rider and driver JSON API below (/api/...) and the /events stream run
+natively on asyncio on top of AsyncDatabaseOperations and the ride event hub,
+so long-waiting requests (ride status polling, live updates, batch dispatch
+waits) do not hold an OS thread. Every other path, including
+the HTML pages, is handed to the Flask app in web_app.py on a separate page
+worker pool, so slow pages can't take the threads the API needs. Sessions are
+shared: log in through the web pages, then call the API with the same cookie.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import asyncio
+import functools
+import io
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+import web_app
+from async_db_operations import AsyncDatabaseOperations
+from ride_events import SSE_KEEPALIVE_SECONDS, driver_topic, format_sse, ride_topic, rider_topic
+
+logger = logging.getLogger(__name__)
+
+# Longest a ride poll may wait for a status change
+LONG_POLL_MAX = 30.0
+
+# Threads running Flask pages, apart from the database workers behind the JSON API
+PAGE_WORKERS = int(os.environ.get('RIDESHARE_PAGE_WORKERS', '16'))
+
+# Fields of the assigned driver returned to a rider
+PUBLIC_DRIVER_FIELDS = ('driver_id', 'full_name', 'vehicle_make', 'vehicle_model',
+                        'vehicle_color', 'license_plate', 'current_latitude', 'current_longitude')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class Request:
+    """The parts of an ASGI HTTP request the API handlers need."""
+
+    def __init__(self, scope: Dict, body: bytes):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+        self.headers = {}
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            self.headers[name] = f"{self.headers[name]},{value}" if name in self.headers else value
+        self.query = {key: values[-1] for key, values in
+                      parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+    def data(self) -> Dict:
+        """JSON or form-encoded body as a dict."""
+        content_type = self.headers.get('content-type', '')
+        try:
+            if 'json' in content_type:
+                return json.loads(self.body or b'{}') or {}
+            return {key: values[-1] for key, values in parse_qs(self.body.decode('utf-8')).items()}
+        except (ValueError, UnicodeDecodeError):
+            return {}
+
+
+class RideshareASGI:
+    """ASGI application: async JSON API plus the Flask app for everything else."""
+
+    def __init__(self, flask_app=web_app.app, max_workers: int = None, page_workers: int = None):
+        """max_workers sizes the API's database workers, page_workers the Flask page threads."""
+        self.flask_app = flask_app
+        self.max_workers = max_workers
+        self.page_workers = page_workers or PAGE_WORKERS
+        self.adb: Optional[AsyncDatabaseOperations] = None
+        self.page_executor: Optional[ThreadPoolExecutor] = None
+        self._start_lock = None
+        self.routes = []
+        self.route('GET', r'/api/rider/rides', 'rider', self.rider_rides)
+        self.route('POST', r'/api/rider/rides', 'rider', self.rider_request_ride)
+        self.route('GET', r'/api/rider/rides/(?P<ride_id>\d+)', 'rider', self.rider_ride)
+        self.route('GET', r'/api/driver/rides', 'driver', self.driver_rides)
+        self.route('GET', r'/api/driver/rides/(?P<ride_id>\d+)', 'driver', self.driver_ride)
+        self.route('POST', r'/api/driver/rides/(?P<ride_id>\d+)/status', 'driver',
+                   self.driver_update_ride_status)
+        self.route('POST', r'/api/driver/toggle-mode', 'driver', self.driver_toggle_mode)
+        self.route('POST', r'/api/driver/location', 'driver', self.driver_update_location)
+
+    def route(self, method: str, pattern: str, user_type: str, handler):
+        """Register handler(request, profile_id, **groups) for method + path pattern."""
+        self.routes.append((method, re.compile(pattern + '$'), user_type, handler))
+
+    # ==================== ASGI PLUMBING ====================
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        await self.startup()
+        request = Request(scope, body)
+        if request.path == '/events' and request.method == 'GET':
+            await self._stream_events(request, receive, send)
+            return
+        for method, pattern, user_type, handler in self.routes:
+            match = pattern.match(request.path)
+            if match and method == request.method:
+                status, payload = await self._dispatch(request, user_type, handler, match.groupdict())
+                await self._send_json(send, status, payload)
+                return
+        await self._call_flask(request, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        """Create the shared database pool and async layer once."""
+        if self.adb is not None:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.adb is not None:
+                return
+            loop = asyncio.get_running_loop()
+            db_ops = await loop.run_in_executor(None, self._init_db)
+            if db_ops is None:
+                raise RuntimeError("Database connection failed")
+            self.page_executor = ThreadPoolExecutor(max_workers=self.page_workers,
+                                                    thread_name_prefix="flask-page")
+            self.adb = AsyncDatabaseOperations(db_ops, self.max_workers,
+                                               batch_dispatcher=web_app.batch_dispatcher)
+            logger.info("ASGI app started with %d database workers and %d page workers",
+                        self.adb.max_workers, self.page_workers)
+
+    @staticmethod
+    def _init_db():
+        db_ops = web_app.init_db()
+        if db_ops is not None:
+            db_ops.release()
+        return db_ops
+
+    async def shutdown(self):
+        if self.adb is None:
+            return
+        if web_app.batch_dispatcher is not None:
+            web_app.batch_dispatcher.stop()
+        await self.adb.close()
+        self.adb = None
+        self.page_executor.shutdown(wait=False)
+        self.page_executor = None
+
+    async def _dispatch(self, request: Request, user_type: str, handler, params: Dict) -> Tuple[int, Dict]:
+        session = self._load_session(request)
+        if 'user_id' not in session or session.get('user_type') != user_type:
+            return 403, {'success': False, 'message': 'Unauthorized'}
+        try:
+            return await handler(request, session['profile_id'], **params)
+        except Exception as e:
+            logger.exception("Error handling %s %s: %s", request.method, request.path, e)
+            return 500, {'success': False, 'message': 'Internal server error'}
+
+    def _load_session(self, request: Request) -> Dict:
+        """Read the Flask session cookie so API calls share the web login."""
+        cookies = SimpleCookie()
+        try:
+            cookies.load(request.headers.get('cookie', ''))
+        except Exception:
+            return {}
+        morsel = cookies.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if morsel is None or serializer is None:
+            return {}
+        try:
+            return serializer.loads(morsel.value,
+                                    max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return {}
+
+    async def _stream_events(self, request: Request, receive, send):
+        """Server-Sent Events stream of the user's ride events (see web_app.ride_events)."""
+        session = self._load_session(request)
+        user_type = session.get('user_type')
+        if 'user_id' not in session or user_type not in ('rider', 'driver'):
+            await self._send_json(send, 403, {'success': False, 'message': 'Unauthorized'})
+            return
+        topic = (rider_topic if user_type == 'rider' else driver_topic)(session['profile_id'])
+
+        with self.adb.db_ops.events.subscribe(topic) as subscription:
+            # The next message after the request body is http.disconnect
+            disconnected = asyncio.ensure_future(receive())
+            disconnected.add_done_callback(lambda _: subscription.close())
+            try:
+                await send({'type': 'http.response.start', 'status': 200,
+                            'headers': [(b'content-type', b'text/event-stream'),
+                                        (b'cache-control', b'no-cache'),
+                                        (b'x-accel-buffering', b'no')]})
+                await send({'type': 'http.response.body', 'body': b"retry: 2000\n\n", 'more_body': True})
+                while not subscription.closed:
+                    events = await subscription.get_async(SSE_KEEPALIVE_SECONDS)
+                    chunk = ''.join(format_sse(event) for event in events) or ": keepalive\n\n"
+                    await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'),
+                                'more_body': True})
+            except OSError:
+                pass
+            finally:
+                disconnected.cancel()
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: Dict):
+        body = json.dumps(payload, default=_json_default).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_flask(self, request: Request, send):
+        """Run the Flask (WSGI) app for this request on the page worker pool."""
+        scope = request.scope
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': request.path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(request.body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self.page_executor,
+                                                           functools.partial(self._run_wsgi, environ))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _run_wsgi(self, environ: Dict):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        try:
+            result = self.flask_app(environ, start_response)
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            # Hand the page thread's pooled connection back, as AsyncDatabaseOperations.run() does
+            self.adb.db_ops.release()
+        return response['status'], response['headers'], body
+
+    # ==================== RIDER API ====================
+
+    async def _rides_page(self, fetch, profile_id: int, request: Request) -> Tuple[int, Dict]:
+        after = web_app.helper.decode_page_cursor(request.query.get('after', ''))
+        rides, next_after = await fetch(profile_id, web_app.RIDES_PAGE_SIZE, after)
+        return 200, {'rides': rides, 'next_cursor': web_app.helper.encode_page_cursor(next_after)}
+
+    async def _poll_ride(self, fetch, ride_id: int, request: Request) -> Tuple[int, Dict]:
+        """Return the ride, waiting up to ?wait= seconds for it to leave ?status=.
+
+        Waits on the ride's events rather than re-querying, so an idle poll
+        costs no database work.
+        """
+        try:
+            wait = min(max(float(request.query.get('wait', 0)), 0.0), LONG_POLL_MAX)
+        except ValueError:
+            wait = 0.0
+        known_status = request.query.get('status')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        # Subscribe before the first read so a change in between is not missed
+        with self.adb.db_ops.events.subscribe(ride_topic(ride_id)) as subscription:
+            ride = await fetch()
+            while ride and known_status and ride['ride_status'] == known_status:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if await subscription.get_async(remaining):
+                    ride = await fetch()
+        if not ride:
+            return 404, {'success': False, 'message': 'Ride not found'}
+        return 200, {'ride': ride}
+
+    async def rider_rides(self, request: Request, rider_id: int):
+        return await self._rides_page(self.adb.get_rider_rides_page, rider_id, request)
+
+    async def rider_ride(self, request: Request, rider_id: int, ride_id: str):
+        return await self._poll_ride(lambda: self.adb.get_ride_by_id(int(ride_id), rider_id),
+                                     int(ride_id), request)
+
+    async def rider_request_ride(self, request: Request, rider_id: int):
+        """Dispatch a ride; same inputs as the Find a Driver form."""
+        data = request.data()
+        pickup_location = str(data.get('pickup_location') or '').strip()
+        dropoff_location = str(data.get('dropoff_location') or '').strip()
+        if not pickup_location or not dropoff_location:
+            return 400, {'success': False, 'message': 'Please provide both pickup and dropoff locations.'}
+
+        helper = web_app.helper
+        pickup_coords = helper.validate_coordinates(data.get('pickup_latitude'), data.get('pickup_longitude'))
+        dropoff_coords = helper.validate_coordinates(data.get('dropoff_latitude'), data.get('dropoff_longitude'))
+        fare = None
+        if data.get('fare_amount') not in (None, '') and not (pickup_coords and dropoff_coords):
+            try:
+                fare = float(data['fare_amount'])
+            except (TypeError, ValueError):
+                pass
+
+        dispatched = await self.adb.dispatch_ride(
+            rider_id,
+            pickup_location,
+            dropoff_location,
+            str(data.get('pickup_address') or '').strip() or None,
+            str(data.get('dropoff_address') or '').strip() or None,
+            fare,
+            *(pickup_coords or (None, None)),
+            *(dropoff_coords or (None, None))
+        )
+        if not dispatched:
+            return 409, {'success': False,
+                         'message': 'No active drivers available at the moment. Please try again later.'}
+        ride_id, driver = dispatched
+        driver = {field: driver.get(field) for field in PUBLIC_DRIVER_FIELDS} if driver else None
+        return 201, {'success': True, 'ride_id': ride_id, 'driver': driver}
+
+    # ==================== DRIVER API ====================
+
+    async def driver_rides(self, request: Request, driver_id: int):
+        return await self._rides_page(self.adb.get_driver_rides_page, driver_id, request)
+
+    async def driver_ride(self, request: Request, driver_id: int, ride_id: str):
+        return await self._poll_ride(lambda: self.adb.get_driver_ride_by_id(int(ride_id), driver_id),
+                                     int(ride_id), request)
+
+    async def driver_update_ride_status(self, request: Request, driver_id: int, ride_id: str):
+        ride = await self.adb.get_driver_ride_by_id(int(ride_id), driver_id)
+        if not ride:
+            return 404, {'success': False, 'message': 'Ride not found'}
+        ride_status = str(request.data().get('ride_status') or '').strip()
+        if ride_status not in web_app.RIDE_STATUS_TRANSITIONS.get(ride['ride_status'], ()):
+            return 409, {'success': False, 'message': 'That status change is not allowed for this ride.'}
+        if not await self.adb.update_ride_status(int(ride_id), ride_status):
+            return 500, {'success': False, 'message': 'Failed to update ride status'}
+        return 200, {'success': True, 'ride_status': ride_status}
+
+    async def driver_toggle_mode(self, request: Request, driver_id: int):
+        if not await self.adb.toggle_driver_mode(driver_id):
+            return 500, {'success': False, 'message': 'Failed to update mode'}
+        driver = await self.adb.get_driver_by_id(driver_id)
+        return 200, {'success': True, 'mode': driver['driver_mode']}
+
+    async def driver_update_location(self, request: Request, driver_id: int):
+        data = request.data()
+        coords = web_app.helper.validate_coordinates(data.get('latitude'), data.get('longitude'))
+        if not coords:
+            return 400, {'success': False, 'message': 'Invalid coordinates'}
+        if not await self.adb.update_driver_location(driver_id, *coords):
+            return 500, {'success': False, 'message': 'Failed to update location'}
+        return 200, {'success': True, 'latitude': coords[0], 'longitude': coords[1]}
+
+
+app = RideshareASGI()
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is not installed: pip install uvicorn, then run uvicorn asgi_app:app")
+        sys.exit(1)
+    uvicorn.run(app, host='127.0.0.1', port=8080)
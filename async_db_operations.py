@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Async Database Operations
+Coroutine versions of the DatabaseOperations API for asyncio code (asgi_app.py).
+
+Each call runs the blocking DatabaseOperations method on a small thread pool
+sized to the connection pool, then returns that worker's connection, so any
+number of waiting coroutines share a handful of OS threads and connections.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from db_operations import DatabaseOperations
+
+# Cheap in-memory helpers that are passed through without a thread hop
+SYNC_METHODS = ('pool_stats', 'cache_stats', 'statement_stats', 'clear_caches', 'invalidate_ride')
+# Connection lifecycle is managed by AsyncDatabaseOperations itself. A unit of
+# work holds one thread's connection across calls, so transaction() can't hop
+# threads; run a function that uses it with run() instead.
+LIFECYCLE_METHODS = ('connect', 'disconnect', 'checkout', 'release', 'transaction')
+
+
+class AsyncDatabaseOperations:
+    """Awaitable facade over a DatabaseOperations instance.
+
+    Every public DatabaseOperations method is available under the same name
+    as a coroutine, e.g. ``await adb.get_driver_by_id(7)``. dispatch_ride()
+    goes through batch_dispatcher when one is given, without tying up a
+    thread while the batch window is open.
+    """
+
+    def __init__(self, db_ops: DatabaseOperations, max_workers: int = None,
+                 batch_dispatcher=None):
+        """max_workers defaults to the connection pool size."""
+        self.db_ops = db_ops
+        self.batch_dispatcher = batch_dispatcher
+        self.max_workers = max_workers or db_ops.pool_size
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="async-db")
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the worker pool, releasing its connection after."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(self._call, func, args, kwargs))
+
+    def _call(self, func, args, kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.db_ops.release()
+
+    async def connect(self) -> bool:
+        """Create the connection pool (see DatabaseOperations.connect)."""
+        return await self.run(self.db_ops.connect)
+
+    async def close(self):
+        """Stop the worker threads and close the pool."""
+        await self.run(self.db_ops.disconnect)
+        self.executor.shutdown(wait=False)
+
+    async def dispatch_ride(self, rider_id: int, pickup_location: str, dropoff_location: str,
+                            pickup_address: str = None, dropoff_address: str = None,
+                            fare_amount: float = None, pickup_latitude: float = None,
+                            pickup_longitude: float = None, dropoff_latitude: float = None,
+                            dropoff_longitude: float = None, timeout: float = None,
+                            **kwargs) -> Optional[Tuple[int, Dict]]:
+        """Coroutine form of dispatch_ride(); batched when a dispatcher is set."""
+        if self.batch_dispatcher is None:
+            return await self.run(self.db_ops.dispatch_ride, rider_id, pickup_location,
+                                  dropoff_location, pickup_address, dropoff_address, fare_amount,
+                                  pickup_latitude, pickup_longitude, dropoff_latitude,
+                                  dropoff_longitude, **kwargs)
+
+        from batch_dispatch import RideRequest
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request = RideRequest(rider_id, pickup_location, dropoff_location, pickup_address,
+                              dropoff_address, fare_amount, pickup_latitude, pickup_longitude,
+                              dropoff_latitude, dropoff_longitude)
+        request.add_done_callback(lambda done: loop.call_soon_threadsafe(
+            lambda: future.done() or future.set_result(done.result)))
+        self.batch_dispatcher.submit(request)
+        wait = timeout if timeout is not None else self.batch_dispatcher.window + 30.0
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            if self.batch_dispatcher.cancel(request):
+                return None
+            # Its ride is being committed right now; report it rather than "no driver"
+            return await future
+
+
+def _async_method(name: str):
+    method = getattr(DatabaseOperations, name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.run(getattr(self.db_ops, name), *args, **kwargs)
+
+    return wrapper
+
+
+def _sync_method(name: str):
+    method = getattr(DatabaseOperations, name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return getattr(self.db_ops, name)(*args, **kwargs)
+
+    return wrapper
+
+
+for _name, _ in inspect.getmembers(DatabaseOperations, inspect.isfunction):
+    if _name.startswith('_') or _name in LIFECYCLE_METHODS or hasattr(AsyncDatabaseOperations, _name):
+        continue
+    setattr(AsyncDatabaseOperations, _name,
+            _sync_method(_name) if _name in SYNC_METHODS else _async_method(_name))
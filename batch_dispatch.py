@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Batch Dispatch
+Collects ride requests over a short window and matches the whole batch to
+nearby active drivers at once, minimising total pickup cost instead of
+serving each request greedily in arrival order.
+
+The rider x driver cost matrix is built with NumPy: haversine pickup distance
+plus penalties for lower-rated drivers and a bonus for drivers who have been
+idle longest. It is solved optimally (SciPy's linear_sum_assignment when
+installed, otherwise a NumPy Hungarian implementation) or greedily, and all
+assignments are committed in one transaction.
+
+Enable in the web app with RIDESHARE_DISPATCH_MODE=batch. Compare matchers on
+synthetic data with:
+    python batch_dispatch.py --requests 200 --drivers 400
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # NumPy fallback below
+    linear_sum_assignment = None
+
+logger = logging.getLogger(__name__)
+
+# Cost terms are expressed in kilometres of pickup distance
+RATING_WEIGHT_KM = 0.5      # per star below 5
+IDLE_WEIGHT_KM = 1.0        # bonus for a driver idle IDLE_CAP_MINUTES or more
+IDLE_CAP_MINUTES = 30.0
+DEFAULT_RATING = 4.5        # assumed for drivers with no ratings yet
+INFEASIBLE = 1e9            # cost of pairs beyond the pickup radius
+
+
+def haversine_matrix(lat1: np.ndarray, lon1: np.ndarray,
+                     lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between every point of set 1 and set 2."""
+    lat1, lon1 = np.radians(lat1)[:, None], np.radians(lon1)[:, None]
+    lat2, lon2 = np.radians(lat2)[None, :], np.radians(lon2)[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def build_cost_matrix(request_lat: np.ndarray, request_lon: np.ndarray,
+                      driver_lat: np.ndarray, driver_lon: np.ndarray,
+                      driver_rating: np.ndarray, driver_idle_minutes: np.ndarray,
+                      max_radius_km: float = 25.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (cost, distance_km) matrices of shape (requests, drivers).
+
+    Requests with NaN coordinates may take any driver but are charged the
+    full radius, so located riders nearby are served first; their distance is 0.
+    """
+    distance = haversine_matrix(request_lat, request_lon, driver_lat, driver_lon)
+    unlocated = np.isnan(distance)
+    distance = np.where(unlocated, 0.0, distance)
+
+    rating_penalty = RATING_WEIGHT_KM * (5.0 - np.nan_to_num(driver_rating, nan=DEFAULT_RATING))
+    idle_bonus = IDLE_WEIGHT_KM * np.minimum(driver_idle_minutes, IDLE_CAP_MINUTES) / IDLE_CAP_MINUTES
+    cost = np.where(unlocated, max_radius_km, distance) + (rating_penalty - idle_bonus)[None, :]
+    cost = np.where(distance > max_radius_km, INFEASIBLE, cost)
+    return cost, distance
+
+
+def idle_minutes(last_ride_at: Optional[datetime], now: datetime) -> float:
+    """Minutes since a driver's last ride; drivers who never had one count as fully idle."""
+    if last_ride_at is None:
+        return IDLE_CAP_MINUTES
+    return max(0.0, (now - last_ride_at).total_seconds() / 60.0)
+
+
+def solve_greedy(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """Repeatedly take the cheapest remaining (request, driver) pair."""
+    rows, cols = cost.shape
+    if not rows or not cols:
+        return []
+    flat = cost.ravel()
+    order = np.argsort(flat, kind='stable')
+    order = order[flat[order] < INFEASIBLE]
+    row_of, col_of = np.divmod(order, cols)
+    row_used = bytearray(rows)
+    col_used = bytearray(cols)
+    pairs = []
+    limit = min(rows, cols)
+    for r, c in zip(row_of.tolist(), col_of.tolist()):
+        if row_used[r] or col_used[c]:
+            continue
+        row_used[r] = col_used[c] = 1
+        pairs.append((r, c))
+        if len(pairs) == limit:
+            break
+    return pairs
+
+
+def _hungarian(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """Minimum-cost assignment of every row (rows <= columns), O(n^2 m)."""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)   # match[j]: 1-based row assigned to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    return [(int(match[j]) - 1, j - 1) for j in range(1, m + 1) if match[j]]
+
+
+def solve_optimal(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """Assignment minimising total cost; infeasible pairs are dropped."""
+    rows, cols = cost.shape
+    if not rows or not cols:
+        return []
+    if linear_sum_assignment is not None:
+        row_ind, col_ind = linear_sum_assignment(cost)
+        pairs = list(zip(row_ind.tolist(), col_ind.tolist()))
+    elif rows <= cols:
+        pairs = _hungarian(cost)
+    else:
+        pairs = [(r, c) for c, r in _hungarian(cost.T)]
+    return sorted((r, c) for r, c in pairs if cost[r, c] < INFEASIBLE)
+
+
+SOLVERS = {'optimal': solve_optimal, 'greedy': solve_greedy}
+
+
+class RideRequest:
+    """A rider's ride request waiting for the next batch."""
+
+    def __init__(self, rider_id: int, pickup_location: str, dropoff_location: str,
+                 pickup_address: str = None, dropoff_address: str = None,
+                 fare_amount: float = None, pickup_latitude: float = None,
+                 pickup_longitude: float = None, dropoff_latitude: float = None,
+                 dropoff_longitude: float = None):
+        self.fields = {
+            'rider_id': rider_id,
+            'pickup_location': pickup_location,
+            'dropoff_location': dropoff_location,
+            'pickup_address': pickup_address,
+            'dropoff_address': dropoff_address,
+            'fare_amount': fare_amount,
+            'pickup_latitude': pickup_latitude,
+            'pickup_longitude': pickup_longitude,
+            'dropoff_latitude': dropoff_latitude,
+            'dropoff_longitude': dropoff_longitude,
+        }
+        self.result: Optional[Tuple[int, Dict]] = None
+        self.done = threading.Event()
+        # Both set under the dispatcher's lock: the caller gave up on the request,
+        # or the worker is committing a ride for it and it can no longer be withdrawn
+        self.cancelled = False
+        self.committing = False
+        self._callbacks: List[Callable] = []
+
+    def add_done_callback(self, callback: Callable):
+        """Call callback(request) from the batch worker once the result is set."""
+        self._callbacks.append(callback)
+
+    def finish(self):
+        self.done.set()
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Ride request callback failed")
+
+    @property
+    def located(self) -> bool:
+        return self.fields['pickup_latitude'] is not None and self.fields['pickup_longitude'] is not None
+
+
+class BatchDispatcher:
+    """Matches ride requests in batches collected over a short window.
+
+    dispatch_ride() has the same signature and result as
+    DatabaseOperations.dispatch_ride(), so callers can use either.
+    """
+
+    def __init__(self, db_ops, window: float = 1.5, max_batch: int = 256, solver: str = 'optimal',
+                 max_radius_km: float = 25.0, candidates_per_request: int = 8):
+        """Batch requests arriving within window seconds (or max_batch of them)."""
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver: {solver}")
+        self.db_ops = db_ops
+        self.window = window
+        self.max_batch = max_batch
+        self.solver = solver
+        self.max_radius_km = max_radius_km
+        self.candidates_per_request = candidates_per_request
+        self._pending: List[RideRequest] = []
+        self._cond = threading.Condition()
+        self._worker = None
+        self._stopped = False
+        self.batches = 0
+        self.last_batch: Dict = {}
+
+    def dispatch_ride(self, rider_id: int, pickup_location: str, dropoff_location: str,
+                      pickup_address: str = None, dropoff_address: str = None,
+                      fare_amount: float = None, pickup_latitude: float = None,
+                      pickup_longitude: float = None, dropoff_latitude: float = None,
+                      dropoff_longitude: float = None, timeout: float = None,
+                      **kwargs) -> Optional[Tuple[int, Dict]]:
+        """Queue a request for the next batch and wait for its (ride_id, driver)."""
+        request = RideRequest(rider_id, pickup_location, dropoff_location, pickup_address,
+                              dropoff_address, fare_amount, pickup_latitude, pickup_longitude,
+                              dropoff_latitude, dropoff_longitude)
+        # Don't hold a pooled connection while waiting; the batch worker needs one
+        self.db_ops.release()
+        self.submit(request)
+        if not request.done.wait(timeout if timeout is not None else self.window + 30.0):
+            if not self.cancel(request):
+                # Its ride is being committed right now; report it rather than "no driver"
+                request.done.wait()
+        return request.result
+
+    def submit(self, request: RideRequest):
+        """Queue a request without waiting for it.
+
+        Once stop() has been called there is no worker to drain the queue, so
+        the request is finished straight away with no result.
+        """
+        with self._cond:
+            stopped = self._stopped
+            if not stopped:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="batch-dispatch", daemon=True)
+                    self._worker.start()
+                self._pending.append(request)
+                self._cond.notify_all()
+        if stopped:
+            request.finish()
+
+    def cancel(self, request: RideRequest) -> bool:
+        """Withdraw a request whose caller stopped waiting, so no ride is created for it.
+
+        Returns False when it is too late: the request is finished or its ride
+        is being committed, and its result is about to be (or already is) set.
+        """
+        with self._cond:
+            if request.committing or request.done.is_set():
+                return False
+            request.cancelled = True
+            if request in self._pending:
+                self._pending.remove(request)
+            return True
+
+    def _claim(self, requests: Sequence[RideRequest]) -> List[RideRequest]:
+        """Mark the requests not cancelled as committing and return them."""
+        with self._cond:
+            claimed = [request for request in requests if not request.cancelled]
+            for request in claimed:
+                request.committing = True
+            return claimed
+
+    def stop(self):
+        """Stop the worker once it has served every queued request, and wait for it."""
+        with self._cond:
+            self._stopped = True
+            worker, self._worker = self._worker, None
+            self._cond.notify_all()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+
+    def _take_batch(self) -> List[RideRequest]:
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self.last_batch = self.dispatch_batch(batch)
+                self.batches += 1
+            except Exception:
+                logger.exception("Batch dispatch failed for %d requests", len(batch))
+            finally:
+                self.db_ops.release()
+                for request in batch:
+                    request.finish()
+
+    def _candidate_ids(self, requests: Sequence[RideRequest]) -> List[int]:
+        ids = set()
+        unlocated = 0
+        for request in requests:
+            if request.located:
+                ids.update(self.db_ops.find_dispatch_candidates(
+                    request.fields['pickup_latitude'], request.fields['pickup_longitude'],
+                    self.max_radius_km, self.candidates_per_request))
+            else:
+                unlocated += 1
+        if unlocated:
+            ids.update(self.db_ops.find_dispatch_candidates(
+                None, None, self.max_radius_km, unlocated * self.candidates_per_request))
+        return sorted(ids)
+
+    def dispatch_batch(self, requests: Sequence[RideRequest]) -> Dict:
+        """Match and commit one batch, setting each request's result; returns stats."""
+        started = time.perf_counter()
+        requests = [request for request in requests if not request.cancelled]
+        drivers = self.db_ops.get_dispatch_candidates(self._candidate_ids(requests))
+        assigned_km = 0.0
+        pairs: List[Tuple[int, int]] = []
+
+        if drivers:
+            now = datetime.now()
+            cost, distance = build_cost_matrix(
+                np.array([r.fields['pickup_latitude'] if r.located else np.nan for r in requests], dtype=float),
+                np.array([r.fields['pickup_longitude'] if r.located else np.nan for r in requests], dtype=float),
+                np.array([d['current_latitude'] if d['current_latitude'] is not None else np.nan
+                          for d in drivers], dtype=float),
+                np.array([d['current_longitude'] if d['current_longitude'] is not None else np.nan
+                          for d in drivers], dtype=float),
+                np.array([d['rating_sum'] / d['rating_count'] if d['rating_count'] else np.nan
+                          for d in drivers], dtype=float),
+                np.array([idle_minutes(d['last_ride_at'], now) for d in drivers], dtype=float),
+                self.max_radius_km,
+            )
+            solve_started = time.perf_counter()
+            pairs = SOLVERS[self.solver](cost)
+            solve_ms = (time.perf_counter() - solve_started) * 1000
+            # Callers that timed out while the batch was being matched are left out
+            self._claim([requests[r] for r, _ in pairs])
+            pairs = [(r, c) for r, c in pairs if requests[r].committing]
+            ride_ids = self.db_ops.dispatch_rides(
+                [(drivers[c]['driver_id'], requests[r].fields) for r, c in pairs])
+            for (r, c), ride_id in zip(pairs, ride_ids):
+                if ride_id is not None:
+                    requests[r].result = (ride_id, self.db_ops.get_driver_by_id(drivers[c]['driver_id']))
+                    assigned_km += float(distance[r, c])
+        else:
+            solve_ms = 0.0
+
+        # Anything the batch could not serve gets one individual attempt
+        fallback = 0
+        for request in requests:
+            if request.result is None and self._claim([request]):
+                request.result = self.db_ops.dispatch_ride(**request.fields)
+                fallback += request.result is not None
+
+        stats = {
+            'requests': len(requests),
+            'drivers': len(drivers),
+            'matched': sum(1 for r in requests if r.result is not None),
+            'fallback': fallback,
+            'pickup_km': round(assigned_km, 3),
+            'solve_ms': round(solve_ms, 3),
+            'total_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+        logger.info("Dispatched batch: %s", stats)
+        return stats
+
+
+# ==================== SIMULATION ====================
+
+def sequential_nearest(distance: np.ndarray) -> List[Tuple[int, int]]:
+    """The per-request policy: each request in turn takes its nearest free driver."""
+    free = np.ones(distance.shape[1], dtype=bool)
+    pairs = []
+    for r in range(distance.shape[0]):
+        row = np.where(free, distance[r], np.inf)
+        c = int(np.argmin(row))
+        if np.isfinite(row[c]):
+            free[c] = False
+            pairs.append((r, c))
+    return pairs
+
+
+def simulate(requests: int, drivers: int, seed: int = 42, spread_deg: float = 0.15) -> Dict:
+    """Compare matchers on random requests and drivers around one city."""
+    rng = np.random.default_rng(seed)
+    center = (34.0522, -118.2437)
+    req_lat = center[0] + rng.normal(0, spread_deg, requests)
+    req_lon = center[1] + rng.normal(0, spread_deg, requests)
+    drv_lat = center[0] + rng.normal(0, spread_deg, drivers)
+    drv_lon = center[1] + rng.normal(0, spread_deg, drivers)
+    ratings = np.clip(rng.normal(4.5, 0.4, drivers), 1, 5)
+    idle = rng.uniform(0, 60, drivers)
+
+    started = time.perf_counter()
+    cost, distance = build_cost_matrix(req_lat, req_lon, drv_lat, drv_lon, ratings, idle)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    results = {'build_ms': round(build_ms, 3)}
+    matchers = {
+        'sequential_nearest': lambda: sequential_nearest(distance),
+        'batch_greedy': lambda: solve_greedy(cost),
+        'batch_optimal': lambda: solve_optimal(cost),
+    }
+    for name, matcher in matchers.items():
+        started = time.perf_counter()
+        pairs = matcher()
+        elapsed = (time.perf_counter() - started) * 1000
+        results[name] = {
+            'matched': len(pairs),
+            'pickup_km': round(float(sum(distance[r, c] for r, c in pairs)), 2),
+            'cost': round(float(sum(cost[r, c] for r, c in pairs)), 2),
+            'ms': round(elapsed, 3),
+        }
+    return results
+
+
+def main():
+    """Main entry point: compare matchers on synthetic data."""
+    parser = argparse.ArgumentParser(description="Compare ride matching strategies on synthetic data.")
+    parser.add_argument("--requests", type=int, default=200, help="ride requests in the batch (default 200)")
+    parser.add_argument("--drivers", type=int, default=400, help="available drivers (default 400)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default 42)")
+    args = parser.parse_args()
+
+    results = simulate(args.requests, args.drivers, args.seed)
+    solver = "scipy" if linear_sum_assignment is not None else "numpy"
+    print(f"{args.requests} requests x {args.drivers} drivers "
+          f"(cost matrix built in {results.pop('build_ms')} ms, optimal solver: {solver})")
+    print(f"{'matcher':<20} {'matched':>8} {'pickup km':>11} {'cost':>11} {'ms':>9}")
+    for name, row in results.items():
+        print(f"{name:<20} {row['matched']:>8} {row['pickup_km']:>11.2f} {row['cost']:>11.2f} {row['ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Benchmark Suite
+Times every DatabaseOperations method and every web_app.py route against
+seeded datasets of several sizes, and compares the results to a saved baseline.
+
+Usage:
+    python benchmark.py --scales small,medium --output bench.json
+    python benchmark.py --scales small --baseline bench_baseline.json
+    python benchmark.py --scales small --save-baseline bench_baseline.json
+    python benchmark.py --backend sqlite --sqlite-path bench.db --scales small
+    python benchmark.py --scales small --statements --no-routes
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from db_backends import create_backend
+from db_operations import DatabaseOperations
+from generate_data import PASSWORD, generate
+from helper import Helper
+
+# Read methods whose queries run as prepared statements (compared by --statements)
+STATEMENT_CASES = (
+    'get_user_by_username', 'get_user_by_id', 'get_driver_by_id', 'get_rider_by_id',
+    'get_driver_rating_summary', 'get_driver_rides_page', 'get_driver_rides_page[2]',
+    'get_driver_ride_by_id', 'get_rider_rides_page', 'get_rider_most_recent_ride',
+    'get_ride_by_id', 'get_ride_by_id[rider]',
+)
+
+# Dataset sizes: (riders, drivers, rides)
+SCALES = {
+    'small': (1000, 100, 10000),
+    'medium': (10000, 1000, 100000),
+    'large': (100000, 10000, 1000000),
+}
+
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples: List[float], errors: int = 0) -> Dict:
+    """Latency percentiles (milliseconds) and throughput for one case."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'mean_ms': total / len(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else 0.0,
+        'ops_per_sec': len(ordered) / total if total else 0.0,
+    }
+
+
+def run_case(fn: Callable, iterations: int, max_seconds: float, warmup: int = 3) -> Dict:
+    """Call fn repeatedly and summarize its latency.
+
+    fn returns False to signal a failed call; exceptions also count as errors.
+    Stops early once max_seconds of measured time has been spent.
+    """
+    for _ in range(warmup):
+        try:
+            fn()
+        except Exception:
+            pass
+    samples = []
+    errors = 0
+    budget_start = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            ok = fn()
+        except Exception:
+            ok = False
+        samples.append(time.perf_counter() - start)
+        if ok is False:
+            errors += 1
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+    return summarize(samples, errors)
+
+
+class Fixtures:
+    """IDs of representative rows to benchmark against."""
+
+    def __init__(self, db_ops: DatabaseOperations):
+        """Pick the heaviest driver and rider plus one of their rides."""
+        cursor = db_ops.cursor
+        cursor.execute("""
+            SELECT driver_id, COUNT(*) AS rides FROM RIDE
+            GROUP BY driver_id ORDER BY rides DESC LIMIT 1
+        """)
+        self.driver_id = cursor.fetchone()['driver_id']
+        cursor.execute("""
+            SELECT rider_id, COUNT(*) AS rides FROM RIDE
+            GROUP BY rider_id ORDER BY rides DESC LIMIT 1
+        """)
+        self.rider_id = cursor.fetchone()['rider_id']
+
+        self.driver = db_ops.get_driver_by_id(self.driver_id)
+        self.rider = db_ops.get_rider_by_id(self.rider_id)
+        self.driver_user = db_ops.get_user_by_id(self.driver['user_id'])
+        self.rider_user = db_ops.get_user_by_id(self.rider['user_id'])
+
+        cursor.execute("SELECT ride_id FROM RIDE WHERE driver_id = %s LIMIT 1", (self.driver_id,))
+        self.driver_ride_id = cursor.fetchone()['ride_id']
+        cursor.execute("SELECT ride_id FROM RIDE WHERE rider_id = %s LIMIT 1", (self.rider_id,))
+        self.rider_ride_id = cursor.fetchone()['ride_id']
+        _, self.driver_page_cursor = db_ops.get_driver_rides_page(self.driver_id)
+        _, self.rider_page_cursor = db_ops.get_rider_rides_page(self.rider_id)
+
+        cursor.execute("SELECT current_latitude, current_longitude FROM DRIVER "
+                       "WHERE current_latitude IS NOT NULL LIMIT 1")
+        located = cursor.fetchone()
+        self.latitude = float(located['current_latitude']) if located else 34.0522
+        self.longitude = float(located['current_longitude']) if located else -118.2437
+        db_ops.connection.rollback()
+
+
+def method_cases(db_ops: DatabaseOperations, fx: Fixtures) -> Dict[str, Callable]:
+    """One callable per DatabaseOperations method."""
+    counter = itertools.count()
+    stamp = int(time.time())
+
+    def unique(prefix):
+        return f"{prefix}_{stamp}_{next(counter)}"
+
+    def create_user():
+        name = unique("bench_user")
+        return db_ops.create_user(name, PASSWORD, f"{name}@example.com", None, "Bench User") is not None
+
+    def create_driver():
+        name = unique("bench_driver")
+        user_id = db_ops.create_user(name, PASSWORD, f"{name}@example.com", None, "Bench Driver")
+        return db_ops.create_driver(user_id, "DLBENCH") is not None
+
+    def create_rider():
+        name = unique("bench_rider")
+        user_id = db_ops.create_user(name, PASSWORD, f"{name}@example.com", None, "Bench Rider")
+        return db_ops.create_rider(user_id) is not None
+
+    ratings = itertools.cycle([5, 4, 3, 5])
+    statuses = itertools.cycle(['in_progress', 'completed'])
+
+    return {
+        'create_user': create_user,
+        'get_user_by_username': lambda: db_ops.get_user_by_username(fx.rider_user['username']) is not None,
+        'get_user_by_id': lambda: db_ops.get_user_by_id(fx.rider_user['user_id']) is not None,
+        'authenticate_user': lambda: db_ops.authenticate_user(fx.rider_user['username'], PASSWORD) is not None,
+        'create_driver': create_driver,
+        'get_driver_by_user_id': lambda: db_ops.get_driver_by_user_id(fx.driver['user_id']) is not None,
+        'get_driver_by_id': lambda: db_ops.get_driver_by_id(fx.driver_id) is not None,
+        'get_active_driver': lambda: db_ops.get_active_driver() is not None,
+        'get_nearest_active_driver': lambda: db_ops.get_nearest_active_driver(fx.latitude, fx.longitude) is not None,
+        'update_driver_location': lambda: db_ops.update_driver_location(fx.driver_id, fx.latitude, fx.longitude),
+        'toggle_driver_mode': lambda: db_ops.toggle_driver_mode(fx.driver_id),
+        'get_driver_rating': lambda: db_ops.get_driver_rating(fx.driver_id) is not None,
+        'get_driver_rating_summary': lambda: db_ops.get_driver_rating_summary(fx.driver_id) is not None,
+        'get_driver_rides': lambda: bool(db_ops.get_driver_rides(fx.driver_id)),
+        'get_driver_rides_page': lambda: bool(db_ops.get_driver_rides_page(fx.driver_id)[0]),
+        'get_driver_rides_page[2]': lambda: bool(db_ops.get_driver_rides_page(fx.driver_id, after=fx.driver_page_cursor)[0]),
+        'get_driver_rides_version': lambda: db_ops.get_driver_rides_version(fx.driver_id) is not None,
+        'get_driver_ride_by_id': lambda: db_ops.get_driver_ride_by_id(fx.driver_ride_id, fx.driver_id) is not None,
+        'create_rider': create_rider,
+        'get_rider_by_user_id': lambda: db_ops.get_rider_by_user_id(fx.rider['user_id']) is not None,
+        'get_rider_by_id': lambda: db_ops.get_rider_by_id(fx.rider_id) is not None,
+        'get_rider_rides': lambda: bool(db_ops.get_rider_rides(fx.rider_id)),
+        'get_rider_rides_page': lambda: bool(db_ops.get_rider_rides_page(fx.rider_id)[0]),
+        'get_rider_rides_version': lambda: db_ops.get_rider_rides_version(fx.rider_id) is not None,
+        'get_rider_most_recent_ride': lambda: db_ops.get_rider_most_recent_ride(fx.rider_id) is not None,
+        'create_ride': lambda: db_ops.create_ride(fx.driver_id, fx.rider_id, "Bench pickup", "Bench dropoff",
+                                                  fare_amount=12.5) is not None,
+        'get_ride_by_id': lambda: db_ops.get_ride_by_id(fx.rider_ride_id) is not None,
+        'get_ride_by_id[rider]': lambda: db_ops.get_ride_by_id(fx.rider_ride_id, fx.rider_id) is not None,
+        'update_ride_status': lambda: db_ops.update_ride_status(fx.rider_ride_id, next(statuses)),
+        'update_ride_rating': lambda: db_ops.update_ride_rating(fx.rider_ride_id, fx.rider_id, next(ratings)),
+        'update_ride_ratings': lambda: bool(db_ops.update_ride_ratings(
+            fx.rider_id, [(fx.rider_ride_id, next(ratings), None)])),
+        'get_rides_awaiting_rating': lambda: isinstance(db_ops.get_rides_awaiting_rating(fx.rider_id), list),
+        'get_rider_rides_page[2]': lambda: bool(db_ops.get_rider_rides_page(fx.rider_id, after=fx.rider_page_cursor)[0]),
+        'get_driver_dashboard': lambda: db_ops.get_driver_dashboard(fx.driver_id) is not None,
+        'get_rider_dashboard': lambda: db_ops.get_rider_dashboard(fx.rider_id) is not None,
+        'get_rider_rating_view': lambda: db_ops.get_rider_rating_view(fx.rider_id)['most_recent_ride'] is not None,
+        'find_dispatch_candidates': lambda: isinstance(db_ops.find_dispatch_candidates(None, None), list),
+        'get_dispatch_candidates': lambda: isinstance(db_ops.get_dispatch_candidates([fx.driver_id]), list),
+        'rebuild_driver_rating_stats': lambda: db_ops.rebuild_driver_rating_stats() is not None,
+    }
+
+
+def route_cases(app, fx: Fixtures) -> Dict[str, Callable]:
+    """One callable per web_app.py route, each using a logged-in test client."""
+    rider = app.test_client()
+    driver = app.test_client()
+    anonymous = app.test_client()
+    rider.post('/login/rider', data={'username': fx.rider_user['username'], 'password': PASSWORD})
+    driver.post('/login/driver', data={'username': fx.driver_user['username'], 'password': PASSWORD})
+
+    counter = itertools.count()
+    stamp = int(time.time())
+
+    def request(client, method, path, data=None, json_body=None, ok=(200, 302)):
+        def call():
+            body = data() if callable(data) else data
+            response = client.open(path, method=method, data=body, json=json_body)
+            return response.status_code in ok
+        return call
+
+    def registration(kind):
+        def data():
+            name = f"bench_web_{kind}_{stamp}_{next(counter)}"
+            return {'username': name, 'password': PASSWORD, 'email': f"{name}@example.com",
+                    'full_name': 'Bench User', 'license_number': 'DLBENCH'}
+        return data
+
+    def login_rider():
+        client = app.test_client()
+        response = client.post('/login/rider', data={'username': fx.rider_user['username'],
+                                                     'password': PASSWORD})
+        return response.status_code == 302
+
+    ride_request = {'pickup_location': 'Bench pickup', 'dropoff_location': 'Bench dropoff',
+                    'pickup_latitude': str(fx.latitude), 'pickup_longitude': str(fx.longitude)}
+    driver_page = f"/driver/rides?after={Helper().encode_page_cursor(fx.driver_page_cursor)}" \
+        if fx.driver_page_cursor else "/driver/rides"
+
+    return {
+        'GET /': request(anonymous, 'GET', '/'),
+        'GET /login/rider': request(anonymous, 'GET', '/login/rider'),
+        'POST /login/rider': login_rider,
+        'GET /login/driver': request(anonymous, 'GET', '/login/driver'),
+        'GET /register': request(anonymous, 'GET', '/register'),
+        'POST /register/rider': request(anonymous, 'POST', '/register/rider', data=registration('rider')),
+        'POST /register/driver': request(anonymous, 'POST', '/register/driver', data=registration('driver')),
+        'GET /driver/dashboard': request(driver, 'GET', '/driver/dashboard'),
+        'GET /driver/rating': request(driver, 'GET', '/driver/rating'),
+        'GET /driver/rides': request(driver, 'GET', '/driver/rides'),
+        'GET /driver/rides?after': request(driver, 'GET', driver_page),
+        'GET /driver/rides/<id>': request(driver, 'GET', f'/driver/rides/{fx.driver_ride_id}', ok=(200,)),
+        'POST /driver/toggle-mode': request(driver, 'POST', '/driver/toggle-mode', ok=(200,)),
+        'POST /driver/location': request(driver, 'POST', '/driver/location', ok=(200,),
+                                         json_body={'latitude': fx.latitude, 'longitude': fx.longitude}),
+        'GET /rider/dashboard': request(rider, 'GET', '/rider/dashboard'),
+        'GET /rider/rides': request(rider, 'GET', '/rider/rides'),
+        'GET /rider/rides/<id>': request(rider, 'GET', f'/rider/rides/{fx.rider_ride_id}', ok=(200,)),
+        'GET /rider/find-driver': request(rider, 'GET', '/rider/find-driver'),
+        'POST /rider/find-driver': request(rider, 'POST', '/rider/find-driver', data=ride_request),
+        'GET /rider/rate': request(rider, 'GET', '/rider/rate'),
+        'POST /rider/rate': request(rider, 'POST', '/rider/rate',
+                                    data={'ride_id': str(fx.rider_ride_id), 'rating': '5'}),
+        'GET /logout': request(anonymous, 'GET', '/logout'),
+    }
+
+
+def run_scale(db_ops: DatabaseOperations, app, iterations: int, max_seconds: float,
+              only: Optional[str]) -> Dict:
+    """Benchmark every method and route against the currently loaded data."""
+    fx = Fixtures(db_ops)
+    results = {'methods': {}, 'routes': {}}
+    groups = [('methods', method_cases(db_ops, fx))]
+    if app is not None:
+        groups.append(('routes', route_cases(app, fx)))
+
+    for group, cases in groups:
+        for name, fn in cases.items():
+            if only and only not in name:
+                continue
+            stats = run_case(fn, iterations, max_seconds)
+            results[group][name] = stats
+            print(f"  {name:<34} p50 {stats['p50_ms']:8.3f}ms  p95 {stats['p95_ms']:8.3f}ms  "
+                  f"p99 {stats['p99_ms']:8.3f}ms  {stats['ops_per_sec']:9.1f} ops/s"
+                  + (f"  errors {stats['errors']}" if stats['errors'] else ""))
+            if group == 'methods':
+                db_ops.release()
+    return results
+
+
+def statement_comparison(db_ops: DatabaseOperations, iterations: int, max_seconds: float,
+                         only: Optional[str]) -> Dict:
+    """Time the prepared read queries with statement reuse off, then on.
+    
+    Row caches are disabled so every call reaches the database; the
+    difference is the per-call parse/plan cost that preparation saves.
+    """
+    fx = Fixtures(db_ops)
+    cases = method_cases(db_ops, fx)
+    saved = (db_ops.profile_cache.maxsize, db_ops.ride_cache.maxsize, db_ops.prepared_statements)
+    db_ops.profile_cache.maxsize = db_ops.ride_cache.maxsize = 0
+    db_ops.profile_cache.clear()
+    db_ops.ride_cache.clear()
+    results = {}
+    try:
+        for name in STATEMENT_CASES:
+            if only and only not in name:
+                continue
+            row = {}
+            for mode, enabled in (('unprepared', False), ('prepared', True)):
+                db_ops.prepared_statements = enabled
+                row[mode] = run_case(cases[name], iterations, max_seconds)
+                db_ops.release()
+            prepared_p50 = row['prepared']['p50_ms']
+            row['speedup'] = row['unprepared']['p50_ms'] / prepared_p50 if prepared_p50 else 0.0
+            results[name] = row
+            print(f"  {name:<34} unprepared p50 {row['unprepared']['p50_ms']:8.3f}ms  "
+                  f"prepared p50 {prepared_p50:8.3f}ms  ({row['speedup']:.2f}x)")
+    finally:
+        db_ops.profile_cache.maxsize, db_ops.ride_cache.maxsize, db_ops.prepared_statements = saved
+    counters = db_ops.statement_stats()
+    print(f"  statements prepared {counters['prepared']}, executed {counters['executed']} "
+          f"({counters['reuse_ratio']:.1f} executes per prepare)")
+    return {'cases': results, 'counters': counters}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float, metric: str = 'p95_ms') -> List[str]:
+    """List cases whose metric got worse than the baseline by more than threshold."""
+    regressions = []
+    for scale, groups in results.get('scales', {}).items():
+        base_groups = baseline.get('scales', {}).get(scale, {})
+        for group, cases in groups.items():
+            for name, stats in cases.items():
+                base = base_groups.get(group, {}).get(name)
+                if not base or not base.get(metric):
+                    continue
+                ratio = stats[metric] / base[metric]
+                if ratio > 1 + threshold:
+                    regressions.append(f"{scale} {group} {name}: {metric} {base[metric]:.3f} -> "
+                                       f"{stats[metric]:.3f} ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseOperations and web routes.")
+    parser.add_argument("--scales", default="small",
+                        help=f"comma-separated dataset sizes from {', '.join(SCALES)} (default small)")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="benchmark the data already in the database instead of reseeding")
+    parser.add_argument("--seed", type=int, default=42, help="data generator seed (default 42)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per case (default 200)")
+    parser.add_argument("--max-seconds", type=float, default=5.0,
+                        help="time budget per case in seconds (default 5)")
+    parser.add_argument("--cold", action="store_true", help="disable the row caches")
+    parser.add_argument("--no-routes", action="store_true", help="skip the Flask route benchmarks")
+    parser.add_argument("--statements", action="store_true",
+                        help="also compare the read queries with and without prepared statements")
+    parser.add_argument("--only", help="only run cases whose name contains this text")
+    parser.add_argument("--output", default="bench_results.json", help="where to write results JSON")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed p95 slowdown vs. baseline before failing (default 0.25 = 25%%)")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=None,
+                        help="database backend (default: RIDESHARE_DB_BACKEND or mysql)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="SQLite database file (default: RIDESHARE_SQLITE_PATH or rideshare.db)")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+    db_ops = DatabaseOperations(backend=create_backend(args.backend, path=args.sqlite_path))
+    if not db_ops.connect():
+        print("Failed to connect to database.")
+        sys.exit(1)
+    if args.cold:
+        db_ops.profile_cache.maxsize = 0
+        db_ops.ride_cache.maxsize = 0
+
+    app = None
+    if not args.no_routes:
+        import web_app
+        # web_app logs at DEBUG in development mode; keep that out of the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        web_app.db_ops = db_ops
+        app = web_app.app
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'cold': args.cold,
+            'backend': db_ops.backend.name,
+        },
+        'scales': {},
+    }
+    if args.statements:
+        results['statements'] = {}
+
+    try:
+        for scale in scales:
+            riders, drivers, rides = SCALES[scale]
+            print(f"\n=== {scale}: {riders:,} riders, {drivers:,} drivers, {rides:,} rides ===")
+            if not args.no_seed:
+                generate(db_ops.connection, riders, drivers, rides, seed=args.seed, reset=True,
+                         chunk_size=5000, report=lambda message: None)
+                db_ops.clear_caches()
+                db_ops.release()
+            results['scales'][scale] = run_scale(db_ops, app, args.iterations,
+                                                 args.max_seconds, args.only)
+            if args.statements:
+                print(f"\n--- {scale}: prepared statement reuse (row caches off) ---")
+                results['statements'][scale] = statement_comparison(db_ops, args.iterations,
+                                                                    args.max_seconds, args.only)
+    finally:
+        db_ops.disconnect()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
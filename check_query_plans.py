@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Query Plan Checks
+Runs every DatabaseOperations method against a seeded dataset, records each
+statement it executes, and EXPLAINs them. Fails (exit status 1) when a query
+falls back to a full table scan or a filesort, and prints a report of the
+estimated rows each query examines, so a schema or query change cannot
+silently drop an index from a hot path.
+
+MySQL plans come from EXPLAIN; SQLite plans from EXPLAIN QUERY PLAN, with row
+estimates taken from the sqlite_stat1 table that ANALYZE fills in.
+
+Usage:
+    python check_query_plans.py --scale small
+    python check_query_plans.py --backend sqlite --sqlite-path plans.db --scale medium
+    python check_query_plans.py --no-seed --only rides_page --output plans.json
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from benchmark import SCALES, Fixtures, method_cases
+from db_backends import create_backend
+from db_operations import DatabaseOperations
+from generate_data import generate
+
+# Queries that read a whole table on purpose, with the reason
+ALLOWED_SCANS = {
+    'rebuild_driver_rating_stats': "recomputes every driver's totals from RIDE",
+}
+
+# Statements without a plan worth checking (single-row INSERT ... VALUES, transaction control)
+_UNPLANNED = re.compile(r"^\s*(INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*VALUES|BEGIN|COMMIT|ROLLBACK)",
+                        re.IGNORECASE)
+_TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQLITE_ACCESS = re.compile(
+    r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS (\S+))?"
+    r"(?: USING (?:(?:COVERING )?INDEX (\S+)|INTEGER PRIMARY KEY|PRIMARY KEY)(?: \((.*)\))?)?")
+_SQLITE_SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+_SQL_KEYWORDS = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'GROUP', 'ORDER', 'LIMIT', 'SET', 'USING'}
+
+
+class RecordingCursor:
+    """Cursor wrapper that logs each statement for the method being checked."""
+
+    def __init__(self, cursor, owner: "RecordingOperations"):
+        self._cursor = cursor
+        self._owner = owner
+
+    def execute(self, operation, params=()):
+        self._owner.record(operation, params)
+        return self._cursor.execute(operation, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordingOperations(DatabaseOperations):
+    """DatabaseOperations that records the SQL each method runs.
+
+    Row caches and prepared statements are off, so every call reaches the
+    database through the (recording) thread cursor.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('prepared_statements', False)
+        super().__init__(*args, **kwargs)
+        self.profile_cache.maxsize = 0
+        self.ride_cache.maxsize = 0
+        self.case: Optional[str] = None
+        # case name -> {sql: params of its first execution}
+        self.recorded: Dict[str, Dict[str, tuple]] = {}
+
+    def checkout(self) -> bool:
+        fresh = getattr(self._local, 'pooled', None) is None
+        ok = super().checkout()
+        if ok and fresh:
+            self._local.cursor = RecordingCursor(self._local.cursor, self)
+        return ok
+
+    def record(self, sql: str, params):
+        if self.case is not None and not _UNPLANNED.match(sql):
+            self.recorded.setdefault(self.case, {}).setdefault(sql, tuple(params or ()))
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """Map table aliases (and table names) in sql to table names."""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _nested_loop_rows(steps: List[Tuple[object, float, float]]) -> int:
+    """Estimated rows examined by nested-loop steps of (group, rows, fraction kept).
+
+    Within a group each step runs once per row the steps before it produce;
+    groups (separate SELECTs) add up.
+    """
+    total = 0.0
+    prefix: Dict[object, float] = {}
+    for group, rows, kept in steps:
+        loops = prefix.get(group, 1.0)
+        total += loops * rows
+        prefix[group] = loops * max(rows * kept, 1.0)
+    return int(round(total))
+
+
+def explain_mysql(cursor, sql: str, params: tuple) -> Dict:
+    """EXPLAIN a statement on MySQL: access steps, problems and rows examined."""
+    cursor.execute("EXPLAIN " + sql, params)
+    rows = cursor.fetchall()
+    steps, problems, loops = [], [], []
+    for row in rows:
+        table = row.get('table') or '-'
+        access = row.get('type') or '-'
+        extra = row.get('Extra') or ''
+        estimate = row.get('rows') or 0
+        steps.append(f"{table}: {access} via {row.get('key') or '-'} (~{estimate} rows)"
+                     + (f" [{extra}]" if extra else ""))
+        # <derivedN>/<unionN,M> are the small materialized results of subqueries
+        if table.startswith('<'):
+            continue
+        if access == 'ALL':
+            problems.append(f"full table scan of {table}")
+        if 'Using filesort' in extra:
+            problems.append(f"filesort on {table}")
+        loops.append((row.get('id'), float(estimate), float(row.get('filtered') or 100.0) / 100.0))
+    return {'plan': steps, 'problems': problems, 'rows_examined': _nested_loop_rows(loops)}
+
+
+def sqlite_statistics(cursor) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+    """Row counts per table and rows-per-key-prefix per index from sqlite_stat1."""
+    cursor.execute("ANALYZE")
+    cursor.execute("SELECT tbl, idx, stat FROM sqlite_stat1")
+    table_rows, index_stats = {}, {}
+    for row in cursor.fetchall():
+        numbers = [int(part) for part in row['stat'].split() if part.isdigit()]
+        if not numbers:
+            continue
+        table_rows[row['tbl']] = max(table_rows.get(row['tbl'], 0), numbers[0])
+        if row['idx']:
+            index_stats[row['idx']] = numbers
+    return table_rows, index_stats
+
+
+def explain_sqlite(cursor, sql: str, params: tuple, table_rows: Dict[str, int],
+                   index_stats: Dict[str, List[int]]) -> Dict:
+    """EXPLAIN QUERY PLAN a statement on SQLite: access steps, problems and rows examined."""
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    rows = cursor.fetchall()
+    aliases = _aliases(sql)
+    subqueries = set()
+    steps, problems, loops = [], [], []
+    for row in rows:
+        detail = row['detail']
+        steps.append(detail)
+        subquery = _SQLITE_SUBQUERY.match(detail)
+        if subquery:
+            subqueries.add(subquery.group(1))
+            continue
+        if detail.startswith('USE TEMP B-TREE FOR'):
+            problems.append(f"filesort ({detail.lower()})")
+            continue
+        access = _SQLITE_ACCESS.match(detail)
+        if not access:
+            continue
+        kind, name, alias, index, terms = access.groups()
+        if name in subqueries or (alias and alias in subqueries) or name == 'CONSTANT':
+            continue
+        table = aliases.get(name, name)
+        if kind == 'SCAN':
+            problems.append(f"full table scan of {table}"
+                            + (f" (index {index} without a constraint)" if index else ""))
+            estimate = table_rows.get(table, 0)
+        elif index:
+            # Average rows per value of the equality-constrained index prefix
+            equalities = len(re.findall(r"\w+=\?", terms or ""))
+            stats = index_stats.get(index, [])
+            estimate = stats[equalities] if equalities < len(stats) else (stats[-1] if stats else 1)
+        else:
+            # Primary key lookup
+            estimate = 1
+        loops.append((row['parent'], float(estimate), 1.0))
+    return {'plan': steps, 'problems': problems, 'rows_examined': _nested_loop_rows(loops)}
+
+
+def check_plans(db_ops: RecordingOperations, only: Optional[str] = None) -> Dict:
+    """Run every method case once, then EXPLAIN each statement it executed."""
+    fx = Fixtures(db_ops)
+    cases = method_cases(db_ops, fx)
+    for name, fn in cases.items():
+        if only and only not in name:
+            continue
+        db_ops.case = name
+        try:
+            fn()
+        except Exception as e:
+            print(f"  {name}: raised {type(e).__name__}: {e}")
+        finally:
+            db_ops.case = None
+            db_ops.release()
+
+    cursor = db_ops.cursor
+    sqlite = db_ops.backend.name == 'sqlite'
+    if sqlite:
+        table_rows, index_stats = sqlite_statistics(cursor)
+
+    report = {}
+    for name, statements in db_ops.recorded.items():
+        report[name] = []
+        for sql, params in statements.items():
+            if sqlite:
+                result = explain_sqlite(cursor, sql, params, table_rows, index_stats)
+            else:
+                result = explain_mysql(cursor, sql, params)
+            if name in ALLOWED_SCANS:
+                result['allowed'] = ALLOWED_SCANS[name]
+            result['sql'] = " ".join(sql.split())
+            report[name].append(result)
+    db_ops.connection.rollback()
+    return report
+
+
+def print_report(report: Dict) -> int:
+    """Print rows examined and plan per query; return the number of failing queries."""
+    failures = 0
+    print(f"\n{'method':<32} {'est. rows':>10}  plan")
+    for name, results in report.items():
+        for index, result in enumerate(results):
+            label = name if index == 0 else ""
+            status = ""
+            if result['problems']:
+                if result.get('allowed'):
+                    status = f"  (allowed: {result['allowed']})"
+                else:
+                    status = "  FAIL: " + "; ".join(result['problems'])
+                    failures += 1
+            print(f"{label:<32} {result['rows_examined']:>10,}  {' | '.join(result['plan'])}{status}")
+            if status.startswith("  FAIL"):
+                print(f"{'':<32} {'':>10}  {result['sql']}")
+    return failures
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Check DatabaseOperations query plans for scans and filesorts.")
+    parser.add_argument("--scale", default="small", choices=list(SCALES),
+                        help="dataset size to seed (default small)")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="check against the data already in the database instead of reseeding")
+    parser.add_argument("--seed", type=int, default=42, help="data generator seed (default 42)")
+    parser.add_argument("--only", help="only check methods whose name contains this text")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=None,
+                        help="database backend (default: RIDESHARE_DB_BACKEND or mysql)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="SQLite database file (default: RIDESHARE_SQLITE_PATH or rideshare.db)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    db_ops = RecordingOperations(backend=create_backend(args.backend, path=args.sqlite_path))
+    if not db_ops.connect():
+        print("Failed to connect to database.")
+        sys.exit(1)
+
+    try:
+        if not args.no_seed:
+            riders, drivers, rides = SCALES[args.scale]
+            print(f"Seeding {args.scale}: {riders:,} riders, {drivers:,} drivers, {rides:,} rides")
+            generate(db_ops.connection, riders, drivers, rides, seed=args.seed, reset=True,
+                     chunk_size=5000, report=lambda message: None)
+            db_ops.release()
+        if db_ops.backend.name != 'sqlite':
+            # Fresh index statistics so the row estimates describe this dataset
+            for table in ('USER', 'DRIVER', 'RIDER', 'RIDE', 'DRIVER_RATING_STATS'):
+                db_ops.cursor.execute(f"ANALYZE TABLE {table}")
+                db_ops.cursor.fetchall()
+        report = check_plans(db_ops, args.only)
+    finally:
+        db_ops.disconnect()
+
+    failures = print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if failures:
+        print(f"\n{failures} quer{'y' if failures == 1 else 'ies'} fell back to a full scan or filesort.")
+        sys.exit(1)
+    print("\nEvery query uses an index.")
+
+
+if __name__ == "__main__":
+    main()
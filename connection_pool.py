@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Connection Pool
+Bounded, thread-safe database connection pool for the rideshare application.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait timeout."""
+
+
+class PooledConnection:
+    """A raw database connection plus the bookkeeping the pool needs."""
+
+    def __init__(self, raw):
+        """Wrap a freshly opened connection."""
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Prepared statements for this connection (statement_cache.StatementRegistry)
+        self.statements = None
+
+
+class ConnectionPool:
+    """Hands out at most max_size connections, recycling old or broken ones."""
+
+    def __init__(self, factory: Callable, max_size: int = 5,
+                 max_lifetime: float = 1800.0, validate_after: float = 30.0,
+                 validator: Callable = None, wait_timeout: float = 10.0):
+        """Create an empty pool; connections are opened lazily by factory()."""
+        self.factory = factory
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self.validator = validator or (lambda conn: conn.is_connected())
+        self.wait_timeout = wait_timeout
+
+        self._idle: List[PooledConnection] = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Metrics
+        self.created = 0
+        self.recycled = 0
+        self.invalidated = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """Check a connection out of the pool, blocking while all are in use."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot before opening so other threads
+                    # cannot overshoot max_size while we are connecting.
+                    self._size += 1
+                    pooled = None
+                    break
+                waited = True
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No connection available after {timeout:.1f}s")
+                self._cond.wait(remaining)
+
+        wait_time = time.monotonic() - start
+        if pooled is not None:
+            pooled = self._check_health(pooled)
+        if pooled is None:
+            try:
+                pooled = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        pooled.last_used = time.monotonic()
+        return pooled
+
+    def release(self, pooled: PooledConnection, discard: bool = False):
+        """Return a connection to the pool, or close it if discard is set."""
+        if discard or self._closed:
+            self._close_raw(pooled)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_raw(pooled)
+
+    def stats(self) -> Dict:
+        """Return a snapshot of pool size and wait metrics."""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self.created,
+                'recycled': self.recycled,
+                'invalidated': self.invalidated,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'total_wait_seconds': self.total_wait_time,
+                'max_wait_seconds': self.max_wait_time,
+                'avg_wait_seconds': self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+            }
+
+    def _open(self) -> PooledConnection:
+        """Open a new connection through the factory."""
+        raw = self.factory()
+        with self._cond:
+            self.created += 1
+        logger.debug("Opened pooled connection (%d created so far)", self.created)
+        return PooledConnection(raw)
+
+    def _check_health(self, pooled: PooledConnection) -> Optional[PooledConnection]:
+        """Return pooled if still usable, otherwise close it and return None."""
+        now = time.monotonic()
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            self._close_raw(pooled)
+            with self._cond:
+                self.recycled += 1
+            return None
+
+        if now - pooled.last_used > self.validate_after:
+            try:
+                healthy = self.validator(pooled.raw)
+            except Exception:
+                healthy = False
+            if not healthy:
+                logger.warning("Discarding pooled connection that failed validation")
+                self._close_raw(pooled)
+                with self._cond:
+                    self.invalidated += 1
+                return None
+        return pooled
+
+    def _close_raw(self, pooled: PooledConnection):
+        """Close the underlying connection, ignoring errors."""
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Database Backends
+Connection backends for DatabaseOperations: MySQL (the default) and an
+embedded SQLite database for fast local runs without a database server.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Dict, Optional
+
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+except ImportError:  # SQLite-only installs
+    mysql = None
+    MySQLError = None
+
+# Catch-all for driver errors: `except Error` works for whichever backend is in use
+Error = tuple(cls for cls in (MySQLError, sqlite3.Error) if cls is not None)
+
+SQLITE_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_sqlite.sql')
+# Compiled statements kept per SQLite connection (the sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+
+class MySQLBackend:
+    """Opens mysql.connector connections (requires a running MySQL server)."""
+
+    name = 'mysql'
+    needs_password = True
+    # Supports server-side prepared cursors (statement_cache.py)
+    server_prepared = True
+
+    def __init__(self, host: str = "localhost", database: str = "rideshare_db",
+                 user: str = "root", password: str = None):
+        """Store connection settings; password may be filled in later."""
+        if mysql is None:
+            raise ImportError("mysql-connector-python is required for the MySQL backend")
+        self.host = host
+        self.database = database
+        self.user = user
+        self.password = password
+
+    def connect(self):
+        """Open a new raw MySQL connection."""
+        return mysql.connector.connect(
+            host=self.host,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+            autocommit=False
+        )
+
+    def validate(self, connection) -> bool:
+        """Ping the server."""
+        return connection.is_connected()
+
+    def describe(self) -> str:
+        return f"MySQL at {self.host} as {self.user} to database {self.database}"
+
+
+# ==================== SQLITE ====================
+
+def _convert_timestamp(value: bytes):
+    text = value.decode()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _convert_date(value: bytes):
+    text = value.decode()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+# Return DATE/DATETIME/TIMESTAMP columns as Python objects, like mysql.connector
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+sqlite3.register_converter("DATETIME", _convert_timestamp)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+_PLACEHOLDER = re.compile(r"%s")
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE)
+
+
+def _sqlite_now() -> str:
+    """SQL NOW(): local time, matching MySQL's session time zone default."""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _dict_row(cursor, row) -> Dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """DB-API cursor that accepts the MySQL-flavoured SQL DatabaseOperations uses.
+
+    Translates %s placeholders to ?, and turns SELECT ... FOR UPDATE into a
+    write lock by opening an IMMEDIATE transaction first.
+    """
+
+    # Translated statements are shared by every cursor; the SQL text set is small
+    _translations: Dict[str, tuple] = {}
+
+    def __init__(self, connection: "SQLiteConnection", dictionary: bool = False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    @classmethod
+    def _translate(cls, operation: str) -> tuple:
+        translated = cls._translations.get(operation)
+        if translated is None:
+            locking = bool(_FOR_UPDATE.search(operation))
+            sql = _FOR_UPDATE.sub("", operation)
+            sql = _PLACEHOLDER.sub("?", sql)
+            translated = cls._translations[operation] = (sql, locking)
+        return translated
+
+    def execute(self, operation: str, params=()):
+        sql, locking = self._translate(operation)
+        if locking and not self._connection.raw.in_transaction:
+            self._cursor.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(sql, tuple(params or ()))
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int = None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Wraps sqlite3.Connection with the mysql.connector methods we rely on."""
+
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+        self._closed = False
+
+    def cursor(self, dictionary: bool = False, **kwargs) -> SQLiteCursor:
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def is_connected(self) -> bool:
+        return not self._closed
+
+    def close(self):
+        self._closed = True
+        self.raw.close()
+
+
+class SQLiteBackend:
+    """Opens connections to an embedded SQLite database file in WAL mode."""
+
+    name = 'sqlite'
+    needs_password = False
+    # No server to prepare on; statements are compiled into the driver's cache
+    server_prepared = False
+
+    def __init__(self, path: str = "rideshare.db", schema_path: str = SQLITE_SCHEMA_PATH,
+                 busy_timeout: float = 30.0, create_schema: bool = True):
+        """Use path (":memory:" for a private shared in-memory database)."""
+        self.path = path
+        self.schema_path = schema_path
+        self.busy_timeout = busy_timeout
+        self.create_schema = create_schema
+        self._schema_checked = False
+        self._lock = threading.Lock()
+        # Keeps a shared in-memory database alive between pooled connections
+        self._keepalive = None
+
+    def _open_raw(self) -> sqlite3.Connection:
+        if self.path == ":memory:":
+            target, uri = f"file:rideshare_{id(self)}?mode=memory&cache=shared", True
+        else:
+            target, uri = self.path, False
+        raw = sqlite3.connect(target, uri=uri, timeout=self.busy_timeout,
+                              detect_types=sqlite3.PARSE_DECLTYPES,
+                              check_same_thread=False,
+                              cached_statements=STATEMENT_CACHE_SIZE)
+        raw.execute("PRAGMA foreign_keys = ON")
+        if self.path != ":memory:":
+            raw.execute("PRAGMA journal_mode = WAL")
+            raw.execute("PRAGMA synchronous = NORMAL")
+        raw.create_function("NOW", 0, _sqlite_now)
+        return raw
+
+    def connect(self) -> SQLiteConnection:
+        """Open a new connection, creating the schema on first use."""
+        raw = self._open_raw()
+        if self.create_schema and not self._schema_checked:
+            with self._lock:
+                if not self._schema_checked:
+                    if self.path == ":memory:" and self._keepalive is None:
+                        self._keepalive = self._open_raw()
+                    self._ensure_schema(raw)
+                    self._schema_checked = True
+        return SQLiteConnection(raw)
+
+    def _ensure_schema(self, raw: sqlite3.Connection):
+        exists = raw.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'RIDE'"
+        ).fetchone()
+        if not exists:
+            with open(self.schema_path) as f:
+                raw.executescript(f.read())
+            raw.commit()
+
+    def validate(self, connection: SQLiteConnection) -> bool:
+        """Run a trivial query to make sure the connection still works."""
+        try:
+            connection.raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def describe(self) -> str:
+        return f"SQLite database {self.path}"
+
+
+def create_backend(name: str = None, **options):
+    """Build a backend by name ("mysql" or "sqlite").
+
+    Unset options fall back to the RIDESHARE_DB_BACKEND and
+    RIDESHARE_SQLITE_PATH environment variables.
+    """
+    name = (name or os.environ.get('RIDESHARE_DB_BACKEND') or 'mysql').lower()
+    if name == 'sqlite':
+        path = options.get('path') or os.environ.get('RIDESHARE_SQLITE_PATH', 'rideshare.db')
+        return SQLiteBackend(path)
+    if name == 'mysql':
+        return MySQLBackend(**{key: value for key, value in options.items()
+                               if key in ('host', 'database', 'user', 'password')})
+    raise ValueError(f"Unknown database backend: {name}")
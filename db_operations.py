@@ -1,42 +1,223 @@
 #!/usr/bin/env python3
 """
 CPSC 408 Assignment 05 - Database Operations
-Database operations module for the rideshare application using MySQL.
+Database operations module for the rideshare application using MySQL
+(or the embedded SQLite backend, see db_backends.py).
 
 Authors:
 - Gabe Giancarlo (2405449) - giancarlo@chapman.edu
 - Gustavo de Moraes (002427902) - demoraes@chapman.edu
 """
 
-import mysql.connector
-from mysql.connector import Error
-from typing import List, Tuple, Optional, Dict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Tuple, Optional, Dict
+from cache import LRUCache
+from connection_pool import ConnectionPool
+from db_backends import Error, MySQLBackend
+from fare_estimator import RateCard, estimate
+from ride_events import RideEventHub
+from spatial_index import DriverSpatialIndex
+from statement_cache import StatementRegistry, StatementStats
+import functools
 import getpass
 import logging
+import random
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Recomputes DRIVER_RATING_STATS rows from RIDE. Format with driver_filter=""
+# for every driver or "WHERE d.driver_id = %s" for a single driver.
+RATING_STATS_REBUILD_SQL = """
+INSERT INTO DRIVER_RATING_STATS (driver_id, rating_sum, rating_count,
+                                 rating_1_count, rating_2_count, rating_3_count,
+                                 rating_4_count, rating_5_count)
+SELECT d.driver_id,
+       COALESCE(SUM(r.rating), 0),
+       COUNT(r.rating),
+       COALESCE(SUM(CASE WHEN r.rating = 1 THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN r.rating = 2 THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN r.rating = 3 THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN r.rating = 4 THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN r.rating = 5 THEN 1 ELSE 0 END), 0)
+FROM DRIVER d
+LEFT JOIN RIDE r ON r.driver_id = d.driver_id AND r.rating IS NOT NULL
+{driver_filter}
+GROUP BY d.driver_id
+"""
+
+# Statement names (for statement_stats()) of the single-ride lookups by view
+RIDE_VIEW_STATEMENTS = {
+    'ride': 'get_ride_by_id',
+    'rider_view': 'get_ride_by_id[rider]',
+    'driver_view': 'get_driver_ride_by_id',
+}
+
+# Dashboard view queries: profile, user, rating totals and the newest rides
+# in one round trip. The rides come from a LIMITed derived table joined onto
+# the single profile row, so each page row carries the profile columns plus
+# recent_* ride columns (all NULL when there are no rides yet). The handful of
+# rows is put back in order in Python rather than by a sort in the database.
+DRIVER_DASHBOARD_SQL = """
+SELECT d.*, u.username, u.email, u.phone_number, u.full_name,
+       s.rating_sum, s.rating_count, s.rating_1_count, s.rating_2_count,
+       s.rating_3_count, s.rating_4_count, s.rating_5_count,
+       rr.ride_id AS recent_ride_id, rr.ride_status AS recent_ride_status,
+       rr.pickup_location AS recent_pickup_location,
+       rr.dropoff_location AS recent_dropoff_location,
+       rr.fare_amount AS recent_fare_amount, rr.rating AS recent_rating,
+       rr.created_at AS recent_created_at, rr.rider_name AS recent_rider_name
+FROM DRIVER d
+JOIN USER u ON u.user_id = d.user_id
+LEFT JOIN DRIVER_RATING_STATS s ON s.driver_id = d.driver_id
+LEFT JOIN (
+    SELECT r.ride_id, r.ride_status, r.pickup_location, r.dropoff_location,
+           r.fare_amount, r.rating, r.created_at, ru.full_name AS rider_name
+    FROM RIDE r
+    JOIN RIDER rd ON r.rider_id = rd.rider_id
+    JOIN USER ru ON rd.user_id = ru.user_id
+    WHERE r.driver_id = %s
+    ORDER BY r.created_at DESC, r.ride_id DESC
+    LIMIT %s
+) rr ON 1 = 1
+WHERE d.driver_id = %s
+"""
+
+RIDER_DASHBOARD_SQL = """
+SELECT rd.*, u.username, u.email, u.phone_number, u.full_name,
+       (SELECT COUNT(*) FROM RIDE x
+        WHERE x.rider_id = rd.rider_id AND x.ride_status = 'completed'
+          AND x.rating IS NULL) AS awaiting_rating,
+       rr.ride_id AS recent_ride_id, rr.ride_status AS recent_ride_status,
+       rr.pickup_location AS recent_pickup_location,
+       rr.dropoff_location AS recent_dropoff_location,
+       rr.fare_amount AS recent_fare_amount, rr.rating AS recent_rating,
+       rr.created_at AS recent_created_at, rr.driver_name AS recent_driver_name
+FROM RIDER rd
+JOIN USER u ON u.user_id = rd.user_id
+LEFT JOIN (
+    SELECT r.ride_id, r.ride_status, r.pickup_location, r.dropoff_location,
+           r.fare_amount, r.rating, r.created_at, du.full_name AS driver_name
+    FROM RIDE r
+    JOIN DRIVER d ON r.driver_id = d.driver_id
+    JOIN USER du ON d.user_id = du.user_id
+    WHERE r.rider_id = %s
+    ORDER BY r.created_at DESC, r.ride_id DESC
+    LIMIT %s
+) rr ON 1 = 1
+WHERE rd.rider_id = %s
+"""
+
+# The rating page: the rider's most recent ride plus their completed rides
+# awaiting a rating, in one round trip. Each branch is index-backed
+# (idx_rider_created, idx_rider_unrated); view_part tells them apart.
+RIDER_RATING_VIEW_SQL = """
+SELECT * FROM (
+    SELECT 'latest' AS view_part, r.*, d.vehicle_make, d.vehicle_model, u.full_name AS driver_name
+    FROM RIDE r
+    JOIN DRIVER d ON r.driver_id = d.driver_id
+    JOIN USER u ON d.user_id = u.user_id
+    WHERE r.rider_id = %s
+    ORDER BY r.created_at DESC, r.ride_id DESC
+    LIMIT 1
+) latest
+UNION ALL
+SELECT * FROM (
+    SELECT 'unrated' AS view_part, r.*, d.vehicle_make, d.vehicle_model, u.full_name AS driver_name
+    FROM RIDE r
+    JOIN DRIVER d ON r.driver_id = d.driver_id
+    JOIN USER u ON d.user_id = u.user_id
+    WHERE r.rider_id = %s AND r.rating IS NULL AND r.ride_status = 'completed'
+    ORDER BY r.created_at DESC, r.ride_id DESC
+    LIMIT %s
+) unrated
+"""
+
+# USER columns the dashboard views carry (never the password)
+VIEW_USER_COLUMNS = ('user_id', 'username', 'email', 'phone_number', 'full_name')
+
+# Claims an active driver for a new ride; only one transaction can win the row
+CLAIM_DRIVER_SQL = "UPDATE DRIVER SET driver_mode = 'busy' WHERE driver_id = %s AND driver_mode = 'active'"
+
+
+class UnitOfWork:
+    """The open transaction shared by calls inside DatabaseOperations.transaction()."""
+    
+    def __init__(self):
+        # Set by a failed operation (or the caller) to roll the whole unit back
+        self.failed = False
+        # (callback, always) pairs run when the unit ends; always=False only after a commit
+        self.callbacks: List[Tuple[Callable, bool]] = []
+
 
 class DatabaseOperations:
     """Handles all database operations for the rideshare application."""
     
     def __init__(self, host: str = "localhost", database: str = "rideshare_db",
-                 user: str = "root", password: str = None):
-        """Initialize database connection."""
+                 user: str = "root", password: str = None, pool_size: int = 5,
+                 max_lifetime: float = 1800.0, ride_cache_size: int = 2048,
+                 profile_cache_size: int = 4096, profile_cache_ttl: float = 300.0,
+                 backend=None, rate_card: RateCard = None, events: RideEventHub = None,
+                 prepared_statements: bool = True):
+        """Initialize database settings; connections are pooled per thread.
+        
+        backend defaults to MySQL with the given host/database/user/password;
+        pass a db_backends.SQLiteBackend to run against an embedded database.
+        rate_card prices new rides (default: RateCard.from_env()). Ride
+        creations, status changes and ratings are published to events.
+        prepared_statements runs the hot read queries as statements prepared
+        once per connection (see statement_cache.py).
+        """
         self.host = host
         self.database = database
         self.user = user
         self.password = password
-        self.connection = None
-        self.cursor = None
+        self.backend = backend
+        self.pool_size = pool_size
+        self.max_lifetime = max_lifetime
+        self.pool = None
+        self._local = threading.local()
+        self.driver_index = DriverSpatialIndex()
+        self._driver_index_loaded = False
+        self.ride_cache = LRUCache(ride_cache_size)
+        self.profile_cache = LRUCache(profile_cache_size, ttl=profile_cache_ttl)
+        self.rate_card = rate_card or RateCard.from_env()
+        self.events = events or RideEventHub()
+        self.prepared_statements = prepared_statements
+        self.statements = StatementStats()
+        # Called with a ride_id whenever a ride's cached views are dropped
+        # (e.g. the web app's rendered fragment cache)
+        self.ride_listeners: List[Callable[[int], None]] = []
+    
+    @property
+    def connection(self):
+        """Connection checked out by the current thread (checked out on demand)."""
+        if getattr(self._local, 'pooled', None) is None and self.pool is not None:
+            self.checkout()
+        pooled = getattr(self._local, 'pooled', None)
+        return pooled.raw if pooled else None
+    
+    @property
+    def cursor(self):
+        """Dictionary cursor bound to the current thread's connection."""
+        if getattr(self._local, 'pooled', None) is None and self.pool is not None:
+            self.checkout()
+        return getattr(self._local, 'cursor', None)
+    
+    def _open_connection(self):
+        """Open a new raw connection through the backend; used as the pool factory."""
+        return self.backend.connect()
     
     def connect(self):
-        """Establish database connection."""
-        logger.debug(f"connect() called - host={self.host}, database={self.database}, user={self.user}")
-        logger.debug(f"password is None: {self.password is None}")
+        """Create the connection pool and check out a connection for this thread."""
+        logger.debug("connect() called - host=%s, database=%s, user=%s",
+                     self.host, self.database, self.user)
         
         try:
-            if self.password is None:
+            if self.backend is None:
+                self.backend = MySQLBackend(self.host, self.database, self.user, self.password)
+            if self.backend.needs_password and self.backend.password is None:
                 # Check environment variable first
                 import os
                 env_password = os.environ.get('MYSQL_PASSWORD')
@@ -46,107 +227,298 @@ class DatabaseOperations:
                 else:
                     logger.info("Password not set, prompting user...")
                     try:
-                        self.password = getpass.getpass(f"Enter MySQL password for {self.user} (or press Enter for no password): ")
+                        self.password = getpass.getpass(f"Enter MySQL password for {self.backend.user} (or press Enter for no password): ")
                         logger.debug("Password obtained (length hidden)")
                     except (EOFError, KeyboardInterrupt):
                         # If no input available (non-interactive), try empty password
                         self.password = ""
                         logger.info("No password input available, attempting connection with empty password")
+                self.backend.password = self.password
             
-            logger.info(f"Attempting to connect to MySQL at {self.host} as {self.user} to database {self.database}")
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                autocommit=False
-            )
+            logger.info("Attempting to connect to %s", self.backend.describe())
+            if self.pool is None:
+                self.pool = ConnectionPool(self._open_connection,
+                                           max_size=self.pool_size,
+                                           max_lifetime=self.max_lifetime,
+                                           validator=self.backend.validate)
             
-            logger.debug(f"mysql.connector.connect() returned: {self.connection}")
-            
-            if self.connection and self.connection.is_connected():
-                logger.info("MySQL connection established successfully")
-                logger.debug(f"Connection ID: {self.connection.connection_id}")
-                
-                self.cursor = self.connection.cursor(dictionary=True)
-                logger.info("Database cursor created successfully")
-                logger.debug(f"Cursor type: {type(self.cursor)}")
-                
+            if self.checkout():
+                logger.info("%s connection pool ready (max %d connections)",
+                            self.backend.name, self.pool_size)
                 return True
             else:
-                logger.error("Connection object is None or not connected")
-                logger.error(f"connection: {self.connection}")
-                logger.error(f"is_connected: {self.connection.is_connected() if self.connection else 'N/A'}")
+                logger.error("Could not check out a connection from the pool")
                 return False
                 
         except Error as e:
-            logger.exception(f"MySQL Error connecting: {e}")
-            logger.error(f"Error type: {type(e)}")
-            logger.error(f"Error code: {e.errno if hasattr(e, 'errno') else 'N/A'}")
-            logger.error(f"Error message: {e.msg if hasattr(e, 'msg') else 'N/A'}")
-            print(f"Error connecting to MySQL: {e}")
+            logger.exception("Database error connecting (%s, code %s): %s",
+                             type(e).__name__, getattr(e, 'errno', 'N/A'), e)
+            print(f"Error connecting to database: {e}")
+            self._discard_pool()
             return False
         except Exception as e:
-            logger.exception(f"Unexpected exception during connection: {e}")
-            logger.error(f"Exception type: {type(e)}")
-            print(f"Unexpected error connecting to MySQL: {e}")
+            logger.exception("Unexpected %s during connection: %s", type(e).__name__, e)
+            print(f"Unexpected error connecting to database: {e}")
+            self._discard_pool()
+            return False
+    
+    def checkout(self) -> bool:
+        """Check out a pooled connection for the current thread (idempotent)."""
+        if getattr(self._local, 'pooled', None) is not None:
+            return True
+        if self.pool is None:
             return False
+        
+        pooled = self.pool.acquire()
+        try:
+            cursor = pooled.raw.cursor(dictionary=True)
+        except Exception:
+            self.pool.release(pooled, discard=True)
+            raise
+        self._local.pooled = pooled
+        self._local.cursor = cursor
+        return True
+    
+    def release(self):
+        """Return the current thread's connection to the pool."""
+        pooled = getattr(self._local, 'pooled', None)
+        if pooled is None:
+            return
+        cursor = self._local.cursor
+        self._local.pooled = None
+        self._local.cursor = None
+        
+        discard = False
+        try:
+            cursor.close()
+            # End any read snapshot left open so the next borrower sees fresh data
+            pooled.raw.rollback()
+        except Exception as e:
+            logger.warning("Discarding connection that failed on release: %s", e)
+            discard = True
+        if self.pool is not None:
+            self.pool.release(pooled, discard=discard)
+    
+    def pool_stats(self) -> Dict:
+        """Return connection pool metrics (empty if not connected)."""
+        return self.pool.stats() if self.pool else {}
+    
+    def statement_stats(self) -> Dict:
+        """Return prepare vs. execute counts for the prepared hot queries."""
+        return self.statements.snapshot()
+    
+    def _execute_statement(self, name: str, query: str, params: Tuple = ()):
+        """Execute a hot query, prepared once per pooled connection and reused.
+        
+        Returns something with fetchone()/fetchall() giving dict rows: the
+        prepared statement, or the plain cursor when preparation is disabled.
+        """
+        cursor = self.cursor
+        pooled = getattr(self._local, 'pooled', None)
+        if not self.prepared_statements or pooled is None:
+            cursor.execute(query, params)
+            return cursor
+        if pooled.statements is None:
+            pooled.statements = StatementRegistry(pooled.raw, self.statements,
+                                                  server_side=self.backend.server_prepared)
+        return pooled.statements.execute(name, query, params)
+    
+    def _discard_pool(self):
+        """Drop a pool that failed to produce a working connection."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
     
     def disconnect(self):
-        """Close database connection."""
-        if self.connection and self.connection.is_connected():
-            if self.cursor:
-                self.cursor.close()
-            self.connection.close()
+        """Release this thread's connection and close the pool."""
+        self.release()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+    
+    # ==================== TRANSACTIONS ====================
+    
+    @contextmanager
+    def transaction(self):
+        """Group several operations into one transaction with a single commit.
+        
+        Methods called inside the block write into the open transaction
+        instead of committing on their own; their events and spatial index
+        updates wait for the commit. The block starts from a fresh snapshot,
+        commits when it exits normally and rolls back when it raises or when
+        an operation in it failed (the yielded UnitOfWork's `failed` flag).
+        A nested transaction() joins the outer one.
+        
+            with db_ops.transaction() as unit:
+                user_id = db_ops.create_user(...)
+                if not user_id or not db_ops.create_rider(user_id):
+                    unit.failed = True
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            yield unit
+            return
+        
+        unit = UnitOfWork()
+        self.connection.rollback()
+        self._local.unit = unit
+        committed = False
+        try:
+            yield unit
+            if not unit.failed:
+                self.connection.commit()
+                committed = True
+        finally:
+            self._local.unit = None
+            if not committed:
+                try:
+                    self.connection.rollback()
+                except Exception as rollback_error:
+                    logger.exception("Error during rollback: %s", rollback_error)
+            for callback, always in unit.callbacks:
+                if committed or always:
+                    callback()
+    
+    @property
+    def in_transaction(self) -> bool:
+        """Whether the current thread is inside a transaction() block."""
+        return getattr(self._local, 'unit', None) is not None
+    
+    def _commit(self):
+        """Commit, unless an enclosing transaction() will commit later."""
+        if not self.in_transaction:
+            self.connection.commit()
+    
+    def _rollback(self):
+        """Roll back after a failed write; inside transaction() this fails the whole unit."""
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            unit.failed = True
+        self.connection.rollback()
+    
+    def _after_commit(self, callback: Callable):
+        """Run callback now, or after the enclosing transaction() commits."""
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            callback()
+        else:
+            unit.callbacks.append((callback, False))
+    
+    def _invalidate(self, cache: LRUCache, *keys):
+        """Drop cache keys now and, inside transaction(), again when it ends.
+        
+        The second pass drops rows cached in the meantime from the unit's own
+        uncommitted writes or from the state it replaced.
+        """
+        cache.invalidate(*keys)
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            unit.callbacks.append((lambda: cache.invalidate(*keys), True))
+    
+    # ==================== CACHING ====================
+    
+    def _get_cached_profile(self, key: Tuple, query: str, params: Tuple,
+                            label: str) -> Optional[Dict]:
+        """Read-through lookup of a USER/DRIVER/RIDER row in the profile cache.
+        
+        Callers get a copy, so mutating a returned row never touches the cache.
+        Missing rows are not cached.
+        """
+        cached = self.profile_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
+        try:
+            result = self._execute_statement(f"get_{label}_by_id", query, params).fetchone()
+        except Error as e:
+            print(f"Error retrieving {label}: {e}")
+            return None
+        if result:
+            self.profile_cache.put(key, dict(result))
+        return result
+    
+    def _get_cached_profile_by_user(self, user_id: int, kind: str, query: str) -> Optional[Dict]:
+        """Look up a DRIVER or RIDER row by user_id through the profile cache.
+        
+        The cache maps user_id to the profile id (which never changes) and
+        shares the row entry with the by-id lookup, so invalidating the
+        profile id is enough after a write.
+        """
+        profile_id = self.profile_cache.get((f'{kind}_for_user', user_id))
+        if profile_id is not None:
+            cached = self.profile_cache.get((kind, profile_id))
+            if cached is not None:
+                return dict(cached)
+        
+        try:
+            result = self._execute_statement(f"get_{kind}_by_user_id", query, (user_id,)).fetchone()
+        except Error as e:
+            print(f"Error retrieving {kind}: {e}")
+            return None
+        if result:
+            profile_id = result[f'{kind}_id']
+            self.profile_cache.put((f'{kind}_for_user', user_id), profile_id)
+            self.profile_cache.put((kind, profile_id), dict(result))
+        return result
+    
+    def clear_caches(self):
+        """Forget every cached row and reload the spatial index on next use.
+        
+        Needed after data is changed behind this object's back, e.g. bulk loads.
+        """
+        self.profile_cache.clear()
+        self.ride_cache.clear()
+        self.driver_index.clear()
+        self._driver_index_loaded = False
+    
+    def cache_stats(self) -> Dict:
+        """Return hit/miss counters for the profile and ride caches."""
+        return {
+            'profile': self.profile_cache.stats(),
+            'ride': self.ride_cache.stats(),
+        }
     
     # ==================== USER OPERATIONS ====================
     
     def create_user(self, username: str, password: str, email: str, 
                    phone_number: str, full_name: str) -> Optional[int]:
         """Create a new user account."""
-        logger.debug(f"create_user() called - username: {username}, email: {email}, full_name: {full_name}")
-        logger.debug(f"self.cursor is None: {self.cursor is None}")
-        logger.debug(f"self.connection is None: {self.connection is None}")
+        logger.debug("create_user() called - username: %s", username)
         
         if self.cursor is None:
             logger.error("Cursor is None in create_user()")
-            logger.error(f"Connection state: {self.connection}")
             raise AttributeError("Database cursor is not initialized. Connection failed.")
         
         query = """
         INSERT INTO USER (username, password, email, phone_number, full_name)
         VALUES (%s, %s, %s, %s, %s)
         """
-        logger.debug(f"Executing INSERT query with params: ({username}, {email}, {full_name})")
         
         try:
             self.cursor.execute(query, (username, password, email, phone_number, full_name))
-            logger.debug(f"INSERT executed, rowcount: {self.cursor.rowcount}")
-            
-            self.connection.commit()
-            logger.info("Transaction committed successfully")
-            
             user_id = self.cursor.lastrowid
-            logger.info(f"User created with ID: {user_id}")
+            self._commit()
+            
+            self._invalidate(self.profile_cache, ('user', user_id))
+            logger.info("User created with ID: %s", user_id)
             return user_id
             
         except Error as e:
-            logger.exception(f"MySQL Error creating user: {e}")
-            logger.error(f"Error type: {type(e)}, Error code: {e.errno if hasattr(e, 'errno') else 'N/A'}")
-            logger.error(f"Error message: {e.msg if hasattr(e, 'msg') else 'N/A'}")
+            logger.exception("Database error creating user (%s, code %s): %s",
+                             type(e).__name__, getattr(e, 'errno', 'N/A'), e)
             
             try:
-                self.connection.rollback()
+                self._rollback()
                 logger.debug("Transaction rolled back")
             except Exception as rollback_error:
-                logger.exception(f"Error during rollback: {rollback_error}")
+                logger.exception("Error during rollback: %s", rollback_error)
             
             print(f"Error creating user: {e}")
             return None
         except Exception as e:
-            logger.exception(f"Unexpected exception creating user: {e}")
+            logger.exception("Unexpected exception creating user: %s", e)
             try:
-                self.connection.rollback()
+                self._rollback()
             except:
                 pass
             print(f"Unexpected error creating user: {e}")
@@ -154,43 +526,33 @@ class DatabaseOperations:
     
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """Get user by username."""
-        logger.debug(f"get_user_by_username() called with username: {username}")
-        logger.debug(f"self.cursor is None: {self.cursor is None}")
-        logger.debug(f"self.connection is None: {self.connection is None}")
+        logger.debug("get_user_by_username() called with username: %s", username)
         
         if self.cursor is None:
             logger.error("Cursor is None in get_user_by_username()")
-            logger.error(f"Connection state: {self.connection}")
             raise AttributeError("Database cursor is not initialized. Connection failed.")
         
         query = "SELECT * FROM USER WHERE username = %s"
-        logger.debug(f"Executing query: {query} with params: ({username},)")
         
         try:
-            self.cursor.execute(query, (username,))
-            result = self.cursor.fetchone()
-            logger.debug(f"Query result: {result}")
+            result = self._execute_statement("get_user_by_username", query, (username,)).fetchone()
+            # Never log the row itself: it carries the password and contact details
+            logger.debug("get_user_by_username() found user: %s", result is not None)
             return result
         except Error as e:
-            logger.exception(f"MySQL Error retrieving user: {e}")
-            logger.error(f"Error type: {type(e)}, Error code: {e.errno if hasattr(e, 'errno') else 'N/A'}")
+            logger.exception("Database error retrieving user (%s, code %s): %s",
+                             type(e).__name__, getattr(e, 'errno', 'N/A'), e)
             print(f"Error retrieving user: {e}")
             return None
         except Exception as e:
-            logger.exception(f"Unexpected exception retrieving user: {e}")
+            logger.exception("Unexpected exception retrieving user: %s", e)
             print(f"Unexpected error retrieving user: {e}")
             return None
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """Get user by user_id."""
         query = "SELECT * FROM USER WHERE user_id = %s"
-        try:
-            self.cursor.execute(query, (user_id,))
-            result = self.cursor.fetchone()
-            return result
-        except Error as e:
-            print(f"Error retrieving user: {e}")
-            return None
+        return self._get_cached_profile(('user', user_id), query, (user_id,), "user")
     
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """Authenticate user by username and password."""
@@ -216,34 +578,30 @@ class DatabaseOperations:
             self.cursor.execute(query, (user_id, license_number, license_expiry,
                                        vehicle_make, vehicle_model, vehicle_year,
                                        vehicle_color, license_plate, insurance_number))
-            self.connection.commit()
-            return self.cursor.lastrowid
+            driver_id = self.cursor.lastrowid
+            self.cursor.execute("INSERT INTO DRIVER_RATING_STATS (driver_id) VALUES (%s)",
+                                (driver_id,))
+            self._commit()
+            self._invalidate_driver(driver_id)
+            return driver_id
         except Error as e:
-            self.connection.rollback()
+            self._rollback()
             print(f"Error creating driver: {e}")
             return None
     
     def get_driver_by_user_id(self, user_id: int) -> Optional[Dict]:
         """Get driver by user_id."""
         query = "SELECT * FROM DRIVER WHERE user_id = %s"
-        try:
-            self.cursor.execute(query, (user_id,))
-            result = self.cursor.fetchone()
-            return result
-        except Error as e:
-            print(f"Error retrieving driver: {e}")
-            return None
+        return self._get_cached_profile_by_user(user_id, 'driver', query)
     
     def get_driver_by_id(self, driver_id: int) -> Optional[Dict]:
         """Get driver by driver_id."""
         query = "SELECT * FROM DRIVER WHERE driver_id = %s"
-        try:
-            self.cursor.execute(query, (driver_id,))
-            result = self.cursor.fetchone()
-            return result
-        except Error as e:
-            print(f"Error retrieving driver: {e}")
-            return None
+        return self._get_cached_profile(('driver', driver_id), query, (driver_id,), "driver")
+    
+    def _invalidate_driver(self, driver_id: int):
+        """Drop the cached DRIVER row after a write to that driver."""
+        self._invalidate(self.profile_cache, ('driver', driver_id))
     
     def get_active_driver(self) -> Optional[Dict]:
         """Get an available active driver."""
@@ -256,37 +614,194 @@ class DatabaseOperations:
             print(f"Error retrieving active driver: {e}")
             return None
     
+    def _ensure_driver_index(self):
+        """Load located active drivers into the spatial index on first use."""
+        if self._driver_index_loaded:
+            return
+        query = """
+        SELECT driver_id, current_latitude, current_longitude
+        FROM DRIVER
+        WHERE driver_mode = 'active' AND current_latitude IS NOT NULL
+          AND current_longitude IS NOT NULL
+        """
+        try:
+            self.cursor.execute(query)
+            rows = self.cursor.fetchall()
+        except Error as e:
+            print(f"Error loading active driver locations: {e}")
+            return
+        self.driver_index.clear()
+        for row in rows:
+            self.driver_index.upsert(row['driver_id'], row['current_latitude'], row['current_longitude'])
+        self._driver_index_loaded = True
+        logger.info("Spatial index loaded with %d active drivers", len(rows))
+    
+    def _sync_driver_index(self, driver: Dict):
+        """Reflect a driver row's mode and location in the spatial index."""
+        if (driver['driver_mode'] == 'active' and driver.get('current_latitude') is not None
+                and driver.get('current_longitude') is not None):
+            self.driver_index.upsert(driver['driver_id'], driver['current_latitude'],
+                                     driver['current_longitude'])
+        else:
+            self.driver_index.remove(driver['driver_id'])
+    
+    def get_nearest_active_driver(self, latitude: float = None, longitude: float = None,
+                                  max_radius_km: float = 25.0, candidates: int = 5) -> Optional[Dict]:
+        """Get the closest active driver to a pickup point.
+        
+        Falls back to get_active_driver() when no pickup coordinates are given
+        or no located driver is within max_radius_km. The returned row carries
+        an extra 'distance_km' key when the spatial index was used.
+        """
+        if latitude is None or longitude is None:
+            return self.get_active_driver()
+        
+        self._ensure_driver_index()
+        for driver_id, distance in self.driver_index.nearest(latitude, longitude, k=candidates,
+                                                             max_radius_km=max_radius_km):
+            driver = self.get_driver_by_id(driver_id)
+            # The index may lag behind changes made by another process
+            if driver and driver['driver_mode'] == 'active':
+                driver['distance_km'] = round(distance, 3)
+                return driver
+            if driver:
+                self._sync_driver_index(driver)
+            else:
+                self.driver_index.remove(driver_id)
+        return self.get_active_driver()
+    
+    def update_driver_location(self, driver_id: int, latitude: float, longitude: float) -> bool:
+        """Record a driver's current location and update the spatial index."""
+        query = """
+        UPDATE DRIVER SET current_latitude = %s, current_longitude = %s
+        WHERE driver_id = %s
+        """
+        try:
+            self.cursor.execute(query, (latitude, longitude, driver_id))
+            updated = self.cursor.rowcount > 0
+            self._commit()
+            if not updated:
+                return False
+        except Error as e:
+            self._rollback()
+            print(f"Error updating driver location: {e}")
+            return False
+        finally:
+            self._invalidate_driver(driver_id)
+        
+        self._after_commit(lambda: self._resync_driver(driver_id))
+        return True
+    
+    def _resync_driver(self, driver_id: int):
+        """Re-read a driver after a committed write and update the spatial index."""
+        driver = self.get_driver_by_id(driver_id)
+        if driver:
+            self._sync_driver_index(driver)
+    
     def toggle_driver_mode(self, driver_id: int) -> bool:
-        """Toggle driver mode between active and inactive."""
+        """Toggle driver mode between active and inactive (a busy driver goes inactive).
+        
+        An inactive driver who still has a pending or in-progress ride comes
+        back as busy rather than active, so dispatch can't give them a second one.
+        """
+        # Decide the new mode from the database, not a possibly stale cached row
+        self._invalidate_driver(driver_id)
         driver = self.get_driver_by_id(driver_id)
         if not driver:
             return False
         
-        new_mode = 'active' if driver['driver_mode'] == 'inactive' else 'inactive'
-        query = "UPDATE DRIVER SET driver_mode = %s WHERE driver_id = %s"
         try:
-            self.cursor.execute(query, (new_mode, driver_id))
-            self.connection.commit()
-            return True
+            if driver['driver_mode'] == 'inactive':
+                query = """
+                UPDATE DRIVER
+                SET driver_mode = CASE WHEN EXISTS (SELECT 1 FROM RIDE
+                                                    WHERE driver_id = %s
+                                                      AND ride_status IN ('pending', 'in_progress'))
+                                       THEN 'busy' ELSE 'active' END
+                WHERE driver_id = %s
+                """
+                self.cursor.execute(query, (driver_id, driver_id))
+                self.cursor.execute("SELECT driver_mode FROM DRIVER WHERE driver_id = %s", (driver_id,))
+                new_mode = self.cursor.fetchone()['driver_mode']
+            else:
+                new_mode = 'inactive'
+                self.cursor.execute("UPDATE DRIVER SET driver_mode = %s WHERE driver_id = %s",
+                                    (new_mode, driver_id))
+            self._commit()
         except Error as e:
-            self.connection.rollback()
+            self._rollback()
             print(f"Error updating driver mode: {e}")
             return False
+        finally:
+            self._invalidate_driver(driver_id)
+        
+        driver['driver_mode'] = new_mode
+        self._after_commit(lambda: self._sync_driver_index(driver))
+        return True
     
     def get_driver_rating(self, driver_id: int) -> Optional[float]:
         """Get average rating for a driver."""
-        query = """
-        SELECT AVG(rating) as avg_rating
-        FROM RIDE
-        WHERE driver_id = %s AND rating IS NOT NULL
+        summary = self.get_driver_rating_summary(driver_id)
+        return summary['average'] if summary else None
+    
+    def get_driver_rating_summary(self, driver_id: int) -> Optional[Dict]:
+        """Get a driver's rating average, count and per-star histogram.
+        
+        Reads the incrementally maintained DRIVER_RATING_STATS row. Returns
+        None when the driver has no ratings.
         """
+        query = "SELECT * FROM DRIVER_RATING_STATS WHERE driver_id = %s"
         try:
-            self.cursor.execute(query, (driver_id,))
-            result = self.cursor.fetchone()
-            return result['avg_rating'] if result and result['avg_rating'] else None
+            stats = self._execute_statement("get_driver_rating_summary", query, (driver_id,)).fetchone()
+            if stats is None:
+                # Drivers created before the stats table existed
+                stats = self._rebuild_driver_rating_stats(driver_id)
         except Error as e:
             print(f"Error retrieving driver rating: {e}")
             return None
+        
+        return self._rating_summary(stats)
+    
+    @staticmethod
+    def _rating_summary(stats: Optional[Dict]) -> Optional[Dict]:
+        """Average, count and histogram from DRIVER_RATING_STATS columns (None if unrated)."""
+        if not stats or not stats['rating_count']:
+            return None
+        return {
+            'average': stats['rating_sum'] / stats['rating_count'],
+            'count': stats['rating_count'],
+            'histogram': {star: stats[f'rating_{star}_count'] for star in range(1, 6)},
+        }
+    
+    def _rebuild_driver_rating_stats(self, driver_id: int) -> Optional[Dict]:
+        """Recompute one driver's stats row from RIDE and return it."""
+        try:
+            self.cursor.execute("DELETE FROM DRIVER_RATING_STATS WHERE driver_id = %s", (driver_id,))
+            self.cursor.execute(RATING_STATS_REBUILD_SQL.format(driver_filter="WHERE d.driver_id = %s"),
+                                (driver_id,))
+            self._commit()
+        except Error:
+            self._rollback()
+            raise
+        self.cursor.execute("SELECT * FROM DRIVER_RATING_STATS WHERE driver_id = %s", (driver_id,))
+        return self.cursor.fetchone()
+    
+    def rebuild_driver_rating_stats(self) -> Optional[int]:
+        """Recompute DRIVER_RATING_STATS for every driver from RIDE.
+        
+        Returns the number of drivers rebuilt, or None on error.
+        """
+        try:
+            self.cursor.execute("DELETE FROM DRIVER_RATING_STATS")
+            self.cursor.execute(RATING_STATS_REBUILD_SQL.format(driver_filter=""))
+            rebuilt = self.cursor.rowcount
+            self._commit()
+            logger.info("Rebuilt rating stats for %d drivers", rebuilt)
+            return rebuilt
+        except Error as e:
+            self._rollback()
+            print(f"Error rebuilding driver rating stats: {e}")
+            return None
     
     def get_driver_rides(self, driver_id: int) -> List[Dict]:
         """Get all rides for a driver."""
@@ -299,13 +814,63 @@ class DatabaseOperations:
         ORDER BY r.created_at DESC
         """
         try:
-            self.cursor.execute(query, (driver_id,))
-            results = self.cursor.fetchall()
-            return results
+            return self._execute_statement("get_driver_rides", query, (driver_id,)).fetchall()
         except Error as e:
             print(f"Error retrieving driver rides: {e}")
             return []
     
+    def get_driver_rides_page(self, driver_id: int, limit: int = 25,
+                              after: Tuple = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Get one page of a driver's rides, newest first.
+        
+        `after` is the (created_at, ride_id) of the last ride on the previous
+        page. Returns (rides, next_after), where next_after is None on the
+        last page.
+        """
+        query = """
+        SELECT r.*, u.full_name as rider_name
+        FROM RIDE r
+        JOIN RIDER rd ON r.rider_id = rd.rider_id
+        JOIN USER u ON rd.user_id = u.user_id
+        WHERE r.driver_id = %s {keyset}
+        ORDER BY r.created_at DESC, r.ride_id DESC
+        LIMIT %s
+        """
+        return self._fetch_rides_page(query, driver_id, limit, after, "driver")
+    
+    def get_driver_rides_version(self, driver_id: int) -> Optional[int]:
+        """Counter that changes whenever any of the driver's rides is written.
+        
+        One primary key lookup; web_app.py builds ride page ETags from it.
+        """
+        return self._get_rides_version('DRIVER', 'driver_id', driver_id)
+    
+    def _fetch_rides_page(self, query: str, owner_id: int, limit: int,
+                          after: Optional[Tuple], owner: str) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Run a keyset-paginated ride query (see get_driver_rides_page)."""
+        params = [owner_id]
+        keyset = ""
+        if after:
+            # Equivalent to (created_at, ride_id) < after, written so the
+            # optimizer can range-scan the (owner, created_at) index
+            keyset = "AND r.created_at <= %s AND (r.created_at < %s OR r.ride_id < %s)"
+            params.extend([after[0], after[0], after[1]])
+        # Fetch one extra row to learn whether another page exists
+        params.append(limit + 1)
+        
+        try:
+            name = f"get_{owner}_rides_page" + ("[after]" if after else "")
+            rides = self._execute_statement(name, query.format(keyset=keyset), tuple(params)).fetchall()
+        except Error as e:
+            print(f"Error retrieving {owner} rides page: {e}")
+            return [], None
+        
+        if len(rides) > limit:
+            rides = rides[:limit]
+            last = rides[-1]
+            return rides, (last['created_at'], last['ride_id'])
+        return rides, None
+    
     # ==================== RIDER OPERATIONS ====================
     
     def create_rider(self, user_id: int, payment_info: str = None,
@@ -320,34 +885,24 @@ class DatabaseOperations:
         try:
             self.cursor.execute(query, (user_id, payment_info, preferred_payment,
                                        credit_card_last4, default_location))
-            self.connection.commit()
-            return self.cursor.lastrowid
+            rider_id = self.cursor.lastrowid
+            self._commit()
+            self._invalidate(self.profile_cache, ('rider', rider_id))
+            return rider_id
         except Error as e:
-            self.connection.rollback()
+            self._rollback()
             print(f"Error creating rider: {e}")
             return None
     
     def get_rider_by_user_id(self, user_id: int) -> Optional[Dict]:
         """Get rider by user_id."""
         query = "SELECT * FROM RIDER WHERE user_id = %s"
-        try:
-            self.cursor.execute(query, (user_id,))
-            result = self.cursor.fetchone()
-            return result
-        except Error as e:
-            print(f"Error retrieving rider: {e}")
-            return None
+        return self._get_cached_profile_by_user(user_id, 'rider', query)
     
     def get_rider_by_id(self, rider_id: int) -> Optional[Dict]:
         """Get rider by rider_id."""
         query = "SELECT * FROM RIDER WHERE rider_id = %s"
-        try:
-            self.cursor.execute(query, (rider_id,))
-            result = self.cursor.fetchone()
-            return result
-        except Error as e:
-            print(f"Error retrieving rider: {e}")
-            return None
+        return self._get_cached_profile(('rider', rider_id), query, (rider_id,), "rider")
     
     def get_rider_rides(self, rider_id: int) -> List[Dict]:
         """Get all rides for a rider."""
@@ -360,13 +915,47 @@ class DatabaseOperations:
         ORDER BY r.created_at DESC
         """
         try:
-            self.cursor.execute(query, (rider_id,))
-            results = self.cursor.fetchall()
-            return results
+            return self._execute_statement("get_rider_rides", query, (rider_id,)).fetchall()
         except Error as e:
             print(f"Error retrieving rider rides: {e}")
             return []
     
+    def get_rider_rides_page(self, rider_id: int, limit: int = 25,
+                             after: Tuple = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Get one page of a rider's rides, newest first (see get_driver_rides_page)."""
+        query = """
+        SELECT r.*, d.vehicle_make, d.vehicle_model, u.full_name as driver_name
+        FROM RIDE r
+        JOIN DRIVER d ON r.driver_id = d.driver_id
+        JOIN USER u ON d.user_id = u.user_id
+        WHERE r.rider_id = %s {keyset}
+        ORDER BY r.created_at DESC, r.ride_id DESC
+        LIMIT %s
+        """
+        return self._fetch_rides_page(query, rider_id, limit, after, "rider")
+    
+    def get_rider_rides_version(self, rider_id: int) -> Optional[int]:
+        """Counter that changes whenever any of the rider's rides is written."""
+        return self._get_rides_version('RIDER', 'rider_id', rider_id)
+    
+    def get_rides_awaiting_rating(self, rider_id: int, limit: int = 50) -> List[Dict]:
+        """Get a rider's completed rides that have no rating yet, newest first."""
+        query = """
+        SELECT r.*, d.vehicle_make, d.vehicle_model, u.full_name as driver_name
+        FROM RIDE r
+        JOIN DRIVER d ON r.driver_id = d.driver_id
+        JOIN USER u ON d.user_id = u.user_id
+        WHERE r.rider_id = %s AND r.rating IS NULL AND r.ride_status = 'completed'
+        ORDER BY r.created_at DESC, r.ride_id DESC
+        LIMIT %s
+        """
+        try:
+            return self._execute_statement("get_rides_awaiting_rating", query,
+                                           (rider_id, limit)).fetchall()
+        except Error as e:
+            print(f"Error retrieving rides awaiting rating: {e}")
+            return []
+    
     def get_rider_most_recent_ride(self, rider_id: int) -> Optional[Dict]:
         """Get the most recent ride for a rider."""
         query = """
@@ -379,9 +968,7 @@ class DatabaseOperations:
         LIMIT 1
         """
         try:
-            self.cursor.execute(query, (rider_id,))
-            result = self.cursor.fetchone()
-            return result
+            return self._execute_statement("get_rider_most_recent_ride", query, (rider_id,)).fetchone()
         except Error as e:
             print(f"Error retrieving most recent ride: {e}")
             return None
@@ -390,24 +977,222 @@ class DatabaseOperations:
     
     def create_ride(self, driver_id: int, rider_id: int, pickup_location: str,
                    dropoff_location: str, pickup_address: str = None,
-                   dropoff_address: str = None, fare_amount: float = None) -> Optional[int]:
-        """Create a new ride."""
+                   dropoff_address: str = None, fare_amount: float = None,
+                   pickup_latitude: float = None, pickup_longitude: float = None,
+                   dropoff_latitude: float = None, dropoff_longitude: float = None) -> Optional[int]:
+        """Create a new ride for a driver chosen by the caller.
+        
+        Does not claim the driver; use dispatch_ride() to assign a driver safely.
+        With all four coordinates, distance and duration are estimated from the
+        rate card, and so is the fare unless fare_amount is given.
+        """
+        try:
+            with self.transaction():
+                ride_id = self._insert_ride(driver_id, rider_id, pickup_location, dropoff_location,
+                                            pickup_address, dropoff_address, fare_amount,
+                                            pickup_latitude, pickup_longitude,
+                                            dropoff_latitude, dropoff_longitude)
+        except Error as e:
+            self._rollback()
+            print(f"Error creating ride: {e}")
+            return None
+        
+        self._after_commit(lambda: self.events.publish('ride_created', ride_id, rider_id, driver_id,
+                                                       ride_status='pending'))
+        return ride_id
+    
+    def _insert_ride(self, driver_id: int, rider_id: int, pickup_location: str,
+                     dropoff_location: str, pickup_address: str, dropoff_address: str,
+                     fare_amount: float, pickup_latitude: float, pickup_longitude: float,
+                     dropoff_latitude: float, dropoff_longitude: float) -> int:
+        """INSERT a pending ride in the current transaction (no commit)."""
+        distance_miles = duration_minutes = None
+        trip = estimate(pickup_latitude, pickup_longitude, dropoff_latitude,
+                        dropoff_longitude, self.rate_card)
+        if trip:
+            distance_miles = trip['distance_miles']
+            duration_minutes = trip['duration_minutes']
+            if fare_amount is None:
+                fare_amount = trip['fare_amount']
+        
         query = """
         INSERT INTO RIDE (driver_id, rider_id, pickup_location, dropoff_location,
                          pickup_address, dropoff_address, ride_status, fare_amount,
-                         pickup_time)
-        VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s, NOW())
+                         pickup_latitude, pickup_longitude, dropoff_latitude,
+                         dropoff_longitude, distance_miles, duration_minutes, pickup_time)
+        VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s, %s, %s, %s, %s, %s, %s, NOW())
+        """
+        self.cursor.execute(query, (driver_id, rider_id, pickup_location,
+                                   dropoff_location, pickup_address,
+                                   dropoff_address, fare_amount,
+                                   pickup_latitude, pickup_longitude,
+                                   dropoff_latitude, dropoff_longitude,
+                                   distance_miles, duration_minutes))
+        ride_id = self.cursor.lastrowid
+        self._bump_rides_version(ride_id)
+        return ride_id
+    
+    def _bump_rides_version(self, ride_id: int):
+        """Advance the rides_version of a ride's driver and rider (no commit).
+        
+        Call in the same transaction as any write that changes what the ride
+        pages show, so their ETags (see get_driver_rides_version) change with it.
         """
+        for table, column in (('DRIVER', 'driver_id'), ('RIDER', 'rider_id')):
+            self.cursor.execute(
+                f"UPDATE {table} SET rides_version = rides_version + 1 "
+                f"WHERE {column} = (SELECT {column} FROM RIDE WHERE ride_id = %s)",
+                (ride_id,)
+            )
+    
+    def _get_rides_version(self, table: str, column: str, owner_id: int) -> Optional[int]:
+        """Read one rides_version counter by primary key (None if missing or on error)."""
+        query = f"SELECT rides_version FROM {table} WHERE {column} = %s"
         try:
-            self.cursor.execute(query, (driver_id, rider_id, pickup_location,
-                                       dropoff_location, pickup_address,
-                                       dropoff_address, fare_amount))
-            self.connection.commit()
-            return self.cursor.lastrowid
+            row = self._execute_statement(f"get_{column[:-3]}_rides_version", query,
+                                          (owner_id,)).fetchone()
         except Error as e:
-            self.connection.rollback()
-            print(f"Error creating ride: {e}")
+            print(f"Error retrieving rides version: {e}")
             return None
+        return row['rides_version'] if row else None
+    
+    # ==================== DISPATCH ====================
+    
+    def find_dispatch_candidates(self, latitude: Optional[float], longitude: Optional[float],
+                                 max_radius_km: float = 25.0, candidates: int = 5) -> List[int]:
+        """Driver ids worth trying to claim, nearest first when a pickup point is known."""
+        if latitude is not None and longitude is not None:
+            self._ensure_driver_index()
+            nearby = self.driver_index.nearest(latitude, longitude, k=candidates,
+                                               max_radius_km=max_radius_km)
+            if nearby:
+                return [driver_id for driver_id, _ in nearby]
+        
+        query = "SELECT driver_id FROM DRIVER WHERE driver_mode = 'active' LIMIT %s"
+        self.cursor.execute(query, (candidates * 4,))
+        driver_ids = [row['driver_id'] for row in self.cursor.fetchall()]
+        # Spread concurrent requests out instead of having all of them race for the first row
+        random.shuffle(driver_ids)
+        return driver_ids[:candidates]
+    
+    def dispatch_ride(self, rider_id: int, pickup_location: str, dropoff_location: str,
+                      pickup_address: str = None, dropoff_address: str = None,
+                      fare_amount: float = None, pickup_latitude: float = None,
+                      pickup_longitude: float = None, dropoff_latitude: float = None,
+                      dropoff_longitude: float = None, preferred_driver_id: int = None,
+                      max_radius_km: float = 25.0, candidates: int = 5,
+                      rounds: int = 3) -> Optional[Tuple[int, Dict]]:
+        """Claim an active driver and create a pending ride for them atomically.
+        
+        The claim is a conditional UPDATE (active -> busy) that only one
+        transaction can win, and the ride INSERT commits in that same
+        transaction, so a driver is never assigned to two rides at once.
+        Candidates come from the spatial index (or any active drivers without
+        a pickup point); a lost race moves on to the next candidate.
+        Inside an enclosing transaction() the claim and ride join that unit
+        of work. Returns (ride_id, driver) or None if no driver could be claimed.
+        """
+        joined = self.in_transaction
+        for attempt in range(rounds):
+            try:
+                # Each round is its own unit of work starting from a fresh
+                # snapshot, so drivers claimed meanwhile are skipped
+                with self.transaction():
+                    driver_ids = self.find_dispatch_candidates(pickup_latitude, pickup_longitude,
+                                                               max_radius_km, candidates)
+                    if preferred_driver_id is not None and attempt == 0:
+                        driver_ids = [preferred_driver_id] + [d for d in driver_ids if d != preferred_driver_id]
+                    if not driver_ids:
+                        return None
+                    
+                    claimed_id = None
+                    for driver_id in driver_ids:
+                        self.cursor.execute(CLAIM_DRIVER_SQL, (driver_id,))
+                        if self.cursor.rowcount > 0:
+                            claimed_id = driver_id
+                            break
+                        # Taken or gone inactive; nothing is written yet, so release
+                        # the row lock before the next try (unless the caller's
+                        # unit of work already holds other writes)
+                        if not joined:
+                            self.connection.rollback()
+                        self.driver_index.remove(driver_id)
+                    if claimed_id is None:
+                        continue
+                    ride_id = self._insert_ride(claimed_id, rider_id, pickup_location,
+                                                dropoff_location, pickup_address,
+                                                dropoff_address, fare_amount,
+                                                pickup_latitude, pickup_longitude,
+                                                dropoff_latitude, dropoff_longitude)
+            except Error as e:
+                self._rollback()
+                print(f"Error dispatching ride: {e}")
+                return None
+            
+            self._invalidate_driver(claimed_id)
+            self._after_commit(lambda: self._announce_dispatch(ride_id, rider_id, claimed_id))
+            return ride_id, self.get_driver_by_id(claimed_id)
+        return None
+    
+    def _announce_dispatch(self, ride_id: int, rider_id: int, driver_id: int):
+        """After a dispatch commits: the driver leaves the index and the ride is published."""
+        self.driver_index.remove(driver_id)
+        self.events.publish('ride_created', ride_id, rider_id, driver_id, ride_status='pending')
+    
+    def get_dispatch_candidates(self, driver_ids: List[int]) -> List[Dict]:
+        """Active drivers among driver_ids with location, rating totals and last ride time."""
+        if not driver_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(driver_ids))
+        query = f"""
+        SELECT d.driver_id, d.current_latitude, d.current_longitude,
+               s.rating_sum, s.rating_count,
+               (SELECT MAX(r.created_at) FROM RIDE r WHERE r.driver_id = d.driver_id) AS last_ride_at
+        FROM DRIVER d
+        LEFT JOIN DRIVER_RATING_STATS s ON s.driver_id = d.driver_id
+        WHERE d.driver_id IN ({placeholders}) AND d.driver_mode = 'active'
+        """
+        try:
+            self.cursor.execute(query, tuple(driver_ids))
+            drivers = self.cursor.fetchall()
+        except Error as e:
+            print(f"Error retrieving dispatch candidates: {e}")
+            return []
+        
+        # MAX() is an expression with no declared type, so SQLite returns it as text
+        for driver in drivers:
+            if isinstance(driver['last_ride_at'], str):
+                driver['last_ride_at'] = datetime.fromisoformat(driver['last_ride_at'])
+        return drivers
+    
+    def dispatch_rides(self, assignments: List[Tuple[int, Dict]]) -> List[Optional[int]]:
+        """Claim drivers and create rides for a batch of matches in one transaction.
+        
+        assignments pairs a driver_id with the ride's create_ride() keyword
+        arguments. Drivers are claimed in driver_id order so concurrent batches
+        cannot deadlock. A driver claimed elsewhere first is skipped; its slot
+        in the returned list of ride ids is None.
+        """
+        ride_ids: List[Optional[int]] = [None] * len(assignments)
+        try:
+            with self.transaction():
+                for index in sorted(range(len(assignments)), key=lambda i: assignments[i][0]):
+                    driver_id, ride = assignments[index]
+                    self.cursor.execute(CLAIM_DRIVER_SQL, (driver_id,))
+                    if self.cursor.rowcount == 0:
+                        continue
+                    ride_ids[index] = self._insert_ride(driver_id, **ride)
+        except Error as e:
+            self._rollback()
+            print(f"Error dispatching ride batch: {e}")
+            return [None] * len(assignments)
+        
+        for (driver_id, ride), ride_id in zip(assignments, ride_ids):
+            if ride_id is not None:
+                self._invalidate_driver(driver_id)
+                self._after_commit(functools.partial(self._announce_dispatch, ride_id,
+                                                     ride['rider_id'], driver_id))
+        return ride_ids
     
     def get_ride_by_id(self, ride_id: int, rider_id: int = None) -> Optional[Dict]:
         """Get ride by ride_id, optionally verifying it belongs to a rider."""
@@ -419,39 +1204,298 @@ class DatabaseOperations:
             JOIN USER u ON d.user_id = u.user_id
             WHERE r.ride_id = %s AND r.rider_id = %s
             """
-            try:
-                self.cursor.execute(query, (ride_id, rider_id))
-                result = self.cursor.fetchone()
-                return result
-            except Error as e:
-                print(f"Error retrieving ride: {e}")
-                return None
+            return self._get_cached_ride('rider_view', ride_id, 'rider_id', rider_id,
+                                         query, (ride_id, rider_id))
         else:
             query = "SELECT * FROM RIDE WHERE ride_id = %s"
-            try:
-                self.cursor.execute(query, (ride_id,))
-                result = self.cursor.fetchone()
-                return result
-            except Error as e:
-                print(f"Error retrieving ride: {e}")
+            return self._get_cached_ride('ride', ride_id, None, None, query, (ride_id,))
+    
+    def get_driver_ride_by_id(self, ride_id: int, driver_id: int) -> Optional[Dict]:
+        """Get ride by ride_id, verifying it belongs to a driver."""
+        query = """
+        SELECT r.*, u.full_name as rider_name
+        FROM RIDE r
+        JOIN RIDER rd ON r.rider_id = rd.rider_id
+        JOIN USER u ON rd.user_id = u.user_id
+        WHERE r.ride_id = %s AND r.driver_id = %s
+        """
+        return self._get_cached_ride('driver_view', ride_id, 'driver_id', driver_id,
+                                     query, (ride_id, driver_id))
+    
+    def _get_cached_ride(self, view: str, ride_id: int, owner_key: Optional[str],
+                         owner_id: Optional[int], query: str, params: Tuple) -> Optional[Dict]:
+        """Serve a single-ride lookup from the ride cache, querying on a miss."""
+        cached = self.ride_cache.get((view, ride_id))
+        if cached is not None:
+            if owner_key and cached[owner_key] != owner_id:
                 return None
+            return dict(cached)
+        
+        try:
+            result = self._execute_statement(RIDE_VIEW_STATEMENTS[view], query, params).fetchone()
+        except Error as e:
+            print(f"Error retrieving ride: {e}")
+            return None
+        if result:
+            self.ride_cache.put((view, ride_id), dict(result))
+        return result
     
-    def update_ride_rating(self, ride_id: int, rider_id: int, rating: int,
-                          rating_comment: str = None) -> bool:
-        """Update ride rating and comment."""
+    def invalidate_ride(self, ride_id: int):
+        """Drop every cached view of a ride after it changes and tell ride_listeners."""
+        self._invalidate(self.ride_cache, ('ride', ride_id), ('rider_view', ride_id),
+                         ('driver_view', ride_id))
+        unit = getattr(self._local, 'unit', None)
+        for listener in self.ride_listeners:
+            listener(ride_id)
+            if unit is not None:
+                unit.callbacks.append((functools.partial(listener, ride_id), True))
+    
+    def update_ride_status(self, ride_id: int, ride_status: str) -> bool:
+        """Update a ride's status, stamping dropoff_time when it completes.
+        
+        Completing or cancelling a ride puts its busy driver back to active
+        once they have no other open rides.
+        """
+        if ride_status not in ('pending', 'in_progress', 'completed', 'cancelled'):
+            return False
+        
+        if ride_status == 'completed':
+            query = "UPDATE RIDE SET ride_status = %s, dropoff_time = NOW() WHERE ride_id = %s"
+        else:
+            query = "UPDATE RIDE SET ride_status = %s WHERE ride_id = %s"
+        released_driver_id = None
+        try:
+            self.cursor.execute(query, (ride_status, ride_id))
+            updated = self.cursor.rowcount > 0
+            if updated:
+                self._bump_rides_version(ride_id)
+            if updated and ride_status in ('completed', 'cancelled'):
+                released_driver_id = self._release_driver(ride_id)
+            self._commit()
+        except Error as e:
+            self._rollback()
+            print(f"Error updating ride status: {e}")
+            return False
+        finally:
+            self.invalidate_ride(ride_id)
+        
+        if released_driver_id is not None:
+            self._invalidate_driver(released_driver_id)
+            self._after_commit(lambda: self._resync_driver(released_driver_id))
+        if updated:
+            self._after_commit(lambda: self._announce_status(ride_id, ride_status,
+                                                             released_driver_id is not None))
+        return updated
+    
+    def _announce_status(self, ride_id: int, ride_status: str, driver_released: bool):
+        """Publish a committed status change to the ride's rider and driver."""
+        ride = self.get_ride_by_id(ride_id)
+        if ride:
+            self.events.publish('ride_status', ride_id, ride['rider_id'], ride['driver_id'],
+                                ride_status=ride_status, driver_released=driver_released)
+    
+    def _release_driver(self, ride_id: int) -> Optional[int]:
+        """Set a ride's busy driver back to active if no other ride is open (no commit).
+        
+        Returns the driver_id when the driver was released.
+        """
+        self.cursor.execute("SELECT driver_id FROM RIDE WHERE ride_id = %s", (ride_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
         query = """
-        UPDATE RIDE
-        SET rating = %s, rating_comment = %s
-        WHERE ride_id = %s AND rider_id = %s
+        UPDATE DRIVER SET driver_mode = 'active'
+        WHERE driver_id = %s AND driver_mode = 'busy'
+          AND NOT EXISTS (SELECT 1 FROM RIDE
+                          WHERE driver_id = %s AND ride_status IN ('pending', 'in_progress'))
         """
+        self.cursor.execute(query, (row['driver_id'], row['driver_id']))
+        return row['driver_id'] if self.cursor.rowcount > 0 else None
+    
+    def update_ride_rating(self, ride_id: int, rider_id: int, rating: int,
+                          rating_comment: str = None) -> bool:
+        """Update ride rating and comment, keeping the driver's rating stats in step."""
+        if rating not in (1, 2, 3, 4, 5):
+            return False
+        
         try:
+            # Lock the ride so concurrent re-ratings apply their deltas in order
+            self.cursor.execute(
+                "SELECT driver_id, rating FROM RIDE WHERE ride_id = %s AND rider_id = %s FOR UPDATE",
+                (ride_id, rider_id)
+            )
+            ride = self.cursor.fetchone()
+            if not ride:
+                if not self.in_transaction:
+                    self.connection.rollback()
+                return False
+            
+            query = """
+            UPDATE RIDE
+            SET rating = %s, rating_comment = %s
+            WHERE ride_id = %s AND rider_id = %s
+            """
             self.cursor.execute(query, (rating, rating_comment, ride_id, rider_id))
-            self.connection.commit()
-            return self.cursor.rowcount > 0
+            self._apply_rating_delta(ride['driver_id'], ride['rating'], rating)
+            self._bump_rides_version(ride_id)
+            self._commit()
         except Error as e:
-            self.connection.rollback()
+            self._rollback()
             print(f"Error updating ride rating: {e}")
             return False
+        finally:
+            self.invalidate_ride(ride_id)
+        
+        self._after_commit(lambda: self.events.publish('ride_rated', ride_id, rider_id,
+                                                       ride['driver_id'], rating=rating))
+        return True
+    
+    def update_ride_ratings(self, rider_id: int,
+                            ratings: List[Tuple[int, int, Optional[str]]]) -> List[int]:
+        """Rate several of a rider's rides in one transaction.
+        
+        ratings holds (ride_id, rating, rating_comment) tuples. Rides are
+        locked in ride_id order so concurrent submissions cannot deadlock.
+        Rides that are not the rider's or have an invalid rating are skipped.
+        Returns the ids of the rides rated; on a database error nothing is
+        rated and the list is empty.
+        """
+        rated = []
+        with self.transaction() as unit:
+            for ride_id, rating, rating_comment in sorted(ratings, key=lambda item: item[0]):
+                if self.update_ride_rating(ride_id, rider_id, rating, rating_comment):
+                    rated.append(ride_id)
+                if unit.failed:
+                    return []
+        return rated
+    
+    def _apply_rating_delta(self, driver_id: int, old_rating: Optional[int], new_rating: int):
+        """Move one rating from old_rating (None if unrated) to new_rating in the stats row.
+        
+        Runs inside the caller's transaction; does not commit.
+        """
+        if old_rating == new_rating:
+            return
+        
+        assignments = [
+            "rating_sum = rating_sum + %s",
+            f"rating_{new_rating}_count = rating_{new_rating}_count + 1",
+        ]
+        if old_rating is None:
+            assignments.append("rating_count = rating_count + 1")
+        else:
+            assignments.append(f"rating_{old_rating}_count = rating_{old_rating}_count - 1")
+        delta = new_rating - (old_rating or 0)
+        
+        query = f"UPDATE DRIVER_RATING_STATS SET {', '.join(assignments)} WHERE driver_id = %s"
+        self.cursor.execute(query, (delta, driver_id))
+        if self.cursor.rowcount == 0:
+            # No stats row yet; RIDE already holds the new rating, so derive it
+            self.cursor.execute(RATING_STATS_REBUILD_SQL.format(driver_filter="WHERE d.driver_id = %s"),
+                                (driver_id,))
+    
+    # ==================== PAGE VIEWS ====================
+    
+    def get_driver_dashboard(self, driver_id: int, recent: int = 5) -> Optional[Dict]:
+        """Everything the driver dashboard shows, read in one query.
+        
+        Returns {'driver', 'user', 'rating', 'recent_rides'}, where 'rating'
+        is shaped like get_driver_rating_summary() and 'recent_rides' holds
+        the newest `recent` rides with rider_name. None if there is no such
+        driver.
+        """
+        try:
+            rows = self._execute_statement("get_driver_dashboard", DRIVER_DASHBOARD_SQL,
+                                           (driver_id, recent, driver_id)).fetchall()
+        except Error as e:
+            print(f"Error retrieving driver dashboard: {e}")
+            return None
+        if not rows:
+            return None
+        
+        view = self._split_view(rows)
+        view['rating'] = self._rating_summary(view.pop('stats'))
+        view['driver'] = view.pop('profile')
+        self.profile_cache.put(('driver', driver_id), dict(view['driver']))
+        return view
+    
+    def get_rider_dashboard(self, rider_id: int, recent: int = 5) -> Optional[Dict]:
+        """Everything the rider dashboard shows, read in one query.
+        
+        Returns {'rider', 'user', 'recent_rides', 'awaiting_rating'}, where
+        'recent_rides' holds the newest `recent` rides with driver_name and
+        'awaiting_rating' counts completed rides not rated yet. None if there
+        is no such rider.
+        """
+        try:
+            rows = self._execute_statement("get_rider_dashboard", RIDER_DASHBOARD_SQL,
+                                           (rider_id, recent, rider_id)).fetchall()
+        except Error as e:
+            print(f"Error retrieving rider dashboard: {e}")
+            return None
+        if not rows:
+            return None
+        
+        view = self._split_view(rows)
+        view.pop('stats')
+        view['rider'] = view.pop('profile')
+        view['awaiting_rating'] = view['rider'].pop('awaiting_rating')
+        self.profile_cache.put(('rider', rider_id), dict(view['rider']))
+        return view
+    
+    @staticmethod
+    def _split_view(rows: List[Dict]) -> Dict:
+        """Split dashboard rows into profile, user, rating stats and recent rides."""
+        first = rows[0]
+        profile, user, stats = {}, {}, {}
+        for key, value in first.items():
+            if key.startswith('recent_'):
+                continue
+            if key.startswith('rating_'):
+                stats[key] = value
+            else:
+                if key in VIEW_USER_COLUMNS:
+                    user[key] = value
+                if key not in VIEW_USER_COLUMNS or key == 'user_id':
+                    profile[key] = value
+        recent_rides = [{key[len('recent_'):]: value for key, value in row.items()
+                         if key.startswith('recent_')}
+                        for row in rows if row['recent_ride_id'] is not None]
+        recent_rides.sort(key=lambda ride: (ride['created_at'], ride['ride_id']), reverse=True)
+        return {'profile': profile, 'user': user, 'stats': stats or None,
+                'recent_rides': recent_rides}
+    
+    def get_rider_rating_view(self, rider_id: int, limit: int = 50) -> Dict:
+        """The rating page's rides, read in one query.
+        
+        Returns {'rides', 'most_recent_ride', 'unrated_rides'}: the most
+        recent ride (which may be re-rated), up to `limit` completed rides
+        awaiting a rating, newest first, and 'rides', the two combined
+        without duplicates for the ride picker. Rated older rides are not
+        read at all, so the page stays cheap for riders with long histories.
+        """
+        try:
+            rows = self._execute_statement("get_rider_rating_view", RIDER_RATING_VIEW_SQL,
+                                           (rider_id, rider_id, limit)).fetchall()
+        except Error as e:
+            print(f"Error retrieving rides to rate: {e}")
+            rows = []
+        
+        most_recent_ride = None
+        unrated_rides = []
+        for row in rows:
+            if row.pop('view_part') == 'latest':
+                most_recent_ride = row
+            else:
+                unrated_rides.append(row)
+        rides = list(unrated_rides)
+        if most_recent_ride and all(ride['ride_id'] != most_recent_ride['ride_id'] for ride in rides):
+            rides.insert(0, most_recent_ride)
+        return {
+            'rides': rides,
+            'most_recent_ride': most_recent_ride,
+            'unrated_rides': unrated_rides,
+        }
     
     def __del__(self):
         """Destructor to ensure database connection is closed."""
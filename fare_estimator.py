@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Fare Estimator
+Computes ride distance, duration and fare from pickup/dropoff coordinates and
+a configurable rate card. estimate() serves single rides (create_ride);
+estimate_batch() is the NumPy-vectorized form used by the backfill job.
+
+Backfill historical rides:
+    python fare_estimator.py --chunk-size 20000
+    python fare_estimator.py --all --recompute-fares --rate-card rates.json
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # only estimate_batch() and the backfill need NumPy
+    np = None
+
+from spatial_index import EARTH_RADIUS_KM, haversine_km
+
+KM_TO_MILES = 0.621371
+
+
+class RateCard:
+    """Pricing and trip-time assumptions used for estimates."""
+
+    FIELDS = ('base_fare', 'per_mile', 'per_minute', 'booking_fee', 'minimum_fare',
+              'surge_multiplier', 'average_speed_mph', 'route_factor', 'minimum_minutes')
+
+    def __init__(self, base_fare: float = 2.50, per_mile: float = 1.75, per_minute: float = 0.35,
+                 booking_fee: float = 0.0, minimum_fare: float = 7.00,
+                 surge_multiplier: float = 1.0, average_speed_mph: float = 22.0,
+                 route_factor: float = 1.3, minimum_minutes: int = 3):
+        """route_factor scales straight-line distance to typical road distance."""
+        self.base_fare = base_fare
+        self.per_mile = per_mile
+        self.per_minute = per_minute
+        self.booking_fee = booking_fee
+        self.minimum_fare = minimum_fare
+        self.surge_multiplier = surge_multiplier
+        self.average_speed_mph = average_speed_mph
+        self.route_factor = route_factor
+        self.minimum_minutes = minimum_minutes
+
+    @classmethod
+    def from_file(cls, path: str) -> "RateCard":
+        """Load a rate card from a JSON object of field overrides."""
+        with open(path) as f:
+            values = json.load(f)
+        unknown = set(values) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown rate card fields: {', '.join(sorted(unknown))}")
+        return cls(**values)
+
+    @classmethod
+    def from_env(cls) -> "RateCard":
+        """Rate card from the JSON file in RIDESHARE_RATE_CARD, else the defaults."""
+        path = os.environ.get('RIDESHARE_RATE_CARD')
+        return cls.from_file(path) if path else cls()
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def fare(self, miles: float, minutes: float) -> float:
+        """Fare for a trip of the given road distance and duration."""
+        metered = self.base_fare + self.per_mile * miles + self.per_minute * minutes
+        return round(max(self.minimum_fare, metered * self.surge_multiplier) + self.booking_fee, 2)
+
+
+DEFAULT_RATE_CARD = RateCard()
+
+
+def estimate(pickup_latitude: float, pickup_longitude: float, dropoff_latitude: float,
+             dropoff_longitude: float, rate_card: RateCard = None) -> Optional[Dict]:
+    """Estimate one trip; returns distance_miles, duration_minutes and fare_amount.
+
+    Returns None when any coordinate is missing.
+    """
+    if None in (pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude):
+        return None
+    card = rate_card or DEFAULT_RATE_CARD
+    miles = haversine_km(float(pickup_latitude), float(pickup_longitude),
+                         float(dropoff_latitude), float(dropoff_longitude)) * KM_TO_MILES * card.route_factor
+    minutes = max(card.minimum_minutes, int(round(miles / card.average_speed_mph * 60)))
+    return {
+        'distance_miles': round(miles, 2),
+        'duration_minutes': minutes,
+        'fare_amount': card.fare(miles, minutes),
+    }
+
+
+def estimate_batch(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude,
+                   rate_card: RateCard = None) -> Tuple:
+    """Vectorized estimate() over arrays; returns (miles, minutes, fares) arrays.
+
+    Entries with a NaN coordinate come back as NaN (minutes as -1).
+    """
+    if np is None:
+        raise ImportError("numpy is required for estimate_batch()")
+    card = rate_card or DEFAULT_RATE_CARD
+    lat1 = np.radians(np.asarray(pickup_latitude, dtype=float))
+    lon1 = np.radians(np.asarray(pickup_longitude, dtype=float))
+    lat2 = np.radians(np.asarray(dropoff_latitude, dtype=float))
+    lon2 = np.radians(np.asarray(dropoff_longitude, dtype=float))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    miles = km * KM_TO_MILES * card.route_factor
+
+    missing = np.isnan(miles)
+    minutes = np.maximum(card.minimum_minutes,
+                         np.rint(np.nan_to_num(miles) / card.average_speed_mph * 60)).astype(np.int64)
+    metered = card.base_fare + card.per_mile * miles + card.per_minute * minutes
+    fares = np.round(np.maximum(card.minimum_fare, metered * card.surge_multiplier)
+                     + card.booking_fee, 2)
+    minutes[missing] = -1
+    return np.round(miles, 2), minutes, fares
+
+
+# ==================== BACKFILL ====================
+
+def _case(column: str, rows: int) -> str:
+    return f"{column} = CASE ride_id " + "WHEN %s THEN %s " * rows + "END"
+
+
+def _bump_rides_versions(cursor, ride_ids: List[int]):
+    """Advance rides_version for the drivers and riders of ride_ids (ride page ETags)."""
+    placeholders = ', '.join(['%s'] * len(ride_ids))
+    for table, column in (('DRIVER', 'driver_id'), ('RIDER', 'rider_id')):
+        cursor.execute(f"UPDATE {table} SET rides_version = rides_version + 1 "
+                       f"WHERE {column} IN (SELECT {column} FROM RIDE WHERE ride_id IN ({placeholders}))",
+                       ride_ids)
+
+
+def backfill(connection, chunk_size: int = 10000, rate_card: RateCard = None,
+             recompute_all: bool = False, recompute_fares: bool = False,
+             statement_rows: int = 1000, report: Callable = print) -> Dict:
+    """Fill distance, duration and fare for rides with both coordinates.
+
+    Walks RIDE in ride_id order, chunk_size rows per read and one commit per
+    chunk, so it can run over millions of rides on a live database. Only rides
+    missing a distance or duration are touched unless recompute_all. Existing
+    fares are kept (and cancelled rides never get one) unless recompute_fares.
+    """
+    card = rate_card or DEFAULT_RATE_CARD
+    pending_filter = "" if recompute_all else "AND (distance_miles IS NULL OR duration_minutes IS NULL)"
+    select = f"""
+    SELECT ride_id, pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
+    FROM RIDE
+    WHERE ride_id > %s AND pickup_latitude IS NOT NULL AND pickup_longitude IS NOT NULL
+      AND dropoff_latitude IS NOT NULL AND dropoff_longitude IS NOT NULL {pending_filter}
+    ORDER BY ride_id
+    LIMIT %s
+    """
+    cursor = connection.cursor()
+    last_id = 0
+    updated = 0
+    started = time.perf_counter()
+    try:
+        while True:
+            cursor.execute(select, (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            ride_ids = [int(ride_id) for ride_id in columns[0]]
+            miles, minutes, fares = estimate_batch(columns[1], columns[2], columns[3],
+                                                   columns[4], card)
+            miles, minutes, fares = miles.tolist(), minutes.tolist(), fares.tolist()
+
+            for start in range(0, len(ride_ids), statement_rows):
+                ids = ride_ids[start:start + statement_rows]
+                part = slice(start, start + len(ids))
+                fare_values = f"CASE ride_id {'WHEN %s THEN %s ' * len(ids)}END"
+                if not recompute_fares:
+                    fare_values = f"COALESCE(fare_amount, {fare_values})"
+                query = (f"UPDATE RIDE SET {_case('distance_miles', len(ids))}, "
+                         f"{_case('duration_minutes', len(ids))}, "
+                         f"fare_amount = CASE WHEN ride_status = 'cancelled' THEN fare_amount "
+                         f"ELSE {fare_values} END "
+                         f"WHERE ride_id IN ({', '.join(['%s'] * len(ids))})")
+                params = []
+                for values in (miles[part], minutes[part], fares[part]):
+                    for ride_id, value in zip(ids, values):
+                        params.extend((ride_id, value))
+                params.extend(ids)
+                cursor.execute(query, params)
+                _bump_rides_versions(cursor, ids)
+            connection.commit()
+
+            updated += len(ride_ids)
+            last_id = ride_ids[-1]
+            elapsed = time.perf_counter() - started
+            report(f"  {updated:,} rides updated through ride_id {last_id:,} "
+                   f"({updated / elapsed if elapsed else 0:,.0f} rides/s)")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {'updated': updated, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def main():
+    """Main entry point: backfill RIDE distance, duration and fare."""
+    parser = argparse.ArgumentParser(description="Backfill ride distance, duration and fare estimates.")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="rides read and committed per chunk (default 10000)")
+    parser.add_argument("--all", action="store_true",
+                        help="recompute every ride with coordinates, not just missing values")
+    parser.add_argument("--recompute-fares", action="store_true",
+                        help="overwrite existing fares with the rate card estimate")
+    parser.add_argument("--rate-card", help="JSON rate card (default: RIDESHARE_RATE_CARD or built-in)")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=None,
+                        help="database backend (default: RIDESHARE_DB_BACKEND or mysql)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="SQLite database file (default: RIDESHARE_SQLITE_PATH or rideshare.db)")
+    args = parser.parse_args()
+
+    from db_backends import Error, create_backend
+    card = RateCard.from_file(args.rate_card) if args.rate_card else RateCard.from_env()
+    backend = create_backend(args.backend, path=args.sqlite_path)
+    if backend.needs_password and backend.password is None:
+        backend.password = os.environ.get('MYSQL_PASSWORD', '')
+
+    try:
+        connection = backend.connect()
+    except Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+    print(f"Backfilling ride estimates ({backend.describe()}) with rate card {card.to_dict()}")
+    try:
+        result = backfill(connection, args.chunk_size, card, args.all, args.recompute_fares)
+        print(f"\nDone: {result['updated']:,} rides in {result['seconds']}s")
+    except Error as e:
+        print(f"Error backfilling rides: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
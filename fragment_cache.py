@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Fragment Cache
+Cache of rendered ride table rows for the Jinja templates.
+
+Ride history and rating pages render one table row per ride; for riders and
+drivers with long histories that is most of the request's CPU. Templates call
+cached_rows('fragments/<row>.html', rides) instead of looping themselves: each
+row is rendered once per (ride_id, updated_at) and the joined rows of a whole
+table are cached too, so an unchanged page costs a few dictionary lookups.
+
+Entries are evicted least recently used once their rendered size passes a
+byte budget. DatabaseOperations.invalidate_ride() drops every row and table
+holding a ride when it is written, which covers two writes within the same
+updated_at second. It also stamps the ride with a new generation; a render
+that read its rides before that write is not stored, so it can't put the old
+row back after the invalidation.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+from flask import g
+from markupsafe import Markup
+
+# Rough per-entry bookkeeping (key tuple, index sets) on top of the HTML itself
+ENTRY_OVERHEAD_BYTES = 200
+# Rides whose last invalidation is remembered exactly; older ones share a floor
+GENERATION_HISTORY = 65536
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered HTML fragments bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[Hashable, tuple[str, int, tuple[int, ...]]]" = OrderedDict()
+        # ride_id -> keys of the rows and tables that contain it
+        self._by_ride: Dict[int, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        # ride_id -> generation of its last invalidation, oldest first. Rides
+        # pruned from the history (or never invalidated) are at the floor.
+        self._generation = 0
+        self._generations: "OrderedDict[int, int]" = OrderedDict()
+        self._generation_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self) -> int:
+        """Current generation; take it before reading the rides to be rendered."""
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, html: str, ride_ids: Iterable[int], since: int = None):
+        """Store html for key, remembering which rides it shows.
+
+        With since (a generation() taken before the rides were read), html is
+        dropped if any of the rides has been invalidated since then.
+        """
+        ride_ids = tuple(ride_ids)
+        size = sys.getsizeof(html) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if since is not None and any(self._generations.get(ride_id, self._generation_floor) > since
+                                         for ride_id in ride_ids):
+                self.stale_puts += 1
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (html, size, ride_ids)
+            self.bytes += size
+            for ride_id in ride_ids:
+                self._by_ride.setdefault(ride_id, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        """Drop key and its index entries (caller holds the lock)."""
+        _, size, ride_ids = self._data.pop(key)
+        self.bytes -= size
+        for ride_id in ride_ids:
+            keys = self._by_ride.get(ride_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_ride[ride_id]
+
+    def invalidate_ride(self, ride_id: int):
+        """Drop every fragment showing ride_id (call after the ride is written)."""
+        with self._lock:
+            self._generation += 1
+            self._generations[ride_id] = self._generation
+            self._generations.move_to_end(ride_id)
+            while len(self._generations) > GENERATION_HISTORY:
+                # A pruned ride reads as the floor, which is at least its own generation
+                _, self._generation_floor = self._generations.popitem(last=False)
+            for key in list(self._by_ride.get(ride_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_ride.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_puts': self.stale_puts,
+            }
+
+    # ==================== RENDERING ====================
+
+    def render_rows(self, env, template_name: str, rides: List[Dict], since: int = None,
+                    **context) -> Markup:
+        """Rendered rows of template_name for rides, each rendered with ride=<row>.
+
+        context is passed to every row and is part of the keys, so it must be
+        hashable (ids and flags, not rows). Rides without an updated_at are
+        rendered every time since there is nothing to tell their versions apart.
+        since is the generation() taken before rides were read (default: now).
+        """
+        if since is None:
+            since = self.generation()
+        extra = tuple(sorted(context.items()))
+        versions = tuple((ride['ride_id'], ride.get('updated_at')) for ride in rides)
+        cacheable = all(updated_at is not None for _, updated_at in versions)
+        table_key = ('table', template_name, extra, versions)
+        if cacheable:
+            html = self.get(table_key)
+            if html is not None:
+                return Markup(html)
+
+        template = env.get_template(template_name)
+        parts = []
+        for ride, (ride_id, updated_at) in zip(rides, versions):
+            row_key = ('row', template_name, extra, ride_id, updated_at)
+            html = self.get(row_key) if updated_at is not None else None
+            if html is None:
+                html = template.render(ride=ride, **context)
+                if updated_at is not None:
+                    self.put(row_key, html, (ride_id,), since)
+            parts.append(html)
+        html = "".join(parts)
+        if cacheable:
+            self.put(table_key, html, [ride_id for ride_id, _ in versions], since)
+        return Markup(html)
+
+
+def install(app, cache: FragmentCache):
+    """Expose cache to app's templates as cached_rows(template_name, rides, **context).
+
+    Each request notes the cache generation before its route reads any rides,
+    so rows rendered from rides written mid-request are not cached.
+    """
+    @app.before_request
+    def note_fragment_generation():
+        g.fragment_generation = cache.generation()
+
+    def cached_rows(template_name: str, rides: List[Dict], **context) -> Markup:
+        return cache.render_rows(app.jinja_env, template_name, rides,
+                                 g.get('fragment_generation'), **context)
+
+    app.jinja_env.globals['cached_rows'] = cached_rows
+    return cache
+
+
+def precompile_templates(app) -> int:
+    """Compile every template into app's Jinja cache (and bytecode cache, if set).
+
+    Returns the number of templates loaded. Run at startup so the first
+    request for each page doesn't pay for parsing and compiling it.
+    """
+    env = app.jinja_env
+    names = env.list_templates(extensions=('html',))
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Synthetic Data Generator
+Seeded generator that fills the rideshare database with production-sized data
+for load and performance testing.
+
+Every generated account uses the password "password123". Usernames are
+"rider<rider_id>" and "driver<driver_id>".
+
+Usage:
+    python generate_data.py --riders 200000 --drivers 20000 --rides 2000000 --seed 42
+    python generate_data.py --backend sqlite --sqlite-path rideshare.db --scale 0.1
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+from db_backends import Error, SQLiteConnection, create_backend
+from db_operations import RATING_STATS_REBUILD_SQL
+from spatial_index import haversine_km
+
+KM_TO_MILES = 0.621371
+
+# Metro areas rides are generated around: (latitude, longitude, weight)
+CITY_CENTERS = [
+    (34.0522, -118.2437, 0.30),  # Los Angeles
+    (37.7749, -122.4194, 0.20),  # San Francisco
+    (40.7128, -74.0060, 0.25),   # New York
+    (41.8781, -87.6298, 0.15),   # Chicago
+    (47.6062, -122.3321, 0.10),  # Seattle
+]
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael",
+               "Linda", "David", "Elizabeth", "William", "Barbara", "Richard", "Susan",
+               "Joseph", "Jessica", "Thomas", "Sarah", "Carlos", "Maria", "Wei", "Priya"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+              "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson",
+              "Thomas", "Taylor", "Moore", "Jackson", "Nguyen", "Kim", "Patel", "Chen"]
+VEHICLES = [("Toyota", "Camry"), ("Toyota", "Prius"), ("Honda", "Accord"), ("Honda", "Civic"),
+            ("Ford", "Fusion"), ("Tesla", "Model 3"), ("Hyundai", "Sonata"),
+            ("Chevrolet", "Malibu"), ("Nissan", "Altima"), ("Kia", "Niro")]
+COLORS = ["Black", "White", "Silver", "Gray", "Blue", "Red"]
+PAYMENTS = [("Credit Card", "Visa"), ("Credit Card", "Mastercard"),
+            ("Debit Card", "Visa"), ("PayPal", "PayPal"), ("Apple Pay", "Apple Pay")]
+
+# Ride status mix and the share of completed rides that get rated
+STATUS_WEIGHTS = [("completed", 0.86), ("cancelled", 0.08),
+                  ("in_progress", 0.02), ("pending", 0.04)]
+RATED_SHARE = 0.75
+
+# Upper bound on bound parameters per INSERT (SQLite allows 32766 by default)
+MAX_STATEMENT_PARAMS = 30000
+
+PASSWORD = "password123"
+
+
+class DataGenerator:
+    """Produces deterministic rows for USER, DRIVER, RIDER and RIDE."""
+
+    def __init__(self, seed: int, riders: int, drivers: int, rides: int, years: float,
+                 first_user_id: int, first_driver_id: int, first_rider_id: int,
+                 first_ride_id: int, active_share: float = 0.3):
+        """Configure the scale and the first free primary key of each table."""
+        self.rng = random.Random(seed)
+        self.riders = riders
+        self.drivers = drivers
+        self.rides = rides
+        self.years = years
+        self.first_user_id = first_user_id
+        self.first_driver_id = first_driver_id
+        self.first_rider_id = first_rider_id
+        self.first_ride_id = first_ride_id
+        self.active_share = active_share
+        self.now = datetime.now().replace(microsecond=0)
+
+        self._city_cumulative = []
+        total = 0.0
+        for lat, lon, weight in CITY_CENTERS:
+            total += weight
+            self._city_cumulative.append(total)
+
+        # Per-driver traits: home city, rating quality offset and popularity
+        self.driver_city = [self._pick_city() for _ in range(drivers)]
+        self.driver_quality = [self.rng.gauss(0.0, 0.35) for _ in range(drivers)]
+        self.rider_city = [self._pick_city() for _ in range(riders)]
+        self.driver_active = [False] * drivers
+
+    def _pick_city(self) -> int:
+        """Choose a city index according to CITY_CENTERS weights."""
+        point = self.rng.random() * self._city_cumulative[-1]
+        for index, bound in enumerate(self._city_cumulative):
+            if point <= bound:
+                return index
+        return len(CITY_CENTERS) - 1
+
+    def _point_near(self, city: int, spread_deg: float) -> Tuple[float, float]:
+        """Random coordinate normally distributed around a city center."""
+        lat, lon, _ = CITY_CENTERS[city]
+        return (round(lat + self.rng.gauss(0, spread_deg), 6),
+                round(lon + self.rng.gauss(0, spread_deg), 6))
+
+    def _name(self) -> str:
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _phone(self) -> str:
+        return f"555-{self.rng.randint(100, 999)}-{self.rng.randint(1000, 9999)}"
+
+    def users(self) -> Iterable[Tuple]:
+        """USER rows: riders first, then drivers."""
+        for n in range(self.riders):
+            uid = self.first_user_id + n
+            yield (uid, f"rider{self.first_rider_id + n}", PASSWORD,
+                   f"rider{self.first_rider_id + n}@example.com", self._phone(), self._name())
+        for n in range(self.drivers):
+            uid = self.first_user_id + self.riders + n
+            yield (uid, f"driver{self.first_driver_id + n}", PASSWORD,
+                   f"driver{self.first_driver_id + n}@example.com", self._phone(), self._name())
+
+    def riders_rows(self) -> Iterable[Tuple]:
+        """RIDER rows linked to the first block of users."""
+        for n in range(self.riders):
+            payment_info, preferred = self.rng.choice(PAYMENTS)
+            last4 = f"{self.rng.randint(0, 9999):04d}" if payment_info != "PayPal" else None
+            lat, lon = self._point_near(self.rider_city[n], 0.05)
+            yield (self.first_rider_id + n, self.first_user_id + n, payment_info,
+                   preferred, last4, f"{lat:.4f},{lon:.4f}")
+
+    def drivers_rows(self) -> Iterable[Tuple]:
+        """DRIVER rows linked to the second block of users."""
+        today = self.now.date()
+        for n in range(self.drivers):
+            make, model = self.rng.choice(VEHICLES)
+            active = self.rng.random() < self.active_share
+            self.driver_active[n] = active
+            lat, lon = self._point_near(self.driver_city[n], 0.08) if active else (None, None)
+            driver_id = self.first_driver_id + n
+            yield (driver_id, self.first_user_id + self.riders + n, f"DL{driver_id:08d}",
+                   today + timedelta(days=self.rng.randint(30, 1500)), make, model,
+                   self.rng.randint(2010, 2024), self.rng.choice(COLORS),
+                   f"{self.rng.randint(100, 999)}-{driver_id % 100000:05d}",
+                   f"INS{driver_id:08d}", 'active' if active else 'inactive', lat, lon,
+                   today - timedelta(days=self.rng.randint(0, int(365 * self.years))))
+
+    def _pick_driver(self, city: int) -> int:
+        """Pick a driver index, favouring a small set of heavy drivers."""
+        # Power-law skew: low indexes get most rides, but every driver gets some
+        n = int(self.drivers * (self.rng.random() ** 2.2))
+        if self.driver_city[n] != city and self.rng.random() < 0.8:
+            # Mostly keep rides local by retrying once in the rider's city
+            m = int(self.drivers * (self.rng.random() ** 2.2))
+            if self.driver_city[m] == city:
+                n = m
+        return n
+
+    def _pick_status(self) -> str:
+        point = self.rng.random()
+        for status, weight in STATUS_WEIGHTS:
+            point -= weight
+            if point <= 0:
+                return status
+        return STATUS_WEIGHTS[0][0]
+
+    def rides_rows(self) -> Iterable[Tuple]:
+        """RIDE rows with coordinates, status mix, rating skew and timestamps."""
+        span_seconds = int(self.years * 365 * 86400)
+        # Open rides go to drivers who are off the dispatch pool, one each, so
+        # active drivers stay claimable and completing a ride never frees a driver twice
+        drivers_with_open_ride = set()
+        for n in range(self.rides):
+            rider = self.rng.randrange(self.riders)
+            city = self.rider_city[rider]
+            driver = self._pick_driver(city)
+            status = self._pick_status()
+            if status in ('pending', 'in_progress'):
+                if self.driver_active[driver] or driver in drivers_with_open_ride:
+                    status = 'completed'
+                else:
+                    drivers_with_open_ride.add(driver)
+
+            pickup_lat, pickup_lon = self._point_near(city, 0.08)
+            trip_spread = abs(self.rng.gauss(0, 0.06)) + 0.005
+            dropoff_lat = round(pickup_lat + self.rng.gauss(0, trip_spread), 6)
+            dropoff_lon = round(pickup_lon + self.rng.gauss(0, trip_spread), 6)
+            miles = haversine_km(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon) * KM_TO_MILES * 1.3
+            minutes = max(3, int(miles / max(8.0, self.rng.gauss(22.0, 6.0)) * 60))
+
+            if status in ('pending', 'in_progress'):
+                created_at = self.now - timedelta(seconds=self.rng.randint(0, 3600))
+            else:
+                # Ride volume grows over time: bias timestamps toward the present
+                age = span_seconds * (1 - math.sqrt(self.rng.random()))
+                created_at = self.now - timedelta(seconds=int(age))
+            pickup_time = created_at + timedelta(minutes=self.rng.randint(2, 12))
+            dropoff_time = pickup_time + timedelta(minutes=minutes) if status == 'completed' else None
+
+            fare = round(2.50 + 1.75 * miles + 0.35 * minutes, 2) if status != 'cancelled' else None
+            rating = None
+            comment = None
+            if status == 'completed' and self.rng.random() < RATED_SHARE:
+                score = self.rng.gauss(4.4 + self.driver_quality[driver], 0.8)
+                rating = min(5, max(1, int(round(score))))
+
+            yield (self.first_ride_id + n, self.first_driver_id + driver,
+                   self.first_rider_id + rider, f"Pickup {pickup_lat:.4f},{pickup_lon:.4f}",
+                   pickup_lat, pickup_lon, f"Dropoff {dropoff_lat:.4f},{dropoff_lon:.4f}",
+                   dropoff_lat, dropoff_lon, pickup_time, dropoff_time, status, rating,
+                   comment, fare, round(miles, 2), minutes, created_at, created_at)
+
+
+USER_COLUMNS = ("user_id", "username", "password", "email", "phone_number", "full_name")
+RIDER_COLUMNS = ("rider_id", "user_id", "payment_info", "preferred_payment",
+                 "credit_card_last4", "default_location")
+DRIVER_COLUMNS = ("driver_id", "user_id", "license_number", "license_expiry", "vehicle_make",
+                  "vehicle_model", "vehicle_year", "vehicle_color", "license_plate",
+                  "insurance_number", "driver_mode", "current_latitude", "current_longitude",
+                  "registration_date")
+RIDE_COLUMNS = ("ride_id", "driver_id", "rider_id", "pickup_location", "pickup_latitude",
+                "pickup_longitude", "dropoff_location", "dropoff_latitude", "dropoff_longitude",
+                "pickup_time", "dropoff_time", "ride_status", "rating", "rating_comment",
+                "fare_amount", "distance_miles", "duration_minutes", "created_at", "updated_at")
+
+
+def insert_chunked(connection, table: str, columns: Sequence[str], rows: Iterable[Tuple],
+                   total: int, chunk_size: int, report: Callable = print) -> int:
+    """Insert rows with multi-row INSERTs and one commit per chunk."""
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    rows_per_statement = max(1, MAX_STATEMENT_PARAMS // len(columns))
+    cursor = connection.cursor()
+    inserted = 0
+    started = time.perf_counter()
+    chunk: List = []
+
+    def flush():
+        nonlocal inserted
+        for start in range(0, len(chunk), rows_per_statement):
+            batch = chunk[start:start + rows_per_statement]
+            sql = prefix + ", ".join([placeholders] * len(batch))
+            cursor.execute(sql, [value for row in batch for value in row])
+        connection.commit()
+        inserted += len(chunk)
+        chunk.clear()
+        elapsed = time.perf_counter() - started
+        rate = inserted / elapsed if elapsed else 0.0
+        report(f"  {table}: {inserted:,}/{total:,} ({inserted / total:.1%}) "
+               f"{rate:,.0f} rows/s")
+
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        cursor.close()
+    return inserted
+
+
+def next_id(connection, table: str, column: str) -> int:
+    """First unused primary key value of a table."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+        return int(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+
+def reset_tables(connection):
+    """Delete all rows from every rideshare table."""
+    tables = ("DRIVER_RATING_STATS", "RIDE", "DRIVER", "RIDER", "USER")
+    cursor = connection.cursor()
+    try:
+        if isinstance(connection, SQLiteConnection):
+            # SQLite has no TRUNCATE; deleting children first satisfies the foreign keys
+            for table in tables:
+                cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in tables:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def rebuild_rating_stats(connection):
+    """Recompute DRIVER_RATING_STATS after bulk-loading rated rides."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM DRIVER_RATING_STATS")
+        cursor.execute(RATING_STATS_REBUILD_SQL.format(driver_filter=""))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def generate(connection, riders: int, drivers: int, rides: int, seed: int = 42,
+             years: float = 3.0, chunk_size: int = 5000, reset: bool = False,
+             report: Callable = print) -> dict:
+    """Generate and insert a full dataset; returns row counts and timings."""
+    if riders < 1 or drivers < 1:
+        raise ValueError("Need at least one rider and one driver")
+    if reset:
+        report("Clearing existing data...")
+        reset_tables(connection)
+
+    generator = DataGenerator(
+        seed, riders, drivers, rides, years,
+        first_user_id=next_id(connection, "USER", "user_id"),
+        first_driver_id=next_id(connection, "DRIVER", "driver_id"),
+        first_rider_id=next_id(connection, "RIDER", "rider_id"),
+        first_ride_id=next_id(connection, "RIDE", "ride_id"),
+    )
+
+    started = time.perf_counter()
+    counts = {
+        'users': insert_chunked(connection, "USER", USER_COLUMNS, generator.users(),
+                                riders + drivers, chunk_size, report),
+        'riders': insert_chunked(connection, "RIDER", RIDER_COLUMNS, generator.riders_rows(),
+                                 riders, chunk_size, report),
+        'drivers': insert_chunked(connection, "DRIVER", DRIVER_COLUMNS, generator.drivers_rows(),
+                                  drivers, chunk_size, report),
+        'rides': insert_chunked(connection, "RIDE", RIDE_COLUMNS, generator.rides_rows(),
+                                rides, chunk_size, report) if rides else 0,
+    }
+    report("Rebuilding driver rating stats...")
+    rebuild_rating_stats(connection)
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Generate synthetic rideshare data at scale.")
+    parser.add_argument("--riders", type=int, default=10000, help="number of riders (default 10000)")
+    parser.add_argument("--drivers", type=int, default=1000, help="number of drivers (default 1000)")
+    parser.add_argument("--rides", type=int, default=100000, help="number of rides (default 100000)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply --riders/--drivers/--rides by this factor")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default 42)")
+    parser.add_argument("--years", type=float, default=3.0,
+                        help="spread ride timestamps over this many years (default 3)")
+    parser.add_argument("--chunk-size", type=int, default=5000,
+                        help="rows per commit (default 5000)")
+    parser.add_argument("--reset", action="store_true", help="delete existing rows first")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"],
+                        default=os.environ.get('RIDESHARE_DB_BACKEND', 'mysql'),
+                        help="database backend (default: RIDESHARE_DB_BACKEND or mysql)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="SQLite database file (default: RIDESHARE_SQLITE_PATH or rideshare.db)")
+    args = parser.parse_args()
+
+    riders = int(args.riders * args.scale)
+    drivers = int(args.drivers * args.scale)
+    rides = int(args.rides * args.scale)
+
+    print("Rideshare Database - Synthetic Data Generator")
+    print("=" * 50)
+    print(f"Riders: {riders:,}  Drivers: {drivers:,}  Rides: {rides:,}  Seed: {args.seed}")
+
+    if args.backend == "sqlite":
+        try:
+            connection = create_backend("sqlite", path=args.sqlite_path).connect()
+        except Error as e:
+            print(f"Error opening SQLite database: {e}")
+            connection = None
+    else:
+        from sample_data import connect_to_db
+        connection = connect_to_db(password=os.environ.get('MYSQL_PASSWORD'))
+    if not connection:
+        print("Failed to connect to database.")
+        sys.exit(1)
+
+    try:
+        if not args.yes:
+            action = "DELETE ALL DATA and insert" if args.reset else "insert"
+            confirm = input(f"\nThis will {action} synthetic data. Continue? (yes/no): ").strip().lower()
+            if confirm not in ['yes', 'y']:
+                print("Cancelled.")
+                return
+        counts = generate(connection, riders, drivers, rides, seed=args.seed, years=args.years,
+                          chunk_size=args.chunk_size, reset=args.reset)
+        print(f"\nDone in {counts['seconds']}s: {counts['users']:,} users, {counts['drivers']:,} drivers, "
+              f"{counts['riders']:,} riders, {counts['rides']:,} rides")
+    except Error as e:
+        connection.rollback()
+        print(f"Error generating data: {e}")
+        sys.exit(1)
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+
+if __name__ == "__main__":
+    main()
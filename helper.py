@@ -8,7 +8,7 @@ Authors:
 - Gustavo de Moraes (002427902) - demoraes@chapman.edu
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
 
@@ -177,6 +177,36 @@ class Helper:
         except ValueError:
             return None
     
+    def validate_coordinates(self, latitude: str, longitude: str) -> Optional[Tuple[float, float]]:
+        """Validate and convert a latitude/longitude pair (both required)."""
+        try:
+            lat = float(latitude)
+            lon = float(longitude)
+        except (TypeError, ValueError):
+            return None
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return lat, lon
+        return None
+    
+    def encode_page_cursor(self, position: Optional[Tuple]) -> Optional[str]:
+        """Encode a (created_at, ride_id) keyset position for use in a URL."""
+        if not position:
+            return None
+        created_at, ride_id = position
+        if isinstance(created_at, datetime):
+            created_at = created_at.isoformat()
+        return f"{created_at}_{ride_id}"
+    
+    def decode_page_cursor(self, cursor: str) -> Optional[Tuple[datetime, int]]:
+        """Decode a page cursor from encode_page_cursor; None if malformed."""
+        if not cursor:
+            return None
+        try:
+            created_at, ride_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(created_at), int(ride_id)
+        except ValueError:
+            return None
+    
     def sanitize_input(self, user_input: str) -> str:
         """Sanitize user input to prevent SQL injection (though we use parameterized queries)."""
         if not user_input:
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Load Generator
+Puts realistic concurrent rider and driver traffic on web_app.py and reports
+throughput, per-route latency percentiles and error rates.
+
+Virtual drivers register, share their location and then, at --driver-rate
+arrivals per second, toggle their mode and move their open rides along
+(pending -> in_progress -> completed). Virtual riders register and then, at
+--rider-rate arrivals per second, log in, request a ride, view their rides and
+the new ride, and rate it. Arrivals are Poisson (open loop): a slow server does
+not slow the generator down, it shows up as latency and as start lag.
+
+Runs in-process through the Flask test client by default, or against a
+running server with --url. Every account is created through the app's own
+registration pages, so no database access is needed for --url.
+
+Usage:
+    python load_test.py --drivers 20 --riders 100 --duration 60
+    python load_test.py --backend sqlite --rider-rate 20 --driver-rate 5
+    python load_test.py --url http://localhost:8080 --duration 120 --output load.json
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from benchmark import percentile, summarize
+
+# Drivers and pickups are spread around this point so dispatch finds matches
+CENTER = (34.0522, -118.2437)
+SPREAD_DEG = 0.05
+PASSWORD = "loadtest123"
+
+_RIDER_RIDE = re.compile(r"/rider/rides/(\d+)")
+# A driver's open ride: its status badge, then its detail link in the same row
+_OPEN_DRIVER_RIDE = re.compile(r"status-(pending|in_progress)\">.*?/driver/rides/(\d+)", re.DOTALL)
+
+
+# ==================== TRANSPORTS ====================
+
+class TestClientSession:
+    """One virtual user's cookie session on the in-process Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, data: Dict = None,
+                json_body: Dict = None) -> Tuple[int, Dict, str]:
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        return response.status_code, dict(response.headers), response.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One virtual user's cookie session against a running server."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method: str, path: str, data: Dict = None,
+                json_body: Dict = None) -> Tuple[int, Dict, str]:
+        body = None
+        headers = {}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers,
+                                         method=method)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, dict(response.headers), response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            # Redirects land here too, since they are not followed
+            return e.code, dict(e.headers), e.read().decode('utf-8', 'replace')
+
+
+# ==================== RECORDING ====================
+
+class Recorder:
+    """Thread-safe latency samples, errors and status codes per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.outcomes: Counter = Counter()
+        self.lags: List[float] = []
+
+    def call(self, session, route: str, method: str, path: str, expect: Tuple[int, ...],
+             data: Dict = None, json_body: Dict = None) -> Tuple[Optional[int], Dict, str]:
+        """Make one request, recording it under route; unexpected statuses count as errors."""
+        started = time.perf_counter()
+        try:
+            status, headers, body = session.request(method, path, data, json_body)
+        except Exception:
+            status, headers, body = None, {}, ""
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[route].append(elapsed)
+            self.statuses[route][str(status) if status else 'exception'] += 1
+            if status not in expect:
+                self.errors[route] += 1
+        return status, headers, body
+
+    def outcome(self, name: str):
+        with self._lock:
+            self.outcomes[name] += 1
+
+    def lag(self, seconds: float):
+        with self._lock:
+            self.lags.append(seconds)
+
+    def report(self, seconds: float) -> Dict:
+        routes = {}
+        total = 0
+        errors = 0
+        with self._lock:
+            for route, samples in sorted(self.samples.items()):
+                stats = summarize(samples, self.errors[route])
+                stats['error_rate'] = self.errors[route] / len(samples) if samples else 0.0
+                stats['requests_per_sec'] = len(samples) / seconds if seconds else 0.0
+                stats['statuses'] = dict(self.statuses[route])
+                routes[route] = stats
+                total += len(samples)
+                errors += self.errors[route]
+            lags = sorted(self.lags)
+        return {
+            'requests': total,
+            'errors': errors,
+            'error_rate': errors / total if total else 0.0,
+            'throughput_rps': total / seconds if seconds else 0.0,
+            'start_lag_p95_ms': percentile(lags, 95) * 1000,
+            'start_lag_max_ms': lags[-1] * 1000 if lags else 0.0,
+            'outcomes': dict(self.outcomes),
+            'routes': routes,
+        }
+
+
+# ==================== VIRTUAL USERS ====================
+
+class VirtualUser:
+    """A registered account with its own session; one scenario runs on it at a time."""
+
+    def __init__(self, kind: str, username: str, session):
+        self.kind = kind
+        self.username = username
+        self.session = session
+        self.lock = threading.Lock()
+
+
+def register(recorder: Recorder, session, kind: str, username: str) -> bool:
+    form = {'username': username, 'password': PASSWORD, 'email': f"{username}@example.com",
+            'full_name': f"Load {kind.title()} {username.rsplit('_', 1)[-1]}"}
+    if kind == 'driver':
+        form.update({'license_number': f"DL{abs(hash(username)) % 10 ** 8:08d}",
+                     'vehicle_make': 'Toyota', 'vehicle_model': 'Prius'})
+    status, headers, _ = recorder.call(session, f"POST /register/{kind}", 'POST',
+                                       f"/register/{kind}", (302,), data=form)
+    return status == 302
+
+
+def login(recorder: Recorder, user: VirtualUser) -> bool:
+    status, _, _ = recorder.call(user.session, f"POST /login/{user.kind}", 'POST',
+                                 f"/login/{user.kind}", (302,),
+                                 data={'username': user.username, 'password': PASSWORD})
+    return status == 302
+
+
+def random_point(rng: random.Random) -> Tuple[float, float]:
+    return (round(CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 6),
+            round(CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 6))
+
+
+def setup_users(recorder: Recorder, new_session, drivers: int, riders: int,
+                rng: random.Random) -> Tuple[List[VirtualUser], List[VirtualUser]]:
+    """Register every virtual user; drivers also log in, share a location and go active."""
+    stamp = f"{int(time.time())}{rng.randrange(1000):03d}"
+    driver_users, rider_users = [], []
+    for kind, count, users in (('driver', drivers, driver_users), ('rider', riders, rider_users)):
+        for index in range(count):
+            user = VirtualUser(kind, f"load_{kind}_{stamp}_{index}", new_session())
+            if register(recorder, user.session, kind, user.username):
+                users.append(user)
+    for user in driver_users:
+        if not login(recorder, user):
+            continue
+        latitude, longitude = random_point(rng)
+        recorder.call(user.session, "POST /driver/location", 'POST', "/driver/location", (200,),
+                      json_body={'latitude': latitude, 'longitude': longitude})
+        recorder.call(user.session, "POST /driver/toggle-mode", 'POST', "/driver/toggle-mode", (200,))
+    return driver_users, rider_users
+
+
+def driver_arrival(recorder: Recorder, user: VirtualUser, rng: random.Random):
+    """Move the driver's open rides along, then toggle their availability."""
+    status, _, body = recorder.call(user.session, "GET /driver/rides", 'GET', "/driver/rides", (200,))
+    if status == 200:
+        for ride_status, ride_id in _OPEN_DRIVER_RIDE.findall(body):
+            steps = ('in_progress', 'completed') if ride_status == 'pending' else ('completed',)
+            for step in steps:
+                recorder.call(user.session, "POST /driver/rides/<id>/status", 'POST',
+                              f"/driver/rides/{ride_id}/status", (302,), data={'ride_status': step})
+            recorder.outcome('rides_completed')
+    status, _, body = recorder.call(user.session, "POST /driver/toggle-mode", 'POST',
+                                    "/driver/toggle-mode", (200,))
+    if status == 200:
+        try:
+            mode = json.loads(body).get('mode')
+        except ValueError:
+            mode = None
+        recorder.outcome(f"driver_went_{mode}")
+        if mode == 'inactive' and rng.random() < 0.8:
+            # Most drivers come straight back on shift, so supply doesn't drain away
+            recorder.call(user.session, "POST /driver/toggle-mode", 'POST', "/driver/toggle-mode", (200,))
+
+
+def rider_arrival(recorder: Recorder, user: VirtualUser, rng: random.Random):
+    """Log in, request a ride, look at the ride history and the new ride, then rate it."""
+    if not login(recorder, user):
+        return
+    pickup, dropoff = random_point(rng), random_point(rng)
+    status, headers, _ = recorder.call(
+        user.session, "POST /rider/find-driver", 'POST', "/rider/find-driver", (200, 302),
+        data={'pickup_location': 'Load pickup', 'dropoff_location': 'Load dropoff',
+              'pickup_latitude': pickup[0], 'pickup_longitude': pickup[1],
+              'dropoff_latitude': dropoff[0], 'dropoff_longitude': dropoff[1]})
+    match = _RIDER_RIDE.search(headers.get('Location', '')) if status == 302 else None
+    recorder.outcome('ride_assigned' if match else 'no_driver')
+
+    recorder.call(user.session, "GET /rider/rides", 'GET', "/rider/rides", (200,))
+    if not match:
+        return
+    ride_id = match.group(1)
+    recorder.call(user.session, "GET /rider/rides/<id>", 'GET', f"/rider/rides/{ride_id}", (200,))
+    recorder.call(user.session, "GET /rider/rate", 'GET', "/rider/rate", (200,))
+    status, headers, _ = recorder.call(user.session, "POST /rider/rate", 'POST', "/rider/rate", (302,),
+                                       data={'ride_id': ride_id, 'rating': rng.choice((3, 4, 5, 5, 5)),
+                                             'rating_comment': ''})
+    # Both outcomes redirect: to the ride history when saved, back to the form when not
+    if status == 302:
+        rated = '/rider/rate' not in headers.get('Location', '')
+        recorder.outcome('rides_rated' if rated else 'rating_rejected')
+
+
+# ==================== RUN ====================
+
+def run(recorder: Recorder, driver_users: List[VirtualUser], rider_users: List[VirtualUser],
+        driver_rate: float, rider_rate: float, duration: float, concurrency: int,
+        seed: int) -> float:
+    """Fire Poisson arrivals for duration seconds; returns the wall time until all finished."""
+    rng = random.Random(seed)
+    streams = []
+    if driver_users and driver_rate > 0:
+        streams.append([rng.expovariate(driver_rate), driver_rate, driver_users, driver_arrival])
+    if rider_users and rider_rate > 0:
+        streams.append([rng.expovariate(rider_rate), rider_rate, rider_users, rider_arrival])
+
+    def arrive(scheduled: float, users: List[VirtualUser], scenario, task_seed: int):
+        recorder.lag(max(0.0, time.perf_counter() - scheduled))
+        task_rng = random.Random(task_seed)
+        # Pick a user who isn't mid-scenario; skip the arrival if all of them are busy
+        for user in task_rng.sample(users, min(len(users), 8)):
+            if user.lock.acquire(blocking=False):
+                try:
+                    scenario(recorder, user, task_rng)
+                finally:
+                    user.lock.release()
+                return
+        recorder.outcome(f"{users[0].kind}_arrival_skipped")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+        while streams:
+            stream = min(streams, key=lambda s: s[0])
+            offset, rate, users, scenario = stream
+            if offset >= duration:
+                streams.remove(stream)
+                continue
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(arrive, started + offset, users, scenario, rng.getrandbits(32))
+            stream[0] = offset + rng.expovariate(rate)
+    return time.perf_counter() - started
+
+
+def in_process_app(backend: Optional[str], sqlite_path: Optional[str]):
+    """web_app's Flask app with its database set up for the test client."""
+    import web_app
+    # web_app logs at DEBUG in development mode; keep that out of the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    if backend:
+        web_app.app.config['DB_BACKEND'] = backend
+    if sqlite_path:
+        web_app.app.config['SQLITE_PATH'] = sqlite_path
+    if web_app.init_db() is None:
+        return None
+    web_app.db_ops.release()
+    return web_app.app
+
+
+def print_report(report: Dict):
+    print(f"\n{'route':<34} {'count':>7} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<34} {stats['count']:>7} {stats['error_rate'] * 100:>5.1f}% "
+              f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+              f"{stats['requests_per_sec']:>8.1f}")
+    print(f"\n{report['requests']:,} requests, {report['throughput_rps']:.1f} req/s, "
+          f"{report['error_rate']:.2%} errors; start lag p95 {report['start_lag_p95_ms']:.1f} ms")
+    print(f"Outcomes: {report['outcomes']}")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Simulate concurrent riders and drivers against web_app.py.")
+    parser.add_argument("--drivers", type=int, default=20, help="virtual drivers (default 20)")
+    parser.add_argument("--riders", type=int, default=100, help="virtual riders (default 100)")
+    parser.add_argument("--driver-rate", type=float, default=2.0,
+                        help="driver arrivals per second across all drivers (default 2)")
+    parser.add_argument("--rider-rate", type=float, default=5.0,
+                        help="rider arrivals per second across all riders (default 5)")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="seconds to generate arrivals for (default 30)")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="most scenarios in flight at once (default 32)")
+    parser.add_argument("--seed", type=int, default=11, help="random seed (default 11)")
+    parser.add_argument("--url", help="base URL of a running server (default: in-process test client)")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=None,
+                        help="in-process database backend (default: RIDESHARE_DB_BACKEND or mysql)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="in-process SQLite database file (default: a new temporary file)")
+    parser.add_argument("--output", default="load_results.json", help="where to write results JSON")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.url:
+        target = args.url
+        new_session = lambda: HttpSession(args.url)
+    else:
+        sqlite_path = args.sqlite_path
+        if args.backend == "sqlite" and not sqlite_path:
+            temp_dir = tempfile.TemporaryDirectory()
+            sqlite_path = os.path.join(temp_dir.name, "load.db")
+        app = in_process_app(args.backend, sqlite_path)
+        if app is None:
+            print("Failed to connect to database.")
+            sys.exit(1)
+        target = f"test client ({app.config['DB_BACKEND']})"
+        new_session = lambda: TestClientSession(app)
+
+    rng = random.Random(args.seed)
+    try:
+        print(f"Registering {args.drivers} drivers and {args.riders} riders on {target}...")
+        setup = Recorder()
+        driver_users, rider_users = setup_users(setup, new_session, args.drivers, args.riders, rng)
+        if not driver_users or not rider_users:
+            print("Registration failed; is the server up and its database reachable?")
+            sys.exit(1)
+
+        print(f"Running {args.duration:.0f}s: {args.driver_rate}/s driver and {args.rider_rate}/s "
+              f"rider arrivals, up to {args.concurrency} at once...")
+        recorder = Recorder()
+        seconds = run(recorder, driver_users, rider_users, args.driver_rate, args.rider_rate,
+                      args.duration, args.concurrency, args.seed)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = recorder.report(seconds)
+    print_report(report)
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': target,
+            'drivers': len(driver_users),
+            'riders': len(rider_users),
+            'driver_rate': args.driver_rate,
+            'rider_rate': args.rider_rate,
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'seconds': round(seconds, 3),
+        },
+        'setup': setup.report(seconds),
+        'results': report,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
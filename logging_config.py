@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Logging Configuration
+Development and production logging setups for the web application.
+
+development (default): DEBUG to web_app.log and the console, written inline.
+production: INFO and up handed to a background thread through a bounded
+queue, written to a rotating web_app.log; WARNING and up are also echoed to
+stderr. Sub-WARNING records can be sampled per logger.
+
+Environment variables:
+    RIDESHARE_LOG_MODE     development | production
+    RIDESHARE_LOG_LEVEL    root level override (e.g. WARNING)
+    RIDESHARE_LOG_FILE     log file path (default web_app.log)
+    RIDESHARE_LOG_SAMPLE   per-logger sampling, e.g. "web_app=0.1,db_operations=0.01"
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# The listener of the active production setup, so reconfiguring can stop it
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records from selected loggers.
+
+    rates maps a logger name to the share of records kept (0.0 - 1.0); child
+    loggers inherit the closest configured ancestor's rate. Warnings and
+    errors are never sampled out.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def _rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return self.rates.get('', 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "name=rate,name=rate" into a dict; "*" or "root" sets the default."""
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, _, rate = item.partition("=")
+        name = name.strip()
+        try:
+            rates['' if name in ('*', 'root') else name] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+def _reset_root() -> logging.Logger:
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    return root
+
+
+def configure_logging(mode: str = None, log_file: str = None, level: str = None,
+                      sample_rates: Dict[str, float] = None, max_bytes: int = 10 * 1024 * 1024,
+                      backup_count: int = 5, queue_size: int = 10000) -> logging.Logger:
+    """Configure the root logger for mode ("development" or "production").
+
+    Arguments left as None are read from the RIDESHARE_LOG_* environment
+    variables. Returns the root logger.
+    """
+    mode = (mode or os.environ.get('RIDESHARE_LOG_MODE') or 'development').lower()
+    log_file = log_file or os.environ.get('RIDESHARE_LOG_FILE', 'web_app.log')
+    level = level or os.environ.get('RIDESHARE_LOG_LEVEL')
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.environ.get('RIDESHARE_LOG_SAMPLE', ''))
+
+    root = _reset_root()
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    if mode != 'production':
+        root.setLevel(level or logging.DEBUG)
+        for handler in (logging.FileHandler(log_file), logging.StreamHandler()):
+            handler.setFormatter(formatter)
+            root.addHandler(handler)
+        return root
+
+    global _listener
+    root.setLevel(level or logging.INFO)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(formatter)
+
+    # Request threads only filter and enqueue; formatting and I/O happen on the listener thread
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer (safe to call twice)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Metrics
+Per-method and per-route call metrics rendered in the Prometheus text format.
+
+instrument() wraps every public DatabaseOperations method of one instance so
+each call records its count, latency, rows returned and errors; web_app.py
+records each request against its route template and serves everything, plus
+pool/cache/statement gauges, at /metrics.
+
+Recording takes two perf_counter() reads, one uncontended lock and a bisect
+into the fixed latency buckets, which keeps the per-call cost to a couple of
+microseconds.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+from db_backends import Error
+
+# Latency bucket upper bounds in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Not data access: connection lifecycle and the metrics/caching helpers themselves
+SKIPPED_METHODS = ('connect', 'disconnect', 'checkout', 'release', 'transaction',
+                   'pool_stats', 'cache_stats', 'statement_stats', 'clear_caches')
+
+
+class CallMetrics:
+    """Counters and a latency histogram for one method or route."""
+
+    __slots__ = ('calls', 'errors', 'rows', 'seconds', 'buckets')
+
+    def __init__(self, bucket_count: int):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        # One slot per bucket plus the +Inf overflow; cumulated when rendered
+        self.buckets = [0] * (bucket_count + 1)
+
+
+class _ThreadState(threading.local):
+    """Per-thread counters shared by the method wrappers and the request hooks."""
+    depth = 0
+    db_errors = 0
+    request_rows = 0
+
+
+class MetricsRegistry:
+    """Thread-safe call metrics keyed by (kind, labels)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._metrics: Dict[Tuple, CallMetrics] = {}
+        self._local = _ThreadState()
+
+    def observe(self, key: Tuple, seconds: float, rows: int = 0, error: bool = False):
+        """Record one call of key, e.g. ('db', 'get_ride_by_id')."""
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            metrics = self._metrics.get(key)
+            if metrics is None:
+                metrics = self._metrics[key] = CallMetrics(len(self.buckets))
+            metrics.calls += 1
+            metrics.rows += rows
+            metrics.seconds += seconds
+            metrics.buckets[index] += 1
+            if error:
+                metrics.errors += 1
+
+    def count_db_error(self):
+        """Note a driver error on this thread; the running method counts it as failed."""
+        self._local.db_errors += 1
+
+    def start_request(self):
+        """Reset this thread's row tally at the start of a request."""
+        self._local.request_rows = 0
+
+    def request_rows(self) -> int:
+        """Rows returned by top-level data-access calls since start_request()."""
+        return self._local.request_rows
+
+    def snapshot(self) -> Dict[Tuple, Dict]:
+        """Copy of every counter, keyed like observe()."""
+        with self._lock:
+            return {key: {'calls': m.calls, 'errors': m.errors, 'rows': m.rows,
+                          'seconds': m.seconds, 'buckets': list(m.buckets)}
+                    for key, m in self._metrics.items()}
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    # ---- Prometheus text format ----
+
+    def render(self, gauges: Dict[str, Tuple[str, Dict[Tuple, float]]] = None) -> str:
+        """Prometheus exposition text for every call metric plus gauges.
+
+        gauges maps a metric name to (help text, {label pairs: value}).
+        """
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        families = (('db', 'rideshare_db', 'DatabaseOperations method', ('method',)),
+                    ('http', 'rideshare_http', 'Flask route', ('route', 'method')))
+        for kind, prefix, what, label_names in families:
+            series = sorted(((key[1:], m) for key, m in snapshot.items() if key[0] == kind),
+                            key=lambda item: item[0])
+            if not series:
+                continue
+            for suffix, field, help_text in (('calls_total', 'calls', 'calls'),
+                                             ('errors_total', 'errors', 'calls that failed'),
+                                             ('rows_total', 'rows', 'rows returned')):
+                name = f"{prefix}_{suffix}"
+                lines.append(f"# HELP {name} {what} {help_text}.")
+                lines.append(f"# TYPE {name} counter")
+                for labels, m in series:
+                    lines.append(f"{name}{_labels(zip(label_names, labels))} {m[field]}")
+            name = f"{prefix}_latency_seconds"
+            lines.append(f"# HELP {name} {what} latency.")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, m in series:
+                pairs = list(zip(label_names, labels))
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), m['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {m['seconds']!r}")
+                lines.append(f"{name}_count{_labels(pairs)} {m['calls']}")
+        for name, (help_text, values) in sorted((gauges or {}).items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in values.items():
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                    for key, value in pairs)
+    return "{" + body + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def rows_returned(result) -> int:
+    """Rows a data-access call handed back: list length, 1 for a single row, else 0."""
+    kind = type(result)
+    if kind is list:
+        return len(result)
+    if kind is dict:
+        return 1
+    if kind is tuple and result and type(result[0]) is list:
+        # Keyset pages: (rides, next_cursor)
+        return len(result[0])
+    return 0
+
+
+# ==================== DATABASEOPERATIONS INSTRUMENTATION ====================
+
+def _timed_method(registry: MetricsRegistry, name: str, method):
+    key = ('db', name)
+    local = registry._local
+    observe = registry.observe
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        errors_before = local.db_errors
+        local.depth += 1
+        started = perf_counter()
+        result = None
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = perf_counter() - started
+            local.depth -= 1
+            rows = rows_returned(result)
+            if local.depth == 0:
+                local.request_rows += rows
+            observe(key, elapsed, rows, failed or local.db_errors != errors_before)
+
+    return wrapper
+
+
+def instrument(db_ops, registry: MetricsRegistry) -> MetricsRegistry:
+    """Record metrics for every public data-access method of db_ops.
+
+    Methods are wrapped on the instance, so other DatabaseOperations objects
+    (benchmarks, the CLI) are untouched. Most methods catch driver errors and
+    return None/False, so errors are counted where statements execute: the
+    thread's cursor and the prepared-statement path.
+    """
+    if getattr(db_ops, 'metrics', None) is registry:
+        return registry
+    for name, method in inspect.getmembers(type(db_ops), inspect.isfunction):
+        if name.startswith('_') or name in SKIPPED_METHODS:
+            continue
+        setattr(db_ops, name, _timed_method(registry, name, getattr(db_ops, name)))
+
+    checkout = db_ops.checkout
+    execute_statement = db_ops._execute_statement
+
+    @functools.wraps(checkout)
+    def counting_checkout() -> bool:
+        fresh = getattr(db_ops._local, 'pooled', None) is None
+        ok = checkout()
+        if ok and fresh:
+            db_ops._local.cursor = ErrorCountingCursor(db_ops._local.cursor, registry)
+        return ok
+
+    @functools.wraps(execute_statement)
+    def counting_execute_statement(*args, **kwargs):
+        try:
+            return execute_statement(*args, **kwargs)
+        except Error:
+            registry.count_db_error()
+            raise
+
+    db_ops.checkout = counting_checkout
+    db_ops._execute_statement = counting_execute_statement
+    db_ops.metrics = registry
+    return registry
+
+
+class ErrorCountingCursor:
+    """Cursor proxy that reports driver errors raised by execute() to the registry."""
+
+    def __init__(self, cursor, registry: MetricsRegistry):
+        self._cursor = cursor
+        self._registry = registry
+
+    def execute(self, operation, params=()):
+        try:
+            return self._cursor.execute(operation, params)
+        except Error:
+            self._registry.count_db_error()
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# ==================== GAUGES ====================
+
+def collect_gauges(db_ops, caches: Dict[str, Dict] = None) -> Dict[str, Tuple[str, Dict[Tuple, float]]]:
+    """Pool, cache, prepared statement and event hub gauges of db_ops.
+
+    caches adds the stats() of caches kept outside db_ops, by cache name.
+    """
+    gauges: Dict[str, Tuple[str, Dict[Tuple, float]]] = {}
+
+    def add(name: str, help_text: str, value, labels: Tuple = ()):
+        if isinstance(value, (int, float)):
+            gauges.setdefault(name, (help_text, {}))[1][labels] = value
+
+    for stat, value in db_ops.pool_stats().items():
+        add(f"rideshare_pool_{stat}", f"Connection pool {stat.replace('_', ' ')}.", value)
+    for cache_name, stats in {**db_ops.cache_stats(), **(caches or {})}.items():
+        for stat, value in stats.items():
+            add(f"rideshare_cache_{stat}", f"LRU cache {stat.replace('_', ' ')}.",
+                value, (('cache', cache_name),))
+    statements = db_ops.statement_stats()
+    for stat in ('prepared', 'executed', 'reuse_ratio'):
+        add(f"rideshare_statements_{stat}", f"Prepared statement {stat.replace('_', ' ')}.",
+            statements.get(stat))
+    events = getattr(db_ops, 'events', None)
+    if events is not None:
+        for stat, value in events.stats().items():
+            add(f"rideshare_events_{stat}", f"Ride event hub {stat}.", value)
+    return gauges
+
+
+def render_metrics(registry: MetricsRegistry, db_ops=None, caches: Dict[str, Dict] = None) -> str:
+    """Full /metrics payload: call metrics plus db_ops gauges when connected."""
+    return registry.render(collect_gauges(db_ops, caches) if db_ops is not None else None)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Ride Events
+In-process publish/subscribe hub for ride changes. DatabaseOperations
+publishes after each committed ride creation, status change and rating; the
+web app streams a user's events to the browser as Server-Sent Events.
+
+Each subscriber has its own bounded queue: when a slow client falls behind,
+its oldest events are dropped (and counted) instead of growing memory or
+blocking the publisher. Events only reach subscribers in this process.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+Topic = Tuple[str, int]
+
+# Idle Server-Sent Events streams get a comment line this often so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15.0
+
+
+def rider_topic(rider_id: int) -> Topic:
+    return ('rider', int(rider_id))
+
+
+def driver_topic(driver_id: int) -> Topic:
+    return ('driver', int(driver_id))
+
+
+def ride_topic(ride_id: int) -> Topic:
+    return ('ride', int(ride_id))
+
+
+def format_sse(event: Dict) -> str:
+    """Encode an event as a Server-Sent Events message."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    """A subscriber's bounded queue of events; read with get() or get_async()."""
+
+    def __init__(self, hub: "RideEventHub", topics: Tuple[Topic, ...], max_queue: int):
+        self.hub = hub
+        self.topics = topics
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.closed = False
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def push(self, event: Dict):
+        with self._cond:
+            if len(self._events) >= self.max_queue:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+
+    def _drain(self) -> List[Dict]:
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def get(self, timeout: float = None) -> List[Dict]:
+        """Wait up to timeout seconds for events and return all queued ones."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.closed, timeout)
+            return self._drain()
+
+    async def get_async(self, timeout: float = None) -> List[Dict]:
+        """Coroutine form of get() that does not block a thread while waiting."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        with self._cond:
+            if self._events or self.closed:
+                return self._drain()
+            self._async_waiters.append((loop, ready))
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.remove((loop, ready))
+        with self._cond:
+            return self._drain()
+
+    def close(self):
+        """Unsubscribe and wake any waiting reader."""
+        self.hub.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RideEventHub:
+    """Thread-safe topic registry; publishing never blocks on subscribers."""
+
+    def __init__(self, max_queue: int = 100):
+        """max_queue is the default per-subscriber queue bound."""
+        self.max_queue = max_queue
+        self._subscribers: Dict[Topic, set] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, *topics: Topic, max_queue: int = None) -> Subscription:
+        subscription = Subscription(self, topics, max_queue or self.max_queue)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, event_type: str, ride_id: int, rider_id: Optional[int] = None,
+                driver_id: Optional[int] = None, **data) -> Dict:
+        """Deliver an event to the ride's, rider's and driver's subscribers."""
+        event = {'id': next(self._ids), 'type': event_type, 'ride_id': ride_id,
+                 'rider_id': rider_id, 'driver_id': driver_id, 'time': time.time()}
+        event.update(data)
+        topics = [ride_topic(ride_id)]
+        if rider_id is not None:
+            topics.append(rider_topic(rider_id))
+        if driver_id is not None:
+            topics.append(driver_topic(driver_id))
+        with self._lock:
+            self.published += 1
+            targets = set()
+            for topic in topics:
+                targets.update(self._subscribers.get(topic, ()))
+        for subscription in targets:
+            subscription.push(event)
+        return event
+
+    def stats(self) -> Dict:
+        """Published count, open subscriptions and events dropped from full queues."""
+        with self._lock:
+            subscriptions = set().union(*self._subscribers.values()) if self._subscribers else set()
+            return {
+                'published': self.published,
+                'subscribers': len(subscriptions),
+                'dropped': sum(s.dropped for s in subscriptions),
+            }
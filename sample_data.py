@@ -13,6 +13,8 @@ from mysql.connector import Error
 import getpass
 import sys
 
+from db_operations import RATING_STATS_REBUILD_SQL
+
 
 def connect_to_db(host="localhost", database="rideshare_db", user="root", password=None):
     """Connect to MySQL database."""
@@ -133,6 +135,11 @@ def insert_sample_data(connection):
                 WHERE ride_id = %s
             """, (rating, comment, ride_id))
         
+        # Rating aggregates are normally maintained by update_ride_rating
+        print("Building driver rating stats...")
+        cursor.execute("DELETE FROM DRIVER_RATING_STATS")
+        cursor.execute(RATING_STATS_REBUILD_SQL.format(driver_filter=""))
+        
         connection.commit()
         print("\nSample data inserted successfully!")
         
@@ -7,6 +7,7 @@ CREATE DATABASE IF NOT EXISTS rideshare_db;
 USE rideshare_db;
 
 -- Drop tables if they exist (in reverse order of dependencies)
+DROP TABLE IF EXISTS DRIVER_RATING_STATS;
 DROP TABLE IF EXISTS RIDE;
 DROP TABLE IF EXISTS DRIVER;
 DROP TABLE IF EXISTS RIDER;
@@ -41,8 +42,13 @@ CREATE TABLE DRIVER (
     vehicle_color VARCHAR(30),
     license_plate VARCHAR(20),
     insurance_number VARCHAR(50),
-    driver_mode ENUM('active', 'inactive') DEFAULT 'inactive',
+    -- busy: claimed by dispatch_ride for an open ride; back to active when it ends
+    driver_mode ENUM('active', 'inactive', 'busy') DEFAULT 'inactive',
+    current_latitude DECIMAL(10, 8),
+    current_longitude DECIMAL(11, 8),
     registration_date DATE,
+    -- Bumped by every write to the driver's rides; ETag source for ride pages
+    rides_version INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES USER(user_id) ON DELETE CASCADE ON UPDATE CASCADE,
@@ -60,6 +66,8 @@ CREATE TABLE RIDER (
     preferred_payment VARCHAR(50),
     credit_card_last4 VARCHAR(4),
     default_location VARCHAR(200),
+    -- Bumped by every write to the rider's rides; ETag source for ride pages
+    rides_version INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES USER(user_id) ON DELETE CASCADE ON UPDATE CASCADE,
@@ -93,12 +101,34 @@ CREATE TABLE RIDE (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (driver_id) REFERENCES DRIVER(driver_id) ON DELETE RESTRICT ON UPDATE CASCADE,
     FOREIGN KEY (rider_id) REFERENCES RIDER(rider_id) ON DELETE RESTRICT ON UPDATE CASCADE,
-    INDEX idx_driver_id (driver_id),
-    INDEX idx_rider_id (rider_id),
+    -- Composite indexes serve ride history pages (keyset on created_at, ride_id;
+    -- InnoDB appends the primary key) and also cover the foreign keys
+    INDEX idx_driver_created (driver_id, created_at),
+    INDEX idx_rider_created (rider_id, created_at),
+    -- Rides awaiting a rating: rating IS NULL and ride_status are equality
+    -- lookups, so a rider's unrated completed rides come out newest first
+    INDEX idx_rider_unrated (rider_id, rating, ride_status, created_at),
     INDEX idx_ride_status (ride_status),
     INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- DRIVER_RATING_STATS
+-- Running rating totals per driver so rating reads are a primary-key lookup
+-- Maintained by update_ride_rating; rebuilt from RIDE with `flask rebuild-rating-stats`
+-- Relationship: DRIVER → DRIVER_RATING_STATS (1:1)
+CREATE TABLE DRIVER_RATING_STATS (
+    driver_id INT PRIMARY KEY,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_1_count INT NOT NULL DEFAULT 0,
+    rating_2_count INT NOT NULL DEFAULT 0,
+    rating_3_count INT NOT NULL DEFAULT 0,
+    rating_4_count INT NOT NULL DEFAULT 0,
+    rating_5_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (driver_id) REFERENCES DRIVER(driver_id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- Verify tables created
 SHOW TABLES;
 
@@ -0,0 +1,146 @@
+-- SQLite Rideshare App Database Schema
+-- CPSC 408 Assignment 05
+-- Translation of schema.sql for the embedded SQLite backend (db_backends.py).
+-- Keep the two files in sync: ENUMs become CHECK constraints, ON UPDATE
+-- CURRENT_TIMESTAMP becomes a trigger, and timestamps default to local time
+-- to match MySQL's NOW().
+
+PRAGMA foreign_keys = ON;
+
+-- Drop tables if they exist (in reverse order of dependencies)
+DROP TABLE IF EXISTS DRIVER_RATING_STATS;
+DROP TABLE IF EXISTS RIDE;
+DROP TABLE IF EXISTS DRIVER;
+DROP TABLE IF EXISTS RIDER;
+DROP TABLE IF EXISTS USER;
+
+-- USER Entity
+CREATE TABLE USER (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    phone_number VARCHAR(20),
+    full_name VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- DRIVER Entity
+CREATE TABLE DRIVER (
+    driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    license_number VARCHAR(50) NOT NULL,
+    license_expiry DATE,
+    vehicle_make VARCHAR(50),
+    vehicle_model VARCHAR(50),
+    vehicle_year INTEGER,
+    vehicle_color VARCHAR(30),
+    license_plate VARCHAR(20),
+    insurance_number VARCHAR(50),
+    driver_mode TEXT DEFAULT 'inactive' CHECK (driver_mode IN ('active', 'inactive', 'busy')),
+    current_latitude DECIMAL(10, 8),
+    current_longitude DECIMAL(11, 8),
+    registration_date DATE,
+    rides_version INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (user_id) REFERENCES USER(user_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE INDEX idx_driver_mode ON DRIVER (driver_mode);
+
+-- RIDER Entity
+CREATE TABLE RIDER (
+    rider_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    payment_info VARCHAR(100),
+    preferred_payment VARCHAR(50),
+    credit_card_last4 VARCHAR(4),
+    default_location VARCHAR(200),
+    rides_version INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (user_id) REFERENCES USER(user_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- RIDE Entity
+CREATE TABLE RIDE (
+    ride_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    driver_id INTEGER NOT NULL,
+    rider_id INTEGER NOT NULL,
+    pickup_location VARCHAR(200) NOT NULL,
+    pickup_address VARCHAR(255),
+    pickup_latitude DECIMAL(10, 8),
+    pickup_longitude DECIMAL(11, 8),
+    dropoff_location VARCHAR(200) NOT NULL,
+    dropoff_address VARCHAR(255),
+    dropoff_latitude DECIMAL(10, 8),
+    dropoff_longitude DECIMAL(11, 8),
+    pickup_time DATETIME,
+    dropoff_time DATETIME,
+    ride_status TEXT DEFAULT 'pending'
+        CHECK (ride_status IN ('pending', 'in_progress', 'completed', 'cancelled')),
+    rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+    rating_comment TEXT,
+    fare_amount DECIMAL(10, 2),
+    distance_miles DECIMAL(8, 2),
+    duration_minutes INTEGER,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (driver_id) REFERENCES DRIVER(driver_id) ON DELETE RESTRICT ON UPDATE CASCADE,
+    FOREIGN KEY (rider_id) REFERENCES RIDER(rider_id) ON DELETE RESTRICT ON UPDATE CASCADE
+);
+-- SQLite secondary indexes do not append the primary key implicitly, so the
+-- keyset columns are spelled out
+CREATE INDEX idx_driver_created ON RIDE (driver_id, created_at, ride_id);
+CREATE INDEX idx_rider_created ON RIDE (rider_id, created_at, ride_id);
+CREATE INDEX idx_rider_unrated ON RIDE (rider_id, rating, ride_status, created_at, ride_id);
+CREATE INDEX idx_ride_status ON RIDE (ride_status);
+CREATE INDEX idx_created_at ON RIDE (created_at);
+
+-- DRIVER_RATING_STATS
+CREATE TABLE DRIVER_RATING_STATS (
+    driver_id INTEGER PRIMARY KEY,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_1_count INTEGER NOT NULL DEFAULT 0,
+    rating_2_count INTEGER NOT NULL DEFAULT 0,
+    rating_3_count INTEGER NOT NULL DEFAULT 0,
+    rating_4_count INTEGER NOT NULL DEFAULT 0,
+    rating_5_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (driver_id) REFERENCES DRIVER(driver_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- ON UPDATE CURRENT_TIMESTAMP equivalents. The WHEN clause stops the trigger
+-- from firing again for its own update and keeps explicit updated_at values.
+CREATE TRIGGER trg_user_updated_at AFTER UPDATE ON USER
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE USER SET updated_at = datetime('now', 'localtime') WHERE user_id = NEW.user_id;
+END;
+
+CREATE TRIGGER trg_driver_updated_at AFTER UPDATE ON DRIVER
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE DRIVER SET updated_at = datetime('now', 'localtime') WHERE driver_id = NEW.driver_id;
+END;
+
+CREATE TRIGGER trg_rider_updated_at AFTER UPDATE ON RIDER
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE RIDER SET updated_at = datetime('now', 'localtime') WHERE rider_id = NEW.rider_id;
+END;
+
+CREATE TRIGGER trg_ride_updated_at AFTER UPDATE ON RIDE
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE RIDE SET updated_at = datetime('now', 'localtime') WHERE ride_id = NEW.ride_id;
+END;
+
+CREATE TRIGGER trg_driver_rating_stats_updated_at AFTER UPDATE ON DRIVER_RATING_STATS
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE DRIVER_RATING_STATS SET updated_at = datetime('now', 'localtime')
+    WHERE driver_id = NEW.driver_id;
+END;
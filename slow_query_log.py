@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Slow Query Log
+Application-side slow query recorder for DatabaseOperations.
+
+The database's own slow log knows the SQL but not who sent it. Every statement
+executed by an instrumented DatabaseOperations instance is timed; one that runs
+past the threshold is captured with the DatabaseOperations method that issued
+it, its SQL fingerprint, redacted parameters, duration, rows and the calling
+route/user (from a context callable set by web_app.py). Captures go into a
+bounded ring buffer (optionally sampled, so a flood of slow queries stays
+cheap) and are appended to a JSONL file periodically when a dump path is set.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# String parameters that are never personal data (ride statuses, driver modes)
+SAFE_STRINGS = frozenset(('pending', 'in_progress', 'completed', 'cancelled',
+                          'active', 'inactive', 'rider', 'driver'))
+# Coordinates are rounded to about 1 km before they are stored
+COORDINATE_DECIMALS = 2
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_FINGERPRINT_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=_FINGERPRINT_CACHE_SIZE)
+def fingerprint(sql: str) -> str:
+    """SQL with literals and placeholders replaced by ?, lists folded to (?+)."""
+    text = _STRING_LITERAL.sub("?", sql)
+    text = _NUMBER.sub("?", text)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _VALUE_LIST.sub("(?+)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def redact(value):
+    """Parameter value safe to keep in the log.
+
+    Ids, counts and timestamps are kept; free text (names, emails, usernames,
+    password hashes, addresses) becomes a length marker and coordinates are
+    rounded.
+    """
+    if value is None or isinstance(value, (bool, int)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), COORDINATE_DECIMALS)
+    if isinstance(value, str) and value in SAFE_STRINGS:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return f"<redacted {len(value) if hasattr(value, '__len__') else '?'} chars>"
+
+
+class SlowQueryLog:
+    """Ring buffer of statements slower than threshold seconds."""
+
+    def __init__(self, threshold: float = 0.1, capacity: int = 500, sample_rate: float = 1.0,
+                 dump_path: str = None, dump_interval: float = 60.0,
+                 context: Callable[[], Dict] = None):
+        """Keep the last capacity captures; sample_rate of slow statements are captured.
+
+        With dump_path set, new captures are appended to that JSONL file every
+        dump_interval seconds. context returns extra fields for each capture
+        (the route and user of the current request).
+        """
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.context = context
+        self._entries: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._dumped = 0
+        self.slow_total = 0
+        self._dumper = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "SlowQueryLog":
+        """Settings from the RIDESHARE_SLOW_QUERY_* environment variables."""
+        env = os.environ
+        return cls(threshold=float(env.get('RIDESHARE_SLOW_QUERY_MS', '100')) / 1000.0,
+                   capacity=int(env.get('RIDESHARE_SLOW_QUERY_BUFFER', '500')),
+                   sample_rate=float(env.get('RIDESHARE_SLOW_QUERY_SAMPLE', '1.0')),
+                   dump_path=env.get('RIDESHARE_SLOW_QUERY_DUMP') or None,
+                   dump_interval=float(env.get('RIDESHARE_SLOW_QUERY_DUMP_INTERVAL', '60')),
+                   **kwargs)
+
+    # ==================== CAPTURE ====================
+
+    def record(self, db_ops, sql: str, params, seconds: float, rows: Optional[int] = None,
+               statement: str = None) -> Optional[Dict]:
+        """Capture one slow statement; returns the entry (None if sampled out)."""
+        with self._lock:
+            self.slow_total += 1
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        entry = {
+            'time': datetime.now().isoformat(sep=' ', timespec='milliseconds'),
+            'duration_ms': round(seconds * 1000.0, 3),
+            'method': _calling_method(db_ops),
+            'statement': statement,
+            'fingerprint': fingerprint(sql),
+            'params': redact(tuple(params or ())),
+            'rows': rows,
+            'thread': threading.current_thread().name,
+        }
+        if self.context is not None:
+            try:
+                entry.update(self.context() or {})
+            except Exception:
+                logger.debug("Slow query context failed", exc_info=True)
+        with self._lock:
+            self._sequence += 1
+            entry['seq'] = self._sequence
+            self._entries.append(entry)
+        if self.dump_path and self._dumper is None:
+            self._start_dumper()
+        return entry
+
+    def entries(self, limit: int = None) -> List[Dict]:
+        """Buffered captures, slowest first."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.sort(key=lambda entry: entry['duration_ms'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'threshold_ms': self.threshold * 1000.0,
+                'sample_rate': self.sample_rate,
+                'slow_total': self.slow_total,
+                'captured': self._sequence,
+                'buffered': len(self._entries),
+                'dumped': self._dumped,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ==================== JSONL DUMP ====================
+
+    def dump(self, path: str = None) -> int:
+        """Append captures not yet dumped to path (default dump_path); returns the count."""
+        path = path or self.dump_path
+        with self._lock:
+            pending = [entry for entry in self._entries if entry['seq'] > self._dumped]
+        if not path or not pending:
+            return 0
+        with open(path, 'a') as f:
+            for entry in pending:
+                f.write(json.dumps(entry, default=str) + "\n")
+        with self._lock:
+            self._dumped = max(self._dumped, pending[-1]['seq'])
+        return len(pending)
+
+    def _start_dumper(self):
+        with self._lock:
+            if self._dumper is not None:
+                return
+            self._dumper = threading.Thread(target=self._dump_loop, name="slow-query-dump",
+                                            daemon=True)
+        self._dumper.start()
+        # The thread is a daemon; write the last interval's captures on exit
+        atexit.register(self.stop)
+
+    def _dump_loop(self):
+        while not self._stopped.wait(self.dump_interval):
+            try:
+                self.dump()
+            except OSError as e:
+                logger.warning("Could not write slow query log to %s: %s", self.dump_path, e)
+
+    def stop(self):
+        """Stop the dump thread and write whatever is still pending."""
+        self._stopped.set()
+        if self.dump_path:
+            self.dump()
+
+    # ==================== INSTRUMENTATION ====================
+
+    def instrument(self, db_ops):
+        """Time every statement db_ops executes, on its thread cursors and prepared statements."""
+        if getattr(db_ops, 'slow_queries', None) is self:
+            return db_ops
+        checkout = db_ops.checkout
+        execute_statement = db_ops._execute_statement
+        log = self
+
+        @functools.wraps(checkout)
+        def timed_checkout() -> bool:
+            fresh = getattr(db_ops._local, 'pooled', None) is None
+            ok = checkout()
+            if ok and fresh:
+                db_ops._local.cursor = SlowQueryCursor(db_ops._local.cursor, db_ops, log)
+            return ok
+
+        @functools.wraps(execute_statement)
+        def timed_execute_statement(name: str, query: str, params=()):
+            started = time.perf_counter()
+            result = execute_statement(name, query, params)
+            elapsed = time.perf_counter() - started
+            if elapsed < log.threshold:
+                return result
+            entry = log.record(db_ops, query, params, elapsed, statement=name)
+            return result if entry is None else _RowCountingResult(result, entry)
+
+        db_ops.checkout = timed_checkout
+        db_ops._execute_statement = timed_execute_statement
+        db_ops.slow_queries = self
+        return db_ops
+
+
+def _calling_method(db_ops) -> Optional[str]:
+    """Name of the innermost public db_ops method on the stack (else the innermost private one)."""
+    frame = sys._getframe(2)
+    private = None
+    while frame is not None:
+        if frame.f_code.co_varnames[:1] == ('self',) and frame.f_locals.get('self') is db_ops:
+            name = frame.f_code.co_name
+            if not name.startswith('_'):
+                return name
+            private = private or name
+        frame = frame.f_back
+    return private
+
+
+class _RowCountingResult:
+    """Fills in the rows of a captured entry when its result is fetched."""
+
+    def __init__(self, result, entry: Dict):
+        self._result = result
+        self._entry = entry
+
+    def fetchall(self):
+        rows = self._result.fetchall()
+        self._entry['rows'] = len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._result.fetchone()
+        self._entry['rows'] = 1 if row else 0
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class SlowQueryCursor:
+    """Cursor proxy that times execute() and captures statements past the threshold."""
+
+    def __init__(self, cursor, db_ops, log: SlowQueryLog):
+        self._cursor = cursor
+        self._db_ops = db_ops
+        self._log = log
+        # Entry of the last slow statement, until its rows are fetched
+        self._pending: Optional[Dict] = None
+
+    def execute(self, operation, params=()):
+        self._pending = None
+        started = time.perf_counter()
+        result = self._cursor.execute(operation, params)
+        elapsed = time.perf_counter() - started
+        if elapsed >= self._log.threshold:
+            rowcount = self._cursor.rowcount
+            self._pending = self._log.record(self._db_ops, operation, params, elapsed,
+                                             rows=rowcount if rowcount is not None and rowcount >= 0 else None)
+        return result
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self._pending is not None:
+            self._pending['rows'] = len(rows)
+            self._pending = None
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if self._pending is not None:
+            self._pending['rows'] = 1 if row else 0
+            self._pending = None
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
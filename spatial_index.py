@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Spatial Index
+In-memory uniform grid index of active driver locations used for matching.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class DriverSpatialIndex:
+    """Uniform lat/lon grid mapping cells to the drivers currently inside them."""
+
+    def __init__(self, cell_size_deg: float = 0.01):
+        """Create an empty index; the default cell is roughly 1.1 km tall."""
+        self.cell_size = cell_size_deg
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._positions: Dict[int, Tuple[float, float]] = {}
+        # Bounding box of cells ever occupied; bounds the ring search
+        self._bounds: Optional[List[int]] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, driver_id: int) -> bool:
+        return driver_id in self._positions
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Grid cell containing a coordinate."""
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size)))
+
+    def upsert(self, driver_id: int, lat: float, lon: float):
+        """Insert a driver or move it to a new location."""
+        lat, lon = float(lat), float(lon)
+        with self._lock:
+            self._remove_locked(driver_id)
+            self._positions[driver_id] = (lat, lon)
+            cell = self._cell(lat, lon)
+            self._cells.setdefault(cell, {})[driver_id] = (lat, lon)
+            if self._bounds is None:
+                self._bounds = [cell[0], cell[0], cell[1], cell[1]]
+            else:
+                b = self._bounds
+                b[0], b[1] = min(b[0], cell[0]), max(b[1], cell[0])
+                b[2], b[3] = min(b[2], cell[1]), max(b[3], cell[1])
+
+    def remove(self, driver_id: int):
+        """Remove a driver from the index if present."""
+        with self._lock:
+            self._remove_locked(driver_id)
+
+    def clear(self):
+        """Drop every driver from the index."""
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+            self._bounds = None
+
+    def _remove_locked(self, driver_id: int):
+        position = self._positions.pop(driver_id, None)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(driver_id, None)
+            if not members:
+                del self._cells[cell]
+
+    def _ring(self, center: Tuple[int, int], radius: int):
+        """Yield the cells forming the square ring at Chebyshev distance radius."""
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        for dj in range(-radius, radius + 1):
+            yield (ci - radius, cj + dj)
+            yield (ci + radius, cj + dj)
+        for di in range(-radius + 1, radius):
+            yield (ci + di, cj - radius)
+            yield (ci + di, cj + radius)
+
+    def _ring_min_km(self, lat: float, radius: int) -> float:
+        """Lower bound on the distance to any point in ring `radius` or beyond."""
+        if radius == 0:
+            return 0.0
+        # A cell is always at least this tall; longitude cells shrink with
+        # cos(lat), so use the narrower of the two spans.
+        km_per_deg_lat = math.pi * EARTH_RADIUS_KM / 180.0
+        lon_scale = max(math.cos(math.radians(min(89.0, abs(lat) + radius * self.cell_size))), 0.01)
+        return (radius - 1) * self.cell_size * km_per_deg_lat * lon_scale
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_radius_km: float = None) -> List[Tuple[int, float]]:
+        """Return up to k (driver_id, distance_km) pairs ordered by distance."""
+        lat, lon = float(lat), float(lon)
+        with self._lock:
+            if not self._positions:
+                return []
+            center = self._cell(lat, lon)
+            best: List[Tuple[float, int]] = []  # max-heap of (-distance, driver_id)
+            seen = 0
+            radius = 0
+            # Enough rings to cover the whole populated grid in the worst case
+            max_rings = self._max_ring(center)
+            while radius <= max_rings:
+                bound = self._ring_min_km(lat, radius)
+                if max_radius_km is not None and bound > max_radius_km:
+                    break
+                if len(best) == k and bound > -best[0][0]:
+                    break
+                for cell in self._ring(center, radius):
+                    members = self._cells.get(cell)
+                    if not members:
+                        continue
+                    for driver_id, (dlat, dlon) in members.items():
+                        seen += 1
+                        dist = haversine_km(lat, lon, dlat, dlon)
+                        if max_radius_km is not None and dist > max_radius_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-dist, driver_id))
+                        elif dist < -best[0][0]:
+                            heapq.heapreplace(best, (-dist, driver_id))
+                if seen == len(self._positions) and len(best) == min(k, seen):
+                    break
+                radius += 1
+            return sorted(((driver_id, -neg) for neg, driver_id in best), key=lambda item: item[1])
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """Return every (driver_id, distance_km) within radius_km, nearest first."""
+        return self.nearest(lat, lon, k=len(self._positions) or 1, max_radius_km=radius_km)
+
+    def _max_ring(self, center: Tuple[int, int]) -> int:
+        """Chebyshev distance from center to the farthest occupied cell."""
+        if self._bounds is None:
+            return 0
+        ci, cj = center
+        imin, imax, jmin, jmax = self._bounds
+        return max(abs(ci - imin), abs(ci - imax), abs(cj - jmin), abs(cj - jmax))
+
+    def position(self, driver_id: int) -> Optional[Tuple[float, float]]:
+        """Last indexed location of a driver, if any."""
+        return self._positions.get(driver_id)
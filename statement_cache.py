@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Statement Cache
+Per-connection registry of prepared statements for DatabaseOperations' hot
+queries.
+
+On MySQL each statement gets its own server-side prepared cursor, so the
+server parses and plans the SQL once per connection and later calls only send
+the parameters. Backends without server-side preparation (SQLite) fall back to
+one client-side cursor per statement: the SQL is compiled once into the
+driver's statement cache and later calls reuse the compiled form.
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class StatementStats:
+    """Prepare and execute counts per statement name, shared by all connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+
+    def record(self, name: str, prepared: int = 0, executed: int = 0):
+        with self._lock:
+            counts = self._counts.setdefault(name, [0, 0])
+            counts[0] += prepared
+            counts[1] += executed
+
+    def snapshot(self) -> Dict:
+        """Totals plus per-statement counts; executes per prepare shows the reuse."""
+        with self._lock:
+            statements = {name: {'prepared': p, 'executed': e} for name, (p, e) in self._counts.items()}
+        prepared = sum(s['prepared'] for s in statements.values())
+        executed = sum(s['executed'] for s in statements.values())
+        return {
+            'prepared': prepared,
+            'executed': executed,
+            'reuse_ratio': executed / prepared if prepared else 0.0,
+            'statements': statements,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class PreparedStatement:
+    """One statement bound to its own cursor; rows come back as dicts."""
+
+    def __init__(self, cursor, sql: str, server_side: bool):
+        self.cursor = cursor
+        self.sql = sql
+        self.server_side = server_side
+
+    def execute(self, params=()):
+        # A prepared cursor re-prepares only when handed a different SQL
+        # string than last time; this cursor is always handed self.sql
+        self.cursor.execute(self.sql, tuple(params or ()))
+        return self
+
+    def fetchall(self) -> List[Dict]:
+        rows = self.cursor.fetchall()
+        if not self.server_side:
+            return rows
+        columns = self.cursor.column_names
+        return [{column: value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value
+                 for column, value in zip(columns, row)} for row in rows]
+
+    def fetchone(self) -> Optional[Dict]:
+        # Always drain the result so the connection is free for the next statement
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+
+
+class StatementRegistry:
+    """Prepared statements of one connection, keyed by SQL text.
+
+    Holds at most max_statements; the least recently used one is closed
+    (deallocated on the server) to make room.
+    """
+
+    def __init__(self, connection, stats: StatementStats, server_side: bool = True,
+                 max_statements: int = 64):
+        self.connection = connection
+        self.stats = stats
+        self.server_side = server_side
+        self.max_statements = max_statements
+        self._statements: "OrderedDict[str, PreparedStatement]" = OrderedDict()
+
+    def execute(self, name: str, sql: str, params=()) -> PreparedStatement:
+        """Run sql with params, preparing it on first use on this connection."""
+        statement = self._statements.get(sql)
+        if statement is None:
+            statement = self._prepare(sql)
+            self.stats.record(name, prepared=1)
+        else:
+            self._statements.move_to_end(sql)
+        statement.execute(params)
+        self.stats.record(name, executed=1)
+        return statement
+
+    def _prepare(self, sql: str) -> PreparedStatement:
+        cursor = None
+        if self.server_side:
+            try:
+                cursor = self.connection.cursor(prepared=True)
+            except (TypeError, ValueError, NotImplementedError):
+                # Driver without prepared cursors: use client-side statements from now on
+                self.server_side = False
+        if cursor is None:
+            cursor = self.connection.cursor(dictionary=True)
+        statement = PreparedStatement(cursor, sql, self.server_side)
+        self._statements[sql] = statement
+        while len(self._statements) > self.max_statements:
+            _, evicted = self._statements.popitem(last=False)
+            evicted.close()
+        return statement
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def close(self):
+        for statement in self._statements.values():
+            statement.close()
+        self._statements.clear()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+CPSC 408 Assignment 05 - Dispatch Concurrency Stress Test
+Fires hundreds of simultaneous ride requests at a small pool of active drivers
+and checks that no driver ends up assigned to two open rides.
+
+Runs against a fresh temporary SQLite database by default. With
+--backend mysql it reseeds the configured MySQL database (deleting its data).
+Exits non-zero if any driver is double-assigned.
+
+Usage:
+    python stress_dispatch.py --requests 500 --drivers 100 --threads 250
+    python stress_dispatch.py --naive      # old get-then-create path, for comparison
+    python stress_dispatch.py --batch      # BatchDispatcher (batch_dispatch.py)
+
+Authors:
+- Gabe Giancarlo (2405449) - giancarlo@chapman.edu
+- Gustavo de Moraes (002427902) - demoraes@chapman.edu
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from db_backends import create_backend
+from db_operations import DatabaseOperations
+from generate_data import generate
+from spatial_index import haversine_km
+
+# Every request and driver sits near this point so they all compete
+CENTER = (34.0522, -118.2437)
+
+
+def seed(db_ops: DatabaseOperations, riders: int, drivers: int, rng: random.Random):
+    """Load riders and drivers, then make every driver active near CENTER."""
+    generate(db_ops.connection, riders, drivers, 0, reset=True, report=lambda message: None)
+    db_ops.cursor.execute("SELECT driver_id FROM DRIVER")
+    for row in db_ops.cursor.fetchall():
+        db_ops.cursor.execute(
+            "UPDATE DRIVER SET driver_mode = 'active', current_latitude = %s, "
+            "current_longitude = %s WHERE driver_id = %s",
+            (CENTER[0] + rng.uniform(-0.03, 0.03), CENTER[1] + rng.uniform(-0.03, 0.03),
+             row['driver_id'])
+        )
+    db_ops.connection.commit()
+    db_ops.clear_caches()
+
+
+def naive_dispatch(db_ops: DatabaseOperations, rider_id: int, lat, lon):
+    """The previous two-step path: pick a driver, then insert the ride."""
+    driver = db_ops.get_nearest_active_driver(lat, lon)
+    if not driver:
+        return None
+    ride_id = db_ops.create_ride(driver['driver_id'], rider_id, "Stress pickup", "Stress dropoff",
+                                 pickup_latitude=lat, pickup_longitude=lon)
+    return (ride_id, driver) if ride_id else None
+
+
+def run(db_ops: DatabaseOperations, rider_ids: List[int], threads: int,
+        use_coordinates: float, naive: bool, rng: random.Random, dispatcher=None) -> Dict:
+    """Dispatch one request per rider id from `threads` threads released together.
+    
+    dispatcher defaults to db_ops; pass a BatchDispatcher to batch requests.
+    """
+    dispatcher = dispatcher or db_ops
+    requests = [(rider_id, rng.random() < use_coordinates) for rider_id in rider_ids]
+    shards = [requests[i::threads] for i in range(threads)]
+    barrier = threading.Barrier(threads)
+    outcomes = Counter()
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(shard):
+        barrier.wait()
+        try:
+            for rider_id, located in shard:
+                lat, lon = (CENTER[0] + rng.uniform(-0.02, 0.02),
+                            CENTER[1] + rng.uniform(-0.02, 0.02)) if located else (None, None)
+                started = time.perf_counter()
+                try:
+                    if naive:
+                        result = naive_dispatch(db_ops, rider_id, lat, lon)
+                    else:
+                        result = dispatcher.dispatch_ride(rider_id, "Stress pickup", "Stress dropoff",
+                                                          pickup_latitude=lat, pickup_longitude=lon)
+                    outcome = 'assigned' if result else 'no_driver'
+                except Exception:
+                    outcome = 'error'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+        finally:
+            db_ops.release()
+
+    workers = [threading.Thread(target=worker, args=(shard,)) for shard in shards]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'outcomes': dict(outcomes),
+        'seconds': round(elapsed, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else 0.0,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def verify(db_ops: DatabaseOperations) -> Dict:
+    """Count double-assigned drivers and open rides whose driver is not busy."""
+    db_ops.connection.rollback()
+    cursor = db_ops.cursor
+    cursor.execute("""
+        SELECT driver_id, COUNT(*) AS open_rides FROM RIDE
+        WHERE ride_status IN ('pending', 'in_progress')
+        GROUP BY driver_id HAVING COUNT(*) > 1
+    """)
+    doubled = cursor.fetchall()
+    cursor.execute("""
+        SELECT COUNT(*) AS n FROM RIDE r JOIN DRIVER d ON d.driver_id = r.driver_id
+        WHERE r.ride_status IN ('pending', 'in_progress') AND d.driver_mode <> 'busy'
+    """)
+    not_busy = cursor.fetchone()['n']
+    cursor.execute("SELECT COUNT(*) AS n FROM DRIVER WHERE driver_mode = 'active'")
+    still_active = cursor.fetchone()['n']
+    cursor.execute("""
+        SELECT r.pickup_latitude, r.pickup_longitude, d.current_latitude, d.current_longitude
+        FROM RIDE r JOIN DRIVER d ON d.driver_id = r.driver_id
+        WHERE r.pickup_latitude IS NOT NULL AND d.current_latitude IS NOT NULL
+    """)
+    pickups = [haversine_km(float(row['pickup_latitude']), float(row['pickup_longitude']),
+                            float(row['current_latitude']), float(row['current_longitude']))
+               for row in cursor.fetchall()]
+    return {
+        'double_assigned_drivers': len(doubled),
+        'extra_rides': sum(row['open_rides'] - 1 for row in doubled),
+        'open_rides_with_idle_driver': not_busy,
+        'drivers_still_active': still_active,
+        'avg_pickup_km': round(sum(pickups) / len(pickups), 3) if pickups else 0.0,
+    }
+
+
+def check_toggle_keeps_busy(db_ops: DatabaseOperations) -> Optional[str]:
+    """A driver on an open ride who toggles off and on must come back busy, not active.
+    
+    Returns a failure message, or None (also when no ride is open to try it on).
+    """
+    cursor = db_ops.cursor
+    cursor.execute("SELECT driver_id FROM RIDE WHERE ride_status IN ('pending', 'in_progress') "
+                   "ORDER BY ride_id LIMIT 1")
+    row = cursor.fetchone()
+    db_ops.release()
+    if not row:
+        return None
+    driver_id = row['driver_id']
+    modes = []
+    for _ in range(2):
+        db_ops.toggle_driver_mode(driver_id)
+        modes.append(db_ops.get_driver_by_id(driver_id)['driver_mode'])
+    db_ops.release()
+    if modes != ['inactive', 'busy']:
+        return f"driver {driver_id} with an open ride toggled through {modes}, expected inactive then busy"
+    return None
+
+
+def check_idle_costs(db_ops: DatabaseOperations) -> Optional[str]:
+    """Give two drivers rides 5 and 20 minutes ago and compare their batch costs.
+    
+    The idle bonus should make the longer-idle driver cheaper; returns a
+    failure message, or None if it does.
+    """
+    import numpy as np
+    from batch_dispatch import build_cost_matrix, idle_minutes
+    cursor = db_ops.cursor
+    cursor.execute("SELECT driver_id FROM DRIVER ORDER BY driver_id LIMIT 2")
+    driver_ids = [row['driver_id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT rider_id FROM RIDER ORDER BY rider_id LIMIT 1")
+    rider_id = cursor.fetchone()['rider_id']
+    now = datetime.now().replace(microsecond=0)
+    for driver_id, minutes in zip(driver_ids, (5, 20)):
+        cursor.execute(
+            "INSERT INTO RIDE (driver_id, rider_id, pickup_location, dropoff_location, "
+            "ride_status, created_at) VALUES (%s, %s, 'Idle check', 'Idle check', 'completed', %s)",
+            (driver_id, rider_id, now - timedelta(minutes=minutes))
+        )
+    db_ops.connection.commit()
+
+    drivers = sorted(db_ops.get_dispatch_candidates(driver_ids), key=lambda d: d['driver_id'])
+    db_ops.release()
+    idle = [idle_minutes(d['last_ride_at'], now) for d in drivers]
+    if len(idle) != 2 or abs(idle[0] - 5) > 1 or abs(idle[1] - 20) > 1:
+        return f"idle minutes {idle} for rides 5 and 20 minutes ago"
+    # One request without coordinates, so only the rating and idle terms differ
+    cost, _ = build_cost_matrix(np.array([np.nan]), np.array([np.nan]),
+                                np.array([float(d['current_latitude']) for d in drivers]),
+                                np.array([float(d['current_longitude']) for d in drivers]),
+                                np.full(2, np.nan), np.array(idle))
+    if not cost[0, 1] < cost[0, 0]:
+        return f"idle costs {cost[0].tolist()} do not favour the longer-idle driver"
+    return None
+
+
+def check_batch_timeout(db_ops: DatabaseOperations) -> Optional[str]:
+    """A batched request whose caller times out must not get a ride later.
+    
+    Both the blocking and the coroutine dispatch_ride() give up long before
+    the batch window closes; once the worker has run, neither rider may have
+    a ride. Returns a failure message, or None.
+    """
+    import asyncio
+    from async_db_operations import AsyncDatabaseOperations
+    from batch_dispatch import BatchDispatcher
+    cursor = db_ops.cursor
+    cursor.execute("SELECT rider_id FROM RIDER ORDER BY rider_id LIMIT 2")
+    rider_ids = [row['rider_id'] for row in cursor.fetchall()]
+    db_ops.release()
+
+    dispatcher = BatchDispatcher(db_ops, window=0.5)
+    async_db = AsyncDatabaseOperations(db_ops, batch_dispatcher=dispatcher)
+    try:
+        results = [
+            dispatcher.dispatch_ride(rider_ids[0], "Timeout check", "Timeout check",
+                                     pickup_latitude=CENTER[0], pickup_longitude=CENTER[1],
+                                     timeout=0.05),
+            asyncio.run(async_db.dispatch_ride(rider_ids[1], "Timeout check", "Timeout check",
+                                               pickup_latitude=CENTER[0],
+                                               pickup_longitude=CENTER[1], timeout=0.05)),
+        ]
+    finally:
+        # Waits for the worker to serve whatever is still queued
+        dispatcher.stop()
+        async_db.executor.shutdown(wait=True)
+
+    cursor = db_ops.cursor
+    cursor.execute("SELECT COUNT(*) AS n FROM RIDE WHERE pickup_location = 'Timeout check'")
+    rides = cursor.fetchone()['n']
+    db_ops.release()
+    if any(results) or rides:
+        return f"timed-out batch requests returned {results} and left {rides} ride(s) behind"
+    return None
+
+
+def check_async_facade() -> Optional[str]:
+    """AsyncDatabaseOperations must not hand out a unit of work on a worker thread.
+    
+    transaction() pins one thread's connection; as a coroutine it would run on
+    a pool thread whose connection is released before the caller enters it.
+    """
+    import inspect
+    from async_db_operations import AsyncDatabaseOperations
+    transaction = getattr(AsyncDatabaseOperations, 'transaction', None)
+    if transaction is not None and inspect.iscoroutinefunction(transaction):
+        return "AsyncDatabaseOperations.transaction is a coroutine around a released connection"
+    return None
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Stress-test atomic driver dispatch.")
+    parser.add_argument("--requests", type=int, default=500, help="ride requests to fire (default 500)")
+    parser.add_argument("--drivers", type=int, default=100, help="active drivers (default 100)")
+    parser.add_argument("--threads", type=int, default=250, help="concurrent request threads (default 250)")
+    parser.add_argument("--pool-size", type=int, default=32, help="database connections (default 32)")
+    parser.add_argument("--located", type=float, default=0.8,
+                        help="share of requests that send pickup coordinates (default 0.8)")
+    parser.add_argument("--seed", type=int, default=7, help="random seed (default 7)")
+    parser.add_argument("--naive", action="store_true",
+                        help="use get_nearest_active_driver() + create_ride() instead of dispatch_ride()")
+    parser.add_argument("--batch", action="store_true",
+                        help="dispatch through a BatchDispatcher instead of dispatch_ride()")
+    parser.add_argument("--window", type=float, default=0.5,
+                        help="batch collection window in seconds (default 0.5)")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default="sqlite",
+                        help="database backend (default sqlite)")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="SQLite database file (default: a new temporary file)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    failure = check_async_facade()
+    if failure:
+        print(f"FAIL: {failure}")
+        sys.exit(1)
+    rng = random.Random(args.seed)
+    temp_dir = None
+    path = args.sqlite_path
+    if args.backend == "sqlite" and not path:
+        temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(temp_dir.name, "stress.db")
+
+    db_ops = DatabaseOperations(pool_size=args.pool_size,
+                                backend=create_backend(args.backend, path=path))
+    if not db_ops.connect():
+        print("Failed to connect to database.")
+        sys.exit(1)
+
+    try:
+        print(f"Seeding {args.requests:,} riders and {args.drivers:,} active drivers "
+              f"({db_ops.backend.describe()})...")
+        seed(db_ops, args.requests, args.drivers, rng)
+        db_ops.cursor.execute("SELECT rider_id FROM RIDER ORDER BY rider_id")
+        rider_ids = [row['rider_id'] for row in db_ops.cursor.fetchall()]
+        db_ops.release()
+
+        dispatcher = None
+        if args.batch:
+            from batch_dispatch import BatchDispatcher
+            failure = check_idle_costs(db_ops) or check_batch_timeout(db_ops)
+            if failure:
+                print(f"\nFAIL: {failure}")
+                sys.exit(1)
+            dispatcher = BatchDispatcher(db_ops, window=args.window)
+            mode = f"batch, {args.window}s window"
+        else:
+            mode = "naive get-then-create" if args.naive else "dispatch_ride"
+        print(f"Firing {len(rider_ids):,} requests from {args.threads} threads ({mode})...")
+        result = run(db_ops, rider_ids, args.threads, args.located, args.naive, rng, dispatcher)
+        checks = verify(db_ops)
+        toggle_failure = check_toggle_keeps_busy(db_ops)
+    finally:
+        if dispatcher is not None:
+            dispatcher.stop()
+        db_ops.disconnect()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print(f"\nOutcomes: {result['outcomes']} in {result['seconds']}s "
+          f"(p50 {result['p50_ms']} ms, max {result['max_ms']} ms)")
+    for key, value in checks.items():
+        print(f"  {key.replace('_', ' ')}: {value}")
+
+    assigned = result['outcomes'].get('assigned', 0)
+    if checks['double_assigned_drivers']:
+        print(f"\nFAIL: {checks['double_assigned_drivers']} driver(s) assigned to more than one open ride")
+        sys.exit(1)
+    if assigned > args.drivers:
+        print(f"\nFAIL: {assigned} rides assigned with only {args.drivers} drivers")
+        sys.exit(1)
+    if toggle_failure:
+        print(f"\nFAIL: {toggle_failure}")
+        sys.exit(1)
+    print("\nOK: no driver was assigned twice")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,38 +8,80 @@ Authors:
 - Gustavo de Moraes (002427902) - demoraes@chapman.edu
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, g,
+                   has_request_context, make_response)
+from db_backends import create_backend
 from db_operations import DatabaseOperations
+from fragment_cache import FragmentCache, install as install_fragment_cache, precompile_templates
 from helper import Helper
+from jinja2 import FileSystemBytecodeCache
+from logging_config import configure_logging
+from metrics import MetricsRegistry, instrument, render_metrics
+from ride_events import SSE_KEEPALIVE_SECONDS, driver_topic, format_sse, rider_topic
+from slow_query_log import SlowQueryLog
 import os
 import getpass
+import hashlib
+import hmac
 import logging
+import time
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('web_app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (RIDESHARE_LOG_MODE=production for queued, rotated, sampled logs)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'rideshare-secret-key-change-in-production')
-
-# Global database connection (will be initialized on first request)
+# Database backend: "mysql" (default) or "sqlite" for the embedded database
+app.config['DB_BACKEND'] = os.environ.get('RIDESHARE_DB_BACKEND', 'mysql')
+app.config['SQLITE_PATH'] = os.environ.get('RIDESHARE_SQLITE_PATH', 'rideshare.db')
+# Ride dispatch: "single" matches each request on arrival, "batch" matches
+# requests collected over DISPATCH_WINDOW seconds together (needs NumPy)
+app.config['DISPATCH_MODE'] = os.environ.get('RIDESHARE_DISPATCH_MODE', 'single')
+app.config['DISPATCH_WINDOW'] = float(os.environ.get('RIDESHARE_DISPATCH_WINDOW', '1.5'))
+app.config['DISPATCH_SOLVER'] = os.environ.get('RIDESHARE_DISPATCH_SOLVER', 'optimal')
+# Token for the /debug admin routes (disabled when unset)
+app.config['ADMIN_TOKEN'] = os.environ.get('RIDESHARE_ADMIN_TOKEN')
+# Memory budget for rendered ride rows and tables
+app.config['FRAGMENT_CACHE_MB'] = float(os.environ.get('RIDESHARE_FRAGMENT_CACHE_MB', '16'))
+# Compiled templates are also kept on disk, so restarts and new workers skip compiling
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache()}
+
+# Global database access object (its connection pool is created on first request)
 db_ops = None
 helper = Helper()
+# BatchDispatcher when DISPATCH_MODE is "batch"
+batch_dispatcher = None
+# Per-method and per-route call metrics, served at /metrics
+metrics = MetricsRegistry()
+# Statements over RIDESHARE_SLOW_QUERY_MS, with the route and user that sent them
+slow_queries = SlowQueryLog.from_env()
+# Rendered ride table rows (templates call cached_rows); dropped on ride writes
+fragment_cache = install_fragment_cache(app, FragmentCache(int(app.config['FRAGMENT_CACHE_MB'] * 1024 * 1024)))
+
+# Rides shown per page on the ride history pages
+RIDES_PAGE_SIZE = 25
+
+# Ride pages are per-user; browsers may keep them but must revalidate (ETag) each time
+RIDE_PAGE_CACHE_CONTROL = 'private, no-cache'
+
+# Status changes a driver may make to a ride, by current status
+RIDE_STATUS_TRANSITIONS = {
+    'pending': ('in_progress', 'cancelled'),
+    'in_progress': ('completed', 'cancelled'),
+}
 
 
 def init_db():
     """Initialize database connection."""
-    global db_ops
+    global db_ops, batch_dispatcher
     if db_ops is None:
         try:
-            db_ops = DatabaseOperations()
+            db_ops = DatabaseOperations(backend=create_backend(app.config['DB_BACKEND'],
+                                                               path=app.config['SQLITE_PATH']))
+            instrument(db_ops, metrics)
+            slow_queries.instrument(db_ops)
+            db_ops.ride_listeners.append(fragment_cache.invalidate_ride)
             if not db_ops.connect():
                 print("Warning: Database connection failed")
                 db_ops = None
@@ -49,6 +91,10 @@ def init_db():
                 print("Warning: Database cursor is None")
                 db_ops = None
                 return None
+            if app.config['DISPATCH_MODE'] == 'batch':
+                from batch_dispatch import BatchDispatcher
+                batch_dispatcher = BatchDispatcher(db_ops, window=app.config['DISPATCH_WINDOW'],
+                                                   solver=app.config['DISPATCH_SOLVER'])
         except Exception as e:
             print(f"Database connection error: {e}")
             db_ops = None
@@ -74,28 +120,116 @@ def init_db():
 @app.before_request
 def before_request():
     """Initialize database before each request."""
-    logger.debug(f"before_request() - db_ops is None: {db_ops is None}")
+    g.request_started = time.perf_counter()
+    metrics.start_request()
     # Skip database init for static files or if already connected
     # Only initialize if not already connected
     if db_ops is None:
         logger.debug("db_ops is None, calling init_db()")
         try:
             result = init_db()
-            logger.debug(f"init_db() returned: {result is not None}")
+            logger.debug("init_db() returned: %s", result is not None)
             if result is None:
                 logger.warning("Database initialization failed in before_request")
         except Exception as e:
             # Don't block requests if DB connection fails
-            logger.exception(f"Exception in before_request during DB init: {e}")
+            logger.exception("Exception in before_request during DB init: %s", e)
             pass
     else:
-        logger.debug(f"db_ops already exists, cursor status: {db_ops.cursor is not None if hasattr(db_ops, 'cursor') else 'N/A'}")
+        # Borrow a pooled connection for the duration of this request
+        try:
+            db_ops.checkout()
+        except Exception as e:
+            logger.exception("Exception in before_request during connection checkout: %s", e)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request against its route template (not the raw path)."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        metrics.observe(('http', route, request.method), time.perf_counter() - started,
+                        metrics.request_rows(), response.status_code >= 500)
+    return response
+
+
+def slow_query_context():
+    """Route and user of the request a slow statement ran for."""
+    if not has_request_context():
+        return {}
+    return {
+        'route': request.url_rule.rule if request.url_rule is not None else '<unmatched>',
+        'http_method': request.method,
+        'user_type': session.get('user_type'),
+        'user_id': session.get('user_id'),
+    }
+
+
+slow_queries.context = slow_query_context
 
 
 @app.teardown_appcontext
 def close_db(error):
-    """Close database connection after each request."""
-    pass
+    """Return this request's database connection to the pool."""
+    if db_ops is not None:
+        db_ops.release()
+
+
+# ==================== CONDITIONAL GET ====================
+
+def _template_version() -> str:
+    """Digest of the template files, so edited templates change every page ETag."""
+    folder = os.path.join(app.root_path, app.template_folder)
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{os.path.relpath(os.path.join(root, name), folder)}:"
+                          f"{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return digest.hexdigest()[:12]
+
+
+TEMPLATE_VERSION = _template_version()
+# Compile every template now rather than on each page's first request
+precompile_templates(app)
+
+
+def ride_page_etag(user_type: str, profile_id: int):
+    """ETag for the current ride history/detail page, or None to always render it.
+    
+    Built from the owner's rides_version (one primary key lookup), which every
+    ride write bumps, plus the URL and template version. The version is read
+    before the page so a write in between can only cause an extra render,
+    never a stale 304. Pages with flash messages waiting are always rendered.
+    """
+    if session.get('_flashes'):
+        return None
+    if user_type == 'driver':
+        version = db_ops.get_driver_rides_version(profile_id)
+    else:
+        version = db_ops.get_rider_rides_version(profile_id)
+    if version is None:
+        return None
+    key = f"{TEMPLATE_VERSION}:{session.get('user_id')}:{user_type}:{profile_id}:{version}:{request.full_path}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def not_modified(etag: str):
+    """304 response for a page the browser already has."""
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = RIDE_PAGE_CACHE_CONTROL
+    return response
+
+
+def with_etag(body, etag: str):
+    """Response for a rendered page, tagged so the next request can be a 304."""
+    response = make_response(body)
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = RIDE_PAGE_CACHE_CONTROL
+    return response
 
 
 # ==================== AUTHENTICATION ROUTES ====================
@@ -235,30 +369,33 @@ def register_rider():
             flash('Invalid phone number format.', 'error')
             return render_template('register_rider.html')
         
-        # Check if username exists
+        # Check the username, then create the user and rider profile as one
+        # unit of work: one commit, and no orphan USER row if the profile fails
         try:
-            if db_ops.get_user_by_username(username):
-                flash('Username already exists. Please choose another.', 'error')
-                return render_template('register_rider.html')
+            with db_ops.transaction() as unit:
+                if db_ops.get_user_by_username(username):
+                    flash('Username already exists. Please choose another.', 'error')
+                    return render_template('register_rider.html')
+                
+                user_id = db_ops.create_user(username, password, email, phone_number or None, full_name)
+                rider_id = None
+                if user_id:
+                    rider_id = db_ops.create_rider(
+                        user_id,
+                        payment_info or None,
+                        preferred_payment or None,
+                        credit_card_last4 or None,
+                        default_location or None
+                    )
+                if not rider_id:
+                    unit.failed = True
         except AttributeError:
             flash('Database connection error. Please try again.', 'error')
             return render_template('register_rider.html')
         
-        # Create user
-        user_id = db_ops.create_user(username, password, email, phone_number or None, full_name)
         if not user_id:
             flash('Failed to create user account.', 'error')
             return render_template('register_rider.html')
-        
-        # Create rider profile
-        rider_id = db_ops.create_rider(
-            user_id,
-            payment_info or None,
-            preferred_payment or None,
-            credit_card_last4 or None,
-            default_location or None
-        )
-        
         if rider_id:
             flash('Rider account created successfully! You can now log in.', 'success')
             return redirect(url_for('rider_login'))
@@ -272,9 +409,7 @@ def register_rider():
 @app.route('/register/driver', methods=['GET', 'POST'])
 def register_driver():
     """Driver registration page."""
-    logger.debug(f"register_driver() - method: {request.method}")
-    logger.debug(f"db_ops is None: {db_ops is None}")
-    logger.debug(f"db_ops.cursor is None: {db_ops.cursor is None if db_ops else 'N/A'}")
+    logger.debug("register_driver() - method: %s", request.method)
     
     if request.method == 'POST':
         if db_ops is None:
@@ -284,8 +419,6 @@ def register_driver():
         
         if not hasattr(db_ops, 'cursor') or db_ops.cursor is None:
             logger.error("POST /register/driver - db_ops.cursor is None")
-            logger.error(f"db_ops object: {db_ops}")
-            logger.error(f"db_ops.connection: {db_ops.connection if hasattr(db_ops, 'connection') else 'N/A'}")
             flash('Database connection failed. Please ensure MySQL is running and the database is created.', 'error')
             return render_template('register_driver.html')
         
@@ -312,39 +445,6 @@ def register_driver():
             flash('Invalid email format.', 'error')
             return render_template('register_driver.html')
         
-        # Check if username exists
-        logger.debug(f"Checking if username '{username}' exists")
-        try:
-            existing_user = db_ops.get_user_by_username(username)
-            logger.debug(f"get_user_by_username() returned: {existing_user}")
-            if existing_user:
-                logger.info(f"Username '{username}' already exists")
-                flash('Username already exists. Please choose another.', 'error')
-                return render_template('register_driver.html')
-        except AttributeError as e:
-            logger.exception(f"AttributeError when checking username: {e}")
-            logger.error(f"db_ops state - connection: {db_ops.connection if hasattr(db_ops, 'connection') else 'N/A'}, cursor: {db_ops.cursor if hasattr(db_ops, 'cursor') else 'N/A'}")
-            flash('Database connection error. Please try again.', 'error')
-            return render_template('register_driver.html')
-        except Exception as e:
-            logger.exception(f"Exception when checking username: {e}")
-            flash('Database error occurred. Please try again.', 'error')
-            return render_template('register_driver.html')
-        
-        # Create user
-        logger.debug(f"Creating user: {username}, {email}, {full_name}")
-        try:
-            user_id = db_ops.create_user(username, password, email, phone_number or None, full_name)
-            logger.debug(f"create_user() returned: {user_id}")
-            if not user_id:
-                logger.error("create_user() returned None")
-                flash('Failed to create user account.', 'error')
-                return render_template('register_driver.html')
-        except Exception as e:
-            logger.exception(f"Exception when creating user: {e}")
-            flash('Failed to create user account. Please try again.', 'error')
-            return render_template('register_driver.html')
-        
         # Convert vehicle year
         vehicle_year_int = None
         if vehicle_year:
@@ -353,19 +453,46 @@ def register_driver():
             except ValueError:
                 pass
         
-        # Create driver profile
-        driver_id = db_ops.create_driver(
-            user_id,
-            license_number,
-            license_expiry or None,
-            vehicle_make or None,
-            vehicle_model or None,
-            vehicle_year_int,
-            vehicle_color or None,
-            license_plate or None,
-            insurance_number or None
-        )
+        # Check the username, then create the user and driver profile as one
+        # unit of work: one commit, and no orphan USER row if the profile fails
+        logger.debug("Registering driver: %s", username)
+        try:
+            with db_ops.transaction() as unit:
+                if db_ops.get_user_by_username(username):
+                    logger.info("Username '%s' already exists", username)
+                    flash('Username already exists. Please choose another.', 'error')
+                    return render_template('register_driver.html')
+                
+                user_id = db_ops.create_user(username, password, email, phone_number or None, full_name)
+                logger.debug("create_user() returned: %s", user_id)
+                driver_id = None
+                if user_id:
+                    driver_id = db_ops.create_driver(
+                        user_id,
+                        license_number,
+                        license_expiry or None,
+                        vehicle_make or None,
+                        vehicle_model or None,
+                        vehicle_year_int,
+                        vehicle_color or None,
+                        license_plate or None,
+                        insurance_number or None
+                    )
+                if not driver_id:
+                    unit.failed = True
+        except AttributeError as e:
+            logger.exception("AttributeError during driver registration: %s", e)
+            flash('Database connection error. Please try again.', 'error')
+            return render_template('register_driver.html')
+        except Exception as e:
+            logger.exception("Exception during driver registration: %s", e)
+            flash('Database error occurred. Please try again.', 'error')
+            return render_template('register_driver.html')
         
+        if not user_id:
+            logger.error("create_user() returned None")
+            flash('Failed to create user account.', 'error')
+            return render_template('register_driver.html')
         if driver_id:
             flash('Driver account created successfully! You can now log in.', 'success')
             return redirect(url_for('driver_login'))
@@ -394,10 +521,12 @@ def driver_dashboard():
         return redirect(url_for('driver_login'))
     
     driver_id = session['profile_id']
-    driver = db_ops.get_driver_by_id(driver_id)
-    user = db_ops.get_user_by_id(session['user_id'])
+    # Profile, user, rating and recent rides in one query
+    view = db_ops.get_driver_dashboard(driver_id) or {}
     
-    return render_template('driver_dashboard.html', driver=driver, user=user)
+    return render_template('driver_dashboard.html', driver=view.get('driver'),
+                           user=view.get('user') or {}, summary=view.get('rating'),
+                           recent_rides=view.get('recent_rides', []))
 
 
 @app.route('/driver/rating')
@@ -408,9 +537,10 @@ def driver_rating():
         return redirect(url_for('driver_login'))
     
     driver_id = session['profile_id']
-    rating = db_ops.get_driver_rating(driver_id)
+    summary = db_ops.get_driver_rating_summary(driver_id)
+    rating = summary['average'] if summary else None
     
-    return render_template('driver_rating.html', rating=rating)
+    return render_template('driver_rating.html', rating=rating, summary=summary)
 
 
 @app.route('/driver/rides')
@@ -421,9 +551,16 @@ def driver_rides():
         return redirect(url_for('driver_login'))
     
     driver_id = session['profile_id']
-    rides = db_ops.get_driver_rides(driver_id)
+    etag = ride_page_etag('driver', driver_id)
+    if etag is not None and request.if_none_match.contains(etag):
+        return not_modified(etag)
     
-    return render_template('driver_rides.html', rides=rides)
+    after = helper.decode_page_cursor(request.args.get('after', ''))
+    rides, next_after = db_ops.get_driver_rides_page(driver_id, RIDES_PAGE_SIZE, after)
+    
+    return with_etag(render_template('driver_rides.html', rides=rides,
+                                     next_cursor=helper.encode_page_cursor(next_after),
+                                     is_first_page=after is None), etag)
 
 
 @app.route('/driver/rides/<int:ride_id>')
@@ -434,14 +571,42 @@ def driver_ride_detail(ride_id):
         return redirect(url_for('driver_login'))
     
     driver_id = session['profile_id']
-    rides = db_ops.get_driver_rides(driver_id)
-    ride = next((r for r in rides if r['ride_id'] == ride_id), None)
+    etag = ride_page_etag('driver', driver_id)
+    if etag is not None and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    ride = db_ops.get_driver_ride_by_id(ride_id, driver_id)
     
     if not ride:
         flash('Ride not found.', 'error')
         return redirect(url_for('driver_rides'))
     
-    return render_template('ride_detail.html', ride=ride, user_type='driver')
+    return with_etag(render_template('ride_detail.html', ride=ride, user_type='driver',
+                                     status_actions=RIDE_STATUS_TRANSITIONS.get(ride['ride_status'], ())),
+                     etag)
+
+
+@app.route('/driver/rides/<int:ride_id>/status', methods=['POST'])
+def driver_update_ride_status(ride_id):
+    """Start, complete or cancel one of the driver's rides."""
+    if 'user_id' not in session or session.get('user_type') != 'driver':
+        flash('Please log in as a driver to access this page.', 'error')
+        return redirect(url_for('driver_login'))
+    
+    driver_id = session['profile_id']
+    ride = db_ops.get_driver_ride_by_id(ride_id, driver_id)
+    if not ride:
+        flash('Ride not found.', 'error')
+        return redirect(url_for('driver_rides'))
+    
+    ride_status = request.form.get('ride_status', '').strip()
+    if ride_status not in RIDE_STATUS_TRANSITIONS.get(ride['ride_status'], ()):
+        flash('That status change is not allowed for this ride.', 'error')
+    elif db_ops.update_ride_status(ride_id, ride_status):
+        flash(f"Ride marked {ride_status.replace('_', ' ')}.", 'success')
+    else:
+        flash('Failed to update ride status.', 'error')
+    return redirect(url_for('driver_ride_detail', ride_id=ride_id))
 
 
 @app.route('/driver/toggle-mode', methods=['POST'])
@@ -461,6 +626,24 @@ def driver_toggle_mode():
         return jsonify({'success': False, 'message': 'Failed to update mode'}), 500
 
 
+@app.route('/driver/location', methods=['POST'])
+def driver_update_location():
+    """Update the driver's current location."""
+    if 'user_id' not in session or session.get('user_type') != 'driver':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or request.form
+    coords = helper.validate_coordinates(data.get('latitude'), data.get('longitude'))
+    if not coords:
+        return jsonify({'success': False, 'message': 'Invalid coordinates'}), 400
+    
+    driver_id = session['profile_id']
+    if db_ops.update_driver_location(driver_id, *coords):
+        return jsonify({'success': True, 'latitude': coords[0], 'longitude': coords[1]})
+    else:
+        return jsonify({'success': False, 'message': 'Failed to update location'}), 500
+
+
 # ==================== RIDER ROUTES ====================
 
 @app.route('/rider/dashboard')
@@ -471,9 +654,12 @@ def rider_dashboard():
         return redirect(url_for('rider_login'))
     
     rider_id = session['profile_id']
-    user = db_ops.get_user_by_id(session['user_id'])
+    # Profile, user and recent rides in one query
+    view = db_ops.get_rider_dashboard(rider_id) or {}
     
-    return render_template('rider_dashboard.html', user=user)
+    return render_template('rider_dashboard.html', user=view.get('user') or {},
+                           recent_rides=view.get('recent_rides', []),
+                           awaiting_rating=view.get('awaiting_rating', 0))
 
 
 @app.route('/rider/rides')
@@ -484,9 +670,16 @@ def rider_rides():
         return redirect(url_for('rider_login'))
     
     rider_id = session['profile_id']
-    rides = db_ops.get_rider_rides(rider_id)
+    etag = ride_page_etag('rider', rider_id)
+    if etag is not None and request.if_none_match.contains(etag):
+        return not_modified(etag)
     
-    return render_template('rider_rides.html', rides=rides)
+    after = helper.decode_page_cursor(request.args.get('after', ''))
+    rides, next_after = db_ops.get_rider_rides_page(rider_id, RIDES_PAGE_SIZE, after)
+    
+    return with_etag(render_template('rider_rides.html', rides=rides,
+                                     next_cursor=helper.encode_page_cursor(next_after),
+                                     is_first_page=after is None), etag)
 
 
 @app.route('/rider/rides/<int:ride_id>')
@@ -497,13 +690,17 @@ def rider_ride_detail(ride_id):
         return redirect(url_for('rider_login'))
     
     rider_id = session['profile_id']
+    etag = ride_page_etag('rider', rider_id)
+    if etag is not None and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
     ride = db_ops.get_ride_by_id(ride_id, rider_id)
     
     if not ride:
         flash('Ride not found.', 'error')
         return redirect(url_for('rider_rides'))
     
-    return render_template('ride_detail.html', ride=ride, user_type='rider')
+    return with_etag(render_template('ride_detail.html', ride=ride, user_type='rider'), etag)
 
 
 @app.route('/rider/find-driver', methods=['GET', 'POST'])
@@ -524,37 +721,45 @@ def rider_find_driver():
             flash('Please provide both pickup and dropoff locations.', 'error')
             return render_template('find_driver.html')
         
-        # Find active driver
-        driver = db_ops.get_active_driver()
-        if not driver:
-            flash('No active drivers available at the moment. Please try again later.', 'error')
-            return render_template('find_driver.html')
+        pickup_coords = helper.validate_coordinates(
+            request.form.get('pickup_latitude', '').strip(),
+            request.form.get('pickup_longitude', '').strip()
+        )
+        dropoff_coords = helper.validate_coordinates(
+            request.form.get('dropoff_latitude', '').strip(),
+            request.form.get('dropoff_longitude', '').strip()
+        )
         
-        # Convert fare
+        # With both coordinate pairs the fare comes from the rate card; a typed
+        # fare is only used when the trip cannot be measured
         fare = None
-        if fare_amount:
+        if fare_amount and not (pickup_coords and dropoff_coords):
             try:
                 fare = float(fare_amount)
             except ValueError:
                 pass
         
-        # Create ride
+        # Claim the closest active driver (any active driver if no pickup
+        # coordinates) and create the ride in one transaction
         rider_id = session['profile_id']
-        ride_id = db_ops.create_ride(
-            driver['driver_id'],
+        dispatcher = batch_dispatcher or db_ops
+        dispatched = dispatcher.dispatch_ride(
             rider_id,
             pickup_location,
             dropoff_location,
             pickup_address or None,
             dropoff_address or None,
-            fare
+            fare,
+            *(pickup_coords or (None, None)),
+            *(dropoff_coords or (None, None))
         )
         
-        if ride_id:
+        if dispatched:
+            ride_id, _ = dispatched
             flash('Ride created successfully!', 'success')
             return redirect(url_for('rider_ride_detail', ride_id=ride_id))
         else:
-            flash('Failed to create ride.', 'error')
+            flash('No active drivers available at the moment. Please try again later.', 'error')
             return render_template('find_driver.html')
     
     return render_template('find_driver.html')
@@ -596,11 +801,119 @@ def rider_rate():
             flash('Failed to submit rating.', 'error')
             return redirect(url_for('rider_rate'))
     
-    # GET request - show form
-    most_recent_ride = db_ops.get_rider_most_recent_ride(rider_id)
-    all_rides = db_ops.get_rider_rides(rider_id)
+    # GET request - show form: the most recent ride plus rides awaiting a rating
+    view = db_ops.get_rider_rating_view(rider_id)
     
-    return render_template('rate_driver.html', most_recent_ride=most_recent_ride, all_rides=all_rides)
+    return render_template('rate_driver.html', most_recent_ride=view['most_recent_ride'],
+                           all_rides=view['rides'], unrated_rides=view['unrated_rides'])
+
+
+@app.route('/rider/rate/bulk', methods=['POST'])
+def rider_rate_bulk():
+    """Rate several rides at once (rating_<ride_id> form fields; blank ones are skipped)."""
+    if 'user_id' not in session or session.get('user_type') != 'rider':
+        flash('Please log in as a rider to access this page.', 'error')
+        return redirect(url_for('rider_login'))
+    
+    ratings = []
+    for field, value in request.form.items():
+        if not field.startswith('rating_') or not value.strip():
+            continue
+        try:
+            ride_id = int(field[len('rating_'):])
+        except ValueError:
+            continue
+        rating_int = helper.validate_rating(value.strip())
+        if not rating_int:
+            flash('Invalid rating. Please enter a number between 1 and 5.', 'error')
+            return redirect(url_for('rider_rate'))
+        comment = request.form.get(f'comment_{ride_id}', '').strip()
+        ratings.append((ride_id, rating_int, comment or None))
+    
+    if not ratings:
+        flash('Please rate at least one ride.', 'error')
+        return redirect(url_for('rider_rate'))
+    
+    rated = db_ops.update_ride_ratings(session['profile_id'], ratings)
+    if rated:
+        flash(f'Rated {len(rated)} ride{"" if len(rated) == 1 else "s"} successfully!', 'success')
+        return redirect(url_for('rider_rides'))
+    else:
+        flash('Failed to submit ratings.', 'error')
+        return redirect(url_for('rider_rate'))
+
+
+# ==================== METRICS AND DEBUGGING ====================
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-method and per-route metrics plus pool/cache gauges (Prometheus text format)."""
+    return Response(render_metrics(metrics, db_ops, {'fragment': fragment_cache.stats()}),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def is_admin_request() -> bool:
+    """True if the request carries the configured admin token (X-Admin-Token header)."""
+    token = app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@app.route('/debug/slow-queries')
+def debug_slow_queries():
+    """Captured slow statements, slowest first (admin only)."""
+    if not app.config.get('ADMIN_TOKEN'):
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+    if not is_admin_request():
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({'success': True, 'stats': slow_queries.stats(),
+                    'queries': slow_queries.entries(limit)})
+
+
+# ==================== LIVE UPDATES ====================
+
+@app.route('/events')
+def ride_events():
+    """Stream the logged-in rider's or driver's ride events (Server-Sent Events)."""
+    user_type = session.get('user_type')
+    if 'user_id' not in session or user_type not in ('rider', 'driver'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    if db_ops is None:
+        return jsonify({'success': False, 'message': 'Database unavailable'}), 503
+    
+    topic = (rider_topic if user_type == 'rider' else driver_topic)(session['profile_id'])
+    subscription = db_ops.events.subscribe(topic)
+    
+    def stream():
+        # Runs after the request's database connection has gone back to the pool
+        with subscription:
+            yield "retry: 2000\n\n"
+            while not subscription.closed:
+                events = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield format_sse(event)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.cli.command('rebuild-rating-stats')
+def rebuild_rating_stats_command():
+    """Recompute every driver's rating aggregate from the RIDE table."""
+    if init_db() is None:
+        print("Database connection failed.")
+        return
+    try:
+        rebuilt = db_ops.rebuild_driver_rating_stats()
+    finally:
+        db_ops.release()
+    if rebuilt is None:
+        print("Failed to rebuild driver rating stats.")
+    else:
+        print(f"Rebuilt rating stats for {rebuilt} drivers.")
 
 
 if __name__ == '__main__':